@@ -0,0 +1,217 @@
+"""
+    Benchmarks of turi's phases on synthetic programs
+
+    Usage:
+        python benchmarks/run.py                       # tiny program
+        python benchmarks/run.py --sizes small medium large --json results.json
+        python benchmarks/run.py --depth 5 --fanout 4 --methods 6 --call-density 0.3
+
+    For each program size, every phase is run once and its wall time and
+    peak memory (tracemalloc, allocations made during the phase) are reported.
+    No Soot or JVM is needed.
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import SyntheticProgram
+from turi.project import Project
+from turi.ir_store import allow_module
+from turi.budget import Budget
+from turi.cfg.paths import PathQuery
+
+# the synthetic IR types are stored in the IR store benchmarks
+allow_module(SyntheticProgram.__module__)
+
+
+SIZES = {
+    'tiny': dict(depth=2, fanout=2, methods_per_class=2, blocks_per_method=3),
+    'small': dict(depth=3, fanout=3, methods_per_class=4, blocks_per_method=4),
+    'medium': dict(depth=4, fanout=4, methods_per_class=6, blocks_per_method=6),
+    'large': dict(depth=5, fanout=4, methods_per_class=8, blocks_per_method=8),
+}
+
+
+class Phase:
+    def __init__(self, results, name):
+        self.results = results
+        self.name = name
+
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self._mem = tracemalloc.get_traced_memory()[0]
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self._wall
+        peak = tracemalloc.get_traced_memory()[1] - self._mem
+        self.results.append({'phase': self.name, 'time': wall, 'peak_memory': peak})
+
+
+def slice_input(program):
+    # the parameter of a method of the root class, for slicing in both directions
+    return {'type': 'method_var', 'class_name': program.class_names[0], 'method_name': 'm0',
+            'method_params': ('int',), 'var_name': 'p0'}
+
+
+def sink_input(program):
+    # the parameter of a method of the last (deepest) class, the end of chops
+    return {'type': 'method_var', 'class_name': program.class_names[-1], 'method_name': 'm1',
+            'method_params': ('int',), 'var_name': 'p0'}
+
+
+def taint_signatures(program):
+    # results of m0 flowing into the arguments of m1, in every class
+    return [(name, 'm0') for name in program.class_names], [(name, 'm1') for name in program.class_names]
+
+
+def run_analyses(p, program, results, slices=True):
+    callgraph = p.callgraph()
+    root = p.methods[(program.class_names[0], 'm0', ('int',))]
+    last = p.methods[(program.class_names[-1], 'm1', ('int',))]
+
+    with Phase(results, 'paths'):
+        query = PathQuery(callgraph.graph, root, last)
+        query.count_paths()
+        for _ in query.paths(max_paths=1000, timeout=5):
+            pass
+
+    with Phase(results, 'reachability'):
+        index = callgraph.reachability()
+        for method in callgraph.graph:
+            index.can_reach(method, last)
+
+    with Phase(results, 'pointsto'):
+        p.pointsto(instantiate=True)
+
+    sources, sinks = taint_signatures(program)
+    with Phase(results, 'taint'):
+        p.taint(sources, sinks).run()
+
+    with Phase(results, 'ifds_taint'):
+        p.ifds_taint(sources, sinks).run()
+
+    if slices:
+        with Phase(results, 'chop'):
+            p.chopper().chop(slice_input(program), sink_input(program))
+
+        # anytime slicing: short budgets, each run checkpointed (pickled) and resumed
+        with Phase(results, 'budget.backward_slice'):
+            slicer = p.backwardslicer()
+            slicer.slice(slice_input(program), budget=Budget(seconds=0.05))
+            while slicer.incomplete in ('time', 'memory'):
+                slicer.resume(pickle.loads(pickle.dumps(slicer.checkpoint())), budget=Budget(seconds=0.05))
+
+
+def run(program, slices=True, store=True, analyses=True, slice_max_iter=None):
+    results = []
+
+    with Phase(results, 'project'):
+        p = Project('synthetic', lifter=program.lifter())
+
+    with Phase(results, 'hierarchy'):
+        p.hierarchy()
+
+    with Phase(results, 'cfgfull'):
+        p.cfgfull()
+
+    with Phase(results, 'callgraph'):
+        p.callgraph()
+
+    with Phase(results, 'callgraph.sccs'):
+        p.callgraph().sccs()
+
+    with Phase(results, 'cfgmethods.control_dependence'):
+        for method in p.methods.values():
+            p.cfgmethod(method).control_dependence_graph()
+
+    with Phase(results, 'index'):
+        p.index()
+
+    if slices:
+        for name, slicer in (('forward_slice', p.forwardslicer()), ('backward_slice', p.backwardslicer())):
+            if slice_max_iter is not None:
+                slicer.MAX_ITER = slice_max_iter
+            with Phase(results, name):
+                slicer.slice(slice_input(program))
+
+    if analyses:
+        run_analyses(p, program, results, slices=slices)
+
+    if store:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ir.store')
+            with Phase(results, 'ir_store.write'):
+                Project('synthetic', lifter=program.lifter(), ir_store=path)
+
+            with Phase(results, 'ir_store.load'):
+                stored = Project('synthetic', ir_store=path)
+                for _ in stored.classes.values():
+                    pass
+            stored.classes.store.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark turi on synthetic programs')
+    parser.add_argument('--sizes', nargs='+', choices=sorted(SIZES), default=['tiny'])
+    parser.add_argument('--depth', type=int, help='custom program: depth of the class tree')
+    parser.add_argument('--fanout', type=int, default=3)
+    parser.add_argument('--methods', type=int, default=4)
+    parser.add_argument('--blocks', type=int, default=4)
+    parser.add_argument('--stmts', type=int, default=4)
+    parser.add_argument('--call-density', type=float, default=0.2)
+    parser.add_argument('--interfaces', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-slices', action='store_true')
+    parser.add_argument('--slice-max-iter', type=int, help='max block visits of each slice')
+    parser.add_argument('--no-store', action='store_true')
+    parser.add_argument('--no-analyses', action='store_true',
+                        help='skip paths, reachability, points-to, taint, chop and budget phases')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    if args.depth is not None:
+        configs = [('custom', dict(depth=args.depth, fanout=args.fanout, methods_per_class=args.methods,
+                                   blocks_per_method=args.blocks, stmts_per_block=args.stmts,
+                                   call_density=args.call_density, interfaces=args.interfaces))]
+    else:
+        configs = [(name, dict(SIZES[name], call_density=args.call_density, interfaces=args.interfaces))
+                   for name in args.sizes]
+
+    # warm up: turi and networkx load modules lazily, keep that out of the measures
+    run(SyntheticProgram(**SIZES['tiny']), slices=False, store=False, analyses=False)
+
+    tracemalloc.start()
+    report = []
+    for name, config in configs:
+        program = SyntheticProgram(seed=args.seed, **config)
+        stats = program.stats()
+        print('== {} {}'.format(name, ' '.join('{}={}'.format(k, v) for k, v in sorted(stats.items()))))
+
+        results = run(program, slices=not args.no_slices, store=not args.no_store,
+                      analyses=not args.no_analyses, slice_max_iter=args.slice_max_iter)
+        for r in results:
+            print('   {:32} {:10.4f}s {:12.1f}KB'.format(r['phase'], r['time'], r['peak_memory'] / 1024.0))
+
+        report.append({'size': name, 'config': config, 'program': stats, 'phases': results})
+    tracemalloc.stop()
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(report, fp, indent=2)
+
+
+if __name__ == '__main__':
+    main()
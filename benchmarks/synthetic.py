@@ -0,0 +1,234 @@
+"""
+    Synthetic programs shaped like pysoot's IR
+
+    turi recognizes IR objects by the name of their types, so the classes below
+    mirror the names (and attributes) of the pysoot classes turi looks at.
+    Programs are deterministic for a given seed.
+"""
+
+import random
+
+
+class _IRObject:
+    __slots__ = ()
+
+    def __init__(self, *args):
+        for name, value in zip(self.__slots__, args):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__,
+                               ', '.join(repr(getattr(self, name, None)) for name in self.__slots__))
+
+
+def _ir_type(name, fields):
+    return type(name, (_IRObject,), {'__slots__': tuple(fields.split())})
+
+
+SootClass = _ir_type('SootClass', 'name super_class interfaces attrs methods fields')
+SootMethod = _ir_type('SootMethod', 'class_name name ret params attrs blocks block_by_label exceptional_preds')
+SootBlock = _ir_type('SootBlock', 'label statements')
+
+SootIdentityStmt = _ir_type('SootIdentityStmt', 'left_op right_op')
+SootAssignStmt = _ir_type('SootAssignStmt', 'left_op right_op')
+SootInvokeStmt = _ir_type('SootInvokeStmt', 'invoke_expr')
+SootIfStmt = _ir_type('SootIfStmt', 'condition target')
+SootGotoStmt = _ir_type('SootGotoStmt', 'target')
+SootReturnStmt = _ir_type('SootReturnStmt', 'value')
+SootReturnVoidStmt = _ir_type('SootReturnVoidStmt', '')
+
+SootLocal = _ir_type('SootLocal', 'type name')
+SootParamRef = _ir_type('SootParamRef', 'type index')
+SootThisRef = _ir_type('SootThisRef', 'type')
+SootInstanceFieldRef = _ir_type('SootInstanceFieldRef', 'type base field')
+SootStaticFieldRef = _ir_type('SootStaticFieldRef', 'type field')
+SootIntConstant = _ir_type('SootIntConstant', 'type value')
+SootNewExpr = _ir_type('SootNewExpr', 'type base_type')
+SootBinopExpr = _ir_type('SootBinopExpr', 'type op value1 value2')
+SootConditionExpr = _ir_type('SootConditionExpr', 'type op value1 value2')
+SootVirtualInvokeExpr = _ir_type('SootVirtualInvokeExpr', 'type class_name method_name method_params args base')
+SootInterfaceInvokeExpr = _ir_type('SootInterfaceInvokeExpr', 'type class_name method_name method_params args base')
+SootSpecialInvokeExpr = _ir_type('SootSpecialInvokeExpr', 'type class_name method_name method_params args base')
+SootStaticInvokeExpr = _ir_type('SootStaticInvokeExpr', 'type class_name method_name method_params args')
+
+
+class SyntheticLifter:
+    """
+        Stands in for pysoot's Lifter: Project(app_path, lifter=SyntheticLifter(...))
+    """
+
+    def __init__(self, classes):
+        self.classes = classes
+
+
+class _MethodBuilder:
+    def __init__(self, gen, cls_name, name):
+        self.gen = gen
+        self.cls_name = cls_name
+        self.name = name
+        self.blocks = []
+        self.locals = 0
+
+    def new_local(self, t='int'):
+        self.locals += 1
+        return SootLocal(t, '$r{}'.format(self.locals))
+
+    def build(self):
+        g = self.gen
+        rnd = g.random
+        n_blocks = g.blocks_per_method
+        this = SootLocal(self.cls_name, 'this')
+        param = SootLocal('int', 'p0')
+        live = [param]
+
+        for b in range(n_blocks):
+            stmts = []
+            if b == 0:
+                stmts.append(SootIdentityStmt(this, SootThisRef(self.cls_name)))
+                stmts.append(SootIdentityStmt(param, SootParamRef('int', 0)))
+
+            for _ in range(g.stmts_per_block):
+                if rnd.random() < g.call_density:
+                    stmts.extend(self._call(live))
+                else:
+                    dst = self.new_local()
+                    expr = SootBinopExpr('int', '+', rnd.choice(live), SootIntConstant('int', rnd.randint(0, 9)))
+                    stmts.append(SootAssignStmt(dst, expr))
+                    live.append(dst)
+
+            if b == n_blocks - 1:
+                stmts.append(SootReturnStmt(rnd.choice(live)))
+            elif b + 2 < n_blocks and rnd.random() < g.branch_density:
+                # forward branch, skipping the next block
+                cond = SootConditionExpr('boolean', '==', rnd.choice(live), SootIntConstant('int', 0))
+                stmts.append(SootIfStmt(cond, b + 2))
+            elif b > 0 and rnd.random() < g.loop_density:
+                # back edge to the previous block, with a fall-through edge to the next one
+                cond = SootConditionExpr('boolean', '<', rnd.choice(live), SootIntConstant('int', 10))
+                stmts.append(SootIfStmt(cond, b - 1))
+
+            self.blocks.append(SootBlock(b, stmts))
+
+        return SootMethod(self.cls_name, self.name, 'int', ('int',), ['PUBLIC'], self.blocks,
+                          dict((block.label, block) for block in self.blocks),
+                          dict((block, []) for block in self.blocks))
+
+    def _call(self, live):
+        g = self.gen
+        rnd = g.random
+        arg = rnd.choice(live)
+        dst = self.new_local()
+        live.append(dst)
+        method_name = 'm{}'.format(rnd.randrange(g.methods_per_class))
+        kind = rnd.random()
+
+        if kind < 0.15 and g.statics_per_class:
+            target = rnd.choice(g.class_names)
+            expr = SootStaticInvokeExpr('int', target, 's{}'.format(rnd.randrange(g.statics_per_class)),
+                                        ('int',), [arg])
+            return [SootAssignStmt(dst, expr)]
+
+        if kind < 0.3 and g.interfaces:
+            target = rnd.choice(g.interfaces)
+            base = self.new_local(target)
+            expr = SootInterfaceInvokeExpr('int', target, method_name, ('int',), [arg], base)
+            impl = rnd.choice(g.implementers[target])
+        else:
+            target = rnd.choice(g.class_names)
+            base = self.new_local(target)
+            expr = SootVirtualInvokeExpr('int', target, method_name, ('int',), [arg], base)
+            impl = target
+
+        return [SootAssignStmt(base, SootNewExpr(impl, impl)),
+                SootInvokeStmt(SootSpecialInvokeExpr('void', impl, '<init>', (), [], base)),
+                SootAssignStmt(dst, expr)]
+
+
+class SyntheticProgram:
+    """
+        A class tree of the given depth and fan-out (each class overrides the
+        methods of its super class), plus interfaces implemented by some classes.
+
+        :param depth: depth of the class tree
+        :param fanout: direct sub classes per class
+        :param methods_per_class: virtual methods m0..mN (int -> int) declared by each class
+        :param statics_per_class: static methods s0..sN declared by each class
+        :param blocks_per_method: basic blocks per method
+        :param stmts_per_block: statements per block (besides identities, branches and returns)
+        :param call_density: probability of a statement being a call
+        :param interfaces: number of interfaces
+        :param seed: random seed
+    """
+
+    def __init__(self, depth=3, fanout=3, methods_per_class=4, statics_per_class=1,
+                 blocks_per_method=4, stmts_per_block=4, call_density=0.2, interfaces=2,
+                 branch_density=0.3, loop_density=0.1, seed=0):
+        self.depth = depth
+        self.fanout = fanout
+        self.methods_per_class = max(1, methods_per_class)
+        self.statics_per_class = statics_per_class
+        self.blocks_per_method = max(1, blocks_per_method)
+        self.stmts_per_block = max(1, stmts_per_block)
+        self.call_density = call_density
+        self.branch_density = branch_density
+        self.loop_density = loop_density
+        self.random = random.Random(seed)
+
+        self.class_names = []
+        self.super_classes = {}
+        self._tree('bench.C0', None, 0)
+
+        self.interfaces = ['bench.api.I{}'.format(i) for i in range(interfaces)]
+        self.implementers = dict((i, []) for i in self.interfaces)
+        self.class_interfaces = dict((name, []) for name in self.class_names)
+        for i in self.interfaces:
+            for name in self.random.sample(self.class_names, max(1, len(self.class_names) // 4)):
+                self.class_interfaces[name].append(i)
+                self.implementers[i].append(name)
+
+        self.classes = {}
+        self._build()
+
+    def _tree(self, name, super_class, level):
+        self.class_names.append(name)
+        self.super_classes[name] = super_class or 'java.lang.Object'
+        if level + 1 < self.depth:
+            for i in range(self.fanout):
+                self._tree('{}_{}'.format(name, i), name, level + 1)
+
+    def _interface(self, name):
+        methods = []
+        for j in range(self.methods_per_class):
+            methods.append(SootMethod(name, 'm{}'.format(j), 'int', ('int',), ['PUBLIC', 'ABSTRACT'], [], {}, {}))
+        return SootClass(name, 'java.lang.Object', [], ['PUBLIC', 'INTERFACE', 'ABSTRACT'], methods, {})
+
+    def _build(self):
+        for name in self.interfaces:
+            self.classes[name] = self._interface(name)
+
+        for name in self.class_names:
+            methods = [SootMethod(name, '<init>', 'void', (), ['PUBLIC'],
+                                  [SootBlock(0, [])], {}, {})]
+            methods[0].blocks[0].statements.append(SootReturnStmt(None))
+            methods[0].block_by_label = {0: methods[0].blocks[0]}
+            methods[0].exceptional_preds = {methods[0].blocks[0]: []}
+
+            for j in range(self.methods_per_class):
+                methods.append(_MethodBuilder(self, name, 'm{}'.format(j)).build())
+
+            for j in range(self.statics_per_class):
+                m = _MethodBuilder(self, name, 's{}'.format(j)).build()
+                m.attrs = ['PUBLIC', 'STATIC']
+                methods.append(m)
+
+            self.classes[name] = SootClass(name, self.super_classes[name], self.class_interfaces[name],
+                                           ['PUBLIC'], methods, {})
+
+    def lifter(self):
+        return SyntheticLifter(self.classes)
+
+    def stats(self):
+        methods = sum(len(cls.methods) for cls in self.classes.values())
+        blocks = sum(len(m.blocks) for cls in self.classes.values() for m in cls.methods)
+        stmts = sum(len(b.statements) for cls in self.classes.values() for m in cls.methods for b in m.blocks)
+        return {'classes': len(self.classes), 'methods': methods, 'blocks': blocks, 'statements': stmts}
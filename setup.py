@@ -9,5 +9,6 @@ setup(
     description='Turi',
     packages=packages,
     include_package_data=True,
+    package_data={'turi': ['data/*.json']},
     install_requires=['networkx', 'nose']
 )
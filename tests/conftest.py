@@ -0,0 +1,7 @@
+import os
+import sys
+
+# tests build their programs with the synthetic IR of the benchmarks (no Soot or JVM needed)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
@@ -0,0 +1,64 @@
+"""
+    Small hand-written programs, built with the synthetic IR of the benchmarks
+"""
+
+from synthetic import *
+
+from turi.project import Project
+
+
+def local(name, t='int'):
+    return SootLocal(t, name)
+
+
+def const(value):
+    return SootIntConstant('int', value)
+
+
+def method(class_name, name, blocks, params=(), static=False, ret='int', attrs=None):
+    """
+        blocks are lists of statements, jump targets are block indexes
+    """
+    blocks = [SootBlock(i, list(stmts)) for i, stmts in enumerate(blocks)]
+    if attrs is None:
+        attrs = ['PUBLIC', 'STATIC'] if static else ['PUBLIC']
+    attrs = list(attrs)
+    return SootMethod(class_name, name, ret, tuple(params), attrs, blocks,
+                      dict((block.label, block) for block in blocks),
+                      dict((block, []) for block in blocks))
+
+
+def klass(name, methods, super_class='java.lang.Object', interfaces=(), attrs=('PUBLIC',), fields=None):
+    return SootClass(name, super_class, list(interfaces), list(attrs), methods, dict(fields or {}))
+
+
+def project(*classes):
+    return Project('test', lifter=SyntheticLifter(dict((cls.name, cls) for cls in classes)))
+
+
+def static_call(class_name, name, args=(), ret='int'):
+    return SootStaticInvokeExpr(ret, class_name, name, tuple('int' for _ in args), list(args))
+
+
+def virtual_call(base, class_name, name, args=(), ret='int'):
+    return SootVirtualInvokeExpr(ret, class_name, name, tuple('int' for _ in args), list(args), base)
+
+
+def assign(name, value):
+    return SootAssignStmt(local(name), value)
+
+
+def call(expr):
+    return SootInvokeStmt(expr)
+
+
+def param(name, index=0):
+    return SootIdentityStmt(local(name), SootParamRef('int', index))
+
+
+def this(class_name):
+    return SootIdentityStmt(local('this', class_name), SootThisRef(class_name))
+
+
+def ret(name=None):
+    return SootReturnStmt(local(name)) if name is not None else SootReturnVoidStmt()
@@ -0,0 +1,99 @@
+import pickle
+
+import pytest
+
+from synthetic import SyntheticProgram
+
+from turi.project import Project
+from turi.budget import Budget
+from turi.forward_slicer import ForwardSlicer
+from turi.backward_slicer import BackwardSlicer
+
+SLICERS = {'forward': ForwardSlicer, 'backward': BackwardSlicer}
+
+
+class Steps(Budget):
+    """
+        Budget exceeded after a number of checks, to stop at predictable places
+    """
+
+    def __init__(self, steps):
+        Budget.__init__(self)
+        self.steps = steps
+
+    def exceeded(self):
+        self.steps -= 1
+        return 'time' if self.steps < 0 else None
+
+
+def _project():
+    program = SyntheticProgram(depth=2, fanout=2, methods_per_class=3, blocks_per_method=3, stmts_per_block=3, seed=5)
+    return Project('synthetic', lifter=program.lifter()), program
+
+
+def _input(class_name):
+    return {'type': 'method_var', 'class_name': class_name, 'method_name': 'm1',
+            'method_params': ('int',), 'var_name': 'p0'}
+
+
+@pytest.mark.parametrize('kind', ['forward', 'backward'])
+def test_max_iter_incomplete(kind):
+    p, program = _project()
+    make = lambda **kwargs: SLICERS[kind](p, **kwargs)
+    inp = _input(program.class_names[0])
+
+    full = make()
+    full.slice(inp)
+    assert full.incomplete is None
+
+    cut = make(max_iter=1)
+    cut.slice(inp)
+    assert cut.incomplete == 'iterations'
+    assert cut.affected_blocks < full.affected_blocks
+
+    # kept through a checkpoint, and resuming does not clear it
+    resumed = make(max_iter=1)
+    resumed.resume(cut.checkpoint())
+    assert resumed.incomplete == 'iterations'
+
+
+def _blocks(p, blocks):
+    return set((p.blocks_to_methods[b].class_name, p.blocks_to_methods[b].name, b.label) for b in blocks)
+
+
+def _tainted(p, tainted):
+    res = {}
+    for key, methods in tainted.items():
+        block = key[0] if isinstance(key, tuple) else key
+        res.setdefault(_blocks(p, [block]).pop(), set()).update(
+            (m.class_name, m.name, frozenset(v)) for m, v in methods.items())
+    return res
+
+
+@pytest.mark.parametrize('kind,context_k', [('forward', None), ('forward', 1), ('backward', None), ('backward', 1)])
+def test_checkpoint_pickle_resume(kind, context_k):
+    p, program = _project()
+    kwargs = {'context_k': context_k} if context_k else {}
+    inp = _input(program.class_names[0])
+
+    full = SLICERS[kind](p, **kwargs)
+    full.slice(inp)
+
+    slicer = SLICERS[kind](p, **kwargs)
+    slicer.slice(inp, budget=Steps(3))
+    assert slicer.incomplete == 'time'
+
+    rounds = 0
+    while slicer.incomplete:
+        # resumed in a fresh project, as another process would
+        state = pickle.loads(pickle.dumps(slicer.checkpoint()))
+        q, _ = _project()
+        slicer = SLICERS[kind](q, **kwargs)
+        slicer.resume(state, budget=Steps(3))
+        rounds += 1
+
+    assert rounds > 1
+    assert _blocks(q, slicer.affected_blocks) == _blocks(p, full.affected_blocks)
+    assert _tainted(q, slicer._tainted) == _tainted(p, full._tainted)
+    # the whole state, worklist and shared tainted sets included
+    assert slicer.checkpoint() == full.checkpoint()
@@ -0,0 +1,46 @@
+import pytest
+
+from synthetic import SyntheticProgram
+
+from turi.project import Project
+from turi.statements import is_invoke, get_invoke_expr
+from turi.utils import get_method_key
+from turi.callgraph_archive import CallGraphArchiveError
+
+
+def _project():
+    program = SyntheticProgram(depth=3, fanout=2, methods_per_class=3, blocks_per_method=3, call_density=0.3, seed=2)
+    return Project('synthetic', lifter=program.lifter())
+
+
+def _call_sites(cg, method, target):
+    exprs = cg.get_call_sites(method, target)
+    return sorted((i, j) for i, block in enumerate(method.blocks) for j, stmt in enumerate(block.statements)
+                  if is_invoke(stmt) and any(get_invoke_expr(stmt) is e for e in exprs))
+
+
+@pytest.mark.parametrize('call_sites', [False, True])
+def test_roundtrip(tmp_path, call_sites):
+    cg = _project().callgraph()
+    assert cg.graph.number_of_edges()
+    path = str(tmp_path / 'callgraph.bin')
+    cg.export(path, call_sites=call_sites)
+
+    with cg.load(path) as archive:
+        assert len(archive) == len(cg.graph)
+        assert set(archive.to_networkx().edges) == set((get_method_key(a), get_method_key(b)) for a, b in cg.graph.edges)
+
+        for method in cg.graph:
+            key = get_method_key(method)
+            assert key in archive
+            assert sorted(archive.next(key)) == sorted(get_method_key(m) for m in cg.next(method))
+            assert sorted(archive.prev(key)) == sorted(get_method_key(m) for m in cg.prev(method))
+
+            for target in cg.next(method):
+                if call_sites:
+                    assert archive.get_call_sites(key, get_method_key(target)) == _call_sites(cg, method, target)
+                else:
+                    with pytest.raises(CallGraphArchiveError):
+                        archive.get_call_sites(key, get_method_key(target))
+
+        assert ('bench.Missing', 'm0', ('int',)) not in archive
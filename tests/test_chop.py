@@ -0,0 +1,74 @@
+import pytest
+
+from synthetic import SyntheticProgram
+
+from turi.project import Project
+
+
+def _input(class_name, method_name):
+    return {'type': 'method_var', 'class_name': class_name, 'method_name': method_name,
+            'method_params': ('int',), 'var_name': 'p0'}
+
+
+@pytest.fixture(scope='module')
+def program():
+    return SyntheticProgram(depth=2, fanout=2, methods_per_class=2, blocks_per_method=3, stmts_per_block=2,
+                            loop_density=0, seed=3)
+
+
+def test_chop_within_slices_intersection(program):
+    p = Project('synthetic', lifter=program.lifter())
+    names = program.class_names
+    nonempty = 0
+
+    for source_class in names[:2]:
+        for sink_class in names[1:3]:
+            source = _input(source_class, 'm0')
+            sink = _input(sink_class, 'm1')
+
+            forward = p.forwardslicer()
+            forward.slice(source)
+            backward = p.backwardslicer()
+            backward.slice(sink)
+
+            chop = p.chopper().chop(source, sink)
+            assert set(chop.blocks) <= forward.affected_blocks & backward.affected_blocks
+            nonempty += bool(len(chop))
+
+    assert nonempty
+
+
+def test_chop_excludes_unrealizable_paths():
+    from programs import method, klass, project, local, param, assign, ret, static_call
+
+    def id_call(dst, src):
+        return assign(dst, static_call('B', 'id', [local(src)]))
+
+    # c1 and c2 share id, nothing calls c1 and then c2
+    c1 = method('B', 'c1', [[param('p0'), id_call('y', 'p0')], [assign('r', local('y')), ret('r')]],
+                params=('int',), static=True)
+    c2 = method('B', 'c2', [[param('p0'), id_call('z', 'p0')], [assign('r', local('z')), ret('r')]],
+                params=('int',), static=True)
+    id_ = method('B', 'id', [[param('a'), assign('b', local('a'))], [ret('b')]], params=('int',), static=True)
+    p = project(klass('B', [c1, c2, id_]))
+
+    def var(method_name, var_name):
+        return {'type': 'method_var', 'class_name': 'B', 'method_name': method_name,
+                'method_params': ('int',), 'var_name': var_name}
+
+    source = var('c1', 'p0')
+    forward = p.forwardslicer()
+    forward.slice(source)
+
+    # the slices meet only through c1 -> id -> c2
+    backward = p.backwardslicer()
+    backward.slice(var('c2', 'r'))
+    assert c2.blocks[1] in forward.affected_blocks & backward.affected_blocks
+    assert len(p.chopper().chop(source, var('c2', 'r'))) == 0
+
+    # a realizable path c1 -> id -> c1, without the call site in c2
+    backward = p.backwardslicer()
+    backward.slice(var('c1', 'r'))
+    assert c2.blocks[0] in forward.affected_blocks & backward.affected_blocks
+    chop = p.chopper().chop(source, var('c1', 'r'))
+    assert set(chop.blocks) == set([c1.blocks[0], c1.blocks[1], id_.blocks[0]])
@@ -0,0 +1,73 @@
+from programs import *
+
+from turi.context import CallStrings
+
+
+def _id_call(dst, src):
+    return assign(dst, static_call('B', 'id', [local(src)]))
+
+
+def _project():
+    # c1 and c2 both call id: a context insensitive slice of c1 goes back into c2
+    c1 = method('B', 'c1', [[assign('x1', const(1))], [_id_call('y', 'x1')], [ret('y')]])
+    c2 = method('B', 'c2', [[assign('x2', const(2))], [_id_call('z', 'x2')], [ret('z')]])
+    id_ = method('B', 'id', [[param('a')], [ret('a')]], params=('int',), static=True)
+    return project(klass('B', [c1, c2, id_])), c1, c2, id_
+
+
+def _slice(p, context_k):
+    slicer = p.backwardslicer(context_k=context_k)
+    slicer.slice({'type': 'method_var', 'class_name': 'B', 'method_name': 'c1', 'method_params': (), 'var_name': 'y'})
+    return slicer
+
+
+def test_call_strings():
+    cs = CallStrings(2)
+    a = cs.push(0, 'A')
+    b = cs.push(a, 'B')
+    c = cs.push(b, 'C')
+    # only the k most recent call sites are kept
+    assert cs.call_string(c) == ('C', 'B')
+    assert cs.top(c) == 'C'
+    assert cs.call_string(cs.pop(c)) == ('B',)
+    assert cs.pop(a) == 0
+    assert cs.push(a, 'B') == b
+    assert cs.context(('C', 'B')) == c
+
+
+def test_k1_prunes_other_caller():
+    p, c1, c2, id_ = _project()
+
+    insensitive = _slice(p, None)
+    assert c2.blocks[0] in insensitive.affected_blocks
+
+    sensitive = _slice(p, 1)
+    assert c2.blocks[0] not in sensitive.affected_blocks
+    assert c1.blocks[0] in sensitive.affected_blocks
+    assert id_.blocks[0] in sensitive.affected_blocks
+    assert sensitive.affected_blocks < insensitive.affected_blocks
+
+
+def test_forward_k1_returns_to_caller():
+    p, c1, c2, id_ = _project()
+
+    def forward(context_k, method_name='c1', params=(), var='x1'):
+        slicer = p.forwardslicer(context_k=context_k)
+        slicer.slice({'type': 'method_var', 'class_name': 'B', 'method_name': method_name,
+                      'method_params': params, 'var_name': var})
+        return slicer
+
+    # the tainted return value of id goes back to every caller
+    insensitive = forward(None)
+    assert c2.blocks[1] in insensitive.affected_blocks
+
+    # only to the call site id was entered from
+    sensitive = forward(1)
+    assert c1.blocks[1] in sensitive.affected_blocks
+    assert c2.blocks[1] not in sensitive.affected_blocks
+    assert sensitive.affected_blocks < insensitive.affected_blocks
+    assert all(c2 not in methods for methods in sensitive._tainted.values())
+
+    # a slice starting in the callee does not know its caller
+    from_callee = forward(1, 'id', ('int',), 'a')
+    assert set([c1.blocks[1], c2.blocks[1]]) <= from_callee.affected_blocks
@@ -0,0 +1,124 @@
+import networkx
+
+from programs import *
+from synthetic import SyntheticProgram
+
+from turi.cfg import CFGMethod
+
+EXIT = 'exit'
+
+
+def _branch(target):
+    return SootIfStmt(SootConditionExpr('boolean', '==', local('x'), const(0)), target)
+
+
+def _loop_method():
+    # 0 -> 1 | 2, 1 -> 3, 2 -> 3, 3 -> 1 (loop) | 4, 4 returns
+    return method('A', 'f', [[assign('z', const(0)), _branch(2)],
+                             [assign('z', const(1)), SootGotoStmt(3)],
+                             [assign('z', const(2))],
+                             [assign('z', const(3)), _branch(1)],
+                             [ret()]], ret='void')
+
+
+def _reference_post_dominators(graph):
+    # post-dominators are the dominators of the reversed graph, from a virtual exit
+    reverse = graph.reverse(copy=True)
+    reverse.add_node(EXIT)
+    for node in graph:
+        if graph.out_degree(node) == 0:
+            reverse.add_edge(EXIT, node)
+    ipdom = networkx.immediate_dominators(reverse, EXIT)
+    ipdom[EXIT] = EXIT
+    return ipdom
+
+
+def _post_dominators(ipdom, node):
+    res = set()
+    while node != EXIT:
+        res.add(node)
+        node = ipdom[node]
+    return res
+
+
+def _dominators(idom, node):
+    res = {node}
+    while idom[node] is not node:
+        node = idom[node]
+        res.add(node)
+    return res
+
+
+def _reference_control_dependents(graph, ipdom):
+    # Y depends on X if X has a successor post-dominated by Y, and Y does not strictly post-dominate X
+    dependents = dict((node, set()) for node in graph)
+    for x in graph:
+        strict = _post_dominators(ipdom, x) - {x}
+        for succ in graph.successors(x):
+            dependents[x] |= _post_dominators(ipdom, succ) - strict
+    return dependents
+
+
+def _methods():
+    program = SyntheticProgram(depth=2, fanout=2, methods_per_class=3, blocks_per_method=6,
+                               branch_density=0.5, loop_density=0.3, seed=7)
+    return [m for cls in program.classes.values() for m in cls.methods if m.blocks] + [_loop_method()]
+
+
+def _check(cfg):
+    graph = cfg.graph
+    entry = cfg.method.blocks[0]
+
+    idom = networkx.immediate_dominators(graph, entry)
+    # depending on the networkx version, the entry is its own immediate dominator or left out
+    idom[entry] = entry
+    for block in graph:
+        expected = idom.get(block)
+        assert cfg.immediate_dominator(block) == (None if expected is block else expected)
+        for other in graph:
+            assert cfg.dominates(block, other) == (other in idom and block in idom and
+                                                   block in _dominators(idom, other))
+
+    ipdom = _reference_post_dominators(graph)
+    for block in graph:
+        expected = ipdom[block]
+        assert cfg.immediate_post_dominator(block) == (None if expected == EXIT else expected)
+
+    dependents = _reference_control_dependents(graph, ipdom)
+    for block in graph:
+        assert set(cfg.control_dependents(block)) == dependents[block]
+        for dep in dependents[block]:
+            assert block in cfg.controlling_blocks(dep)
+
+
+def _reaches_exit(graph):
+    exits = [node for node in graph if graph.out_degree(node) == 0]
+    return set(graph) == set(exits).union(*[networkx.ancestors(graph, e) for e in exits])
+
+
+def test_dominators_match_networkx():
+    checked = 0
+    for m in _methods():
+        cfg = CFGMethod(m)
+        if not _reaches_exit(cfg.graph):
+            # infinite loops get an extra edge to the exit, not in the reference
+            continue
+        _check(cfg)
+        checked += 1
+    assert checked > 10
+
+
+def test_loop_method():
+    m = _loop_method()
+    cfg = CFGMethod(m)
+    b = m.blocks
+
+    assert [cfg.immediate_dominator(block) for block in b] == [None, b[0], b[0], b[0], b[3]]
+    assert [cfg.immediate_post_dominator(block) for block in b] == [b[3], b[3], b[3], b[4], None]
+    assert cfg.dominates(b[0], b[4]) and not cfg.dominates(b[1], b[3])
+    assert cfg.post_dominates(b[3], b[0]) and not cfg.post_dominates(b[1], b[0])
+
+    # the branch of 0 decides 1 and 2, the loop branch of 3 decides 1 and 3
+    assert set(cfg.control_dependents(b[0])) == {b[1], b[2]}
+    assert set(cfg.control_dependents(b[3])) == {b[1], b[3]}
+    assert set(cfg.controlling_blocks(b[1])) == {b[0], b[3]}
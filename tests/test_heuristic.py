@@ -0,0 +1,157 @@
+import multiprocessing
+
+from programs import *
+
+from turi.heuristic import Heuristic, Target
+from turi.stub import PACKAGE_SCANNER
+
+LIST = 'java.util.List'
+
+
+def _get_class(base):
+    return SootVirtualInvokeExpr('java.lang.Class', 'java.lang.Object', 'getClass', (), [], local(base, 'java.lang.Object'))
+
+
+def _add(base, arg):
+    return SootVirtualInvokeExpr('boolean', LIST, 'add', ('java.lang.Object',), [local(arg)], local(base, LIST))
+
+
+def _load(name, class_name, field):
+    return SootAssignStmt(local(name, LIST), SootInstanceFieldRef(LIST, local('this', class_name), (field, class_name)))
+
+
+def _static(field):
+    return SootStaticFieldRef(LIST, (field, REGISTRY))
+
+
+def _scan(package):
+    return SootStaticInvokeExpr(LIST, PACKAGE_SCANNER, 'getClassesForPackage', ('java.lang.String',),
+                                [SootIntConstant('java.lang.String', '"{}"'.format(package))])
+
+
+REGISTRY = 'com.app.Registry'
+
+
+def _plugins_project(pickled=None):
+    # Holder<i>.use calls getClass on its items list, Holder<i>.fill adds the
+    # static Registry field to that list, and the field is set from the package scanner
+    fields = {}
+    inits = []
+    classes = []
+    for i, field in enumerate(['plugins', 'tools', 'codecs']):
+        fields[field] = (('PRIVATE', 'STATIC'), LIST)
+        inits.append(method(REGISTRY, 'init_' + field,
+                            [[SootAssignStmt(local('l', LIST), _scan('com.app.p{}'.format(i))),
+                              SootAssignStmt(_static(field), local('l', LIST)), ret()]], ret='void', static=True))
+
+        holder = 'com.app.Holder{}'.format(i)
+        use = method(holder, 'use', [[this(holder), _load('o', holder, 'items'),
+                                      assign('c', _get_class('o')), ret()]], ret='void')
+        fill = method(holder, 'fill', [[this(holder), _load('l', holder, 'items'),
+                                        SootAssignStmt(local('x', LIST), _static(field)),
+                                        call(_add('l', 'x')), ret()]], ret='void')
+        classes.append(klass(holder, [use, fill], fields={'items': (('PRIVATE',), LIST)}))
+
+    classes.append(klass(REGISTRY, inits, fields=fields))
+    classes.append(klass(PACKAGE_SCANNER, []))
+    classes.extend(klass('com.app.p{}.{}'.format(i, name), []) for i in range(3) for name in 'XYZ'[:i + 1])
+    return Project('test', lifter=SyntheticLifter(dict((cls.name, cls) for cls in classes)), pickled=pickled)
+
+
+def _results(h):
+    return dict((target.class_name, sorted(cls.name for cls in classes)) for target, classes in h.results.items())
+
+
+def test_get_class_assigned_only():
+    m = method('A', 'm', [[assign('c', _get_class('o')),
+                            call(_get_class('p')),
+                            ret()]], ret='void')
+    h = Heuristic(project(klass('A', [m])))
+    h._find_reflection_targets()
+
+    assert h._targets == {Target('method_var', 'A', 'm', (), 'o')}
+
+
+def test_store_to_list_same_method_getter():
+    # the getter and the add are in the same method
+    m1 = method('C', 'm1', [[this('C'), _load('l', 'C', 'items'), call(_add('l', 'x')), ret()]], ret='void')
+    # assigned result of add
+    m2 = method('C', 'm2', [[this('C'), _load('l', 'C', 'items'), assign('b', _add('l', 'y')), ret()]], ret='void')
+    # a local with the same name, but no getter in this method
+    m3 = method('C', 'm3', [[call(_add('l', 'z')), ret()]], ret='void')
+    # a getter without an add
+    m4 = method('C', 'm4', [[this('C'), _load('l', 'C', 'items'), ret()]], ret='void')
+
+    cls = klass('C', [m1, m2, m3, m4], fields={'items': (('PRIVATE',), LIST)})
+    h = Heuristic(project(cls))
+
+    assert h._find_store_to_list(('C', 'items', LIST)) == {Target('method_var', 'C', 'm1', (), 'x'),
+                                                           Target('method_var', 'C', 'm2', (), 'y')}
+    assert h._find_store_to_list(('C', 'other', LIST)) == set()
+
+
+def _cycle_heuristic():
+    # t1 and t2 load collections whose stores come from each other
+    p = project(klass('C', [], fields={'a': (('PRIVATE',), LIST), 'b': (('PRIVATE',), LIST)}), klass('D', []))
+    h = Heuristic(p)
+    t1 = Target('method_var', 'C', 'm1', (), 'x')
+    t2 = Target('method_var', 'C', 'm2', (), 'y')
+    h._resolvents = {t1: {('C', 'a', LIST)}, t2: {('C', 'b', LIST), 'D'}}
+    h._field_stores = {('C', 'a', LIST): set(), ('C', 'b', LIST): set()}
+    stores = {('C', 'a', LIST): {t2}, ('C', 'b', LIST): {t1}}
+    h._find_store_to_list = lambda resolvent: stores[resolvent]
+    return h, p, t1, t2
+
+
+def test_resolve_target_cycle():
+    h, p, t1, t2 = _cycle_heuristic()
+    D = p.classes['D']
+
+    res, contrib, low = h._resolve_target(t1)
+    assert (res, contrib, low) == (set(), {D}, 0)
+    # t2 reached t1 while t1 was in progress: its result is partial, not memoized
+    assert t1 in h._memo and t2 not in h._memo
+    assert h._in_progress == {}
+
+    res, contrib, low = h._resolve_target(t2)
+    assert res == {D} and contrib == {D}
+    assert t2 in h._memo
+
+
+def test_resolve_resets_caches():
+    h, p, t1, t2 = _cycle_heuristic()
+    h._memo[t1] = (set(), set())
+    h.resolve_reflection_targets()
+    assert t1 not in h._resolvents and not h._field_stores and t1 not in h._memo
+
+
+def test_resolve_reflection_targets():
+    h = Heuristic(_plugins_project())
+    h.resolve_reflection_targets()
+    assert _results(h) == {'com.app.Holder0': ['com.app.p0.X'],
+                           'com.app.Holder1': ['com.app.p1.X', 'com.app.p1.Y'],
+                           'com.app.Holder2': ['com.app.p2.X', 'com.app.p2.Y', 'com.app.p2.Z']}
+
+
+def test_resolve_parallel_fork():
+    sequential = Heuristic(_plugins_project())
+    sequential.resolve_reflection_targets()
+
+    parallel = Heuristic(_plugins_project())
+    parallel.resolve_reflection_targets(processes=2)
+    assert _results(parallel) == _results(sequential)
+    # results refer to the classes of the parent project
+    for classes in parallel.results.values():
+        assert all(parallel._classes[cls.name] is cls for cls in classes)
+
+
+def test_resolve_parallel_spawn_from_cache(tmp_path, monkeypatch):
+    pickled = str(tmp_path / 'project.pickle')
+    sequential = Heuristic(_plugins_project(pickled))
+    sequential.resolve_reflection_targets()
+
+    # without fork, workers reload the project from the pickled cache
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    parallel = Heuristic(Project('test', pickled=pickled))
+    parallel.resolve_reflection_targets(processes=2)
+    assert _results(parallel) == _results(sequential)
@@ -0,0 +1,155 @@
+import pickle
+import pytest
+
+from programs import *
+from synthetic import SyntheticProgram, _IRObject
+
+from turi import ir_store
+from turi.ir_store import IRStore, IRStoreError, write_ir_store, allow_module, is_body_loaded
+
+allow_module(SyntheticProgram.__module__)
+
+
+def _same(a, b, seen):
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, _IRObject):
+        if (id(a), id(b)) in seen:
+            return True
+        seen.add((id(a), id(b)))
+        return all(_same(getattr(a, name, None), getattr(b, name, None), seen) for name in type(a).__slots__)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(_same(x, y, seen) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        # keys can be IR objects (exceptional_preds), compare in order
+        return len(a) == len(b) and all(_same(ka, kb, seen) and _same(va, vb, seen)
+                                        for (ka, va), (kb, vb) in zip(a.items(), b.items()))
+    return a == b
+
+
+def _program():
+    return SyntheticProgram(depth=2, fanout=2, methods_per_class=2, blocks_per_method=3, seed=3)
+
+
+def test_roundtrip(tmp_path):
+    program = _program()
+    path = str(tmp_path / 'ir.store')
+    write_ir_store(program.classes, path)
+
+    store = IRStore(path)
+    try:
+        assert sorted(store.class_names()) == sorted(program.classes)
+        for name, cls in program.classes.items():
+            loaded = store.load_class(name)
+            assert loaded is not cls
+            for method in loaded.methods:
+                assert not is_body_loaded(method)
+                len(method.blocks)
+                assert is_body_loaded(method)
+            assert _same(cls, loaded, set())
+            for method in loaded.methods:
+                # shared objects stay shared
+                for block in method.blocks:
+                    assert method.block_by_label[block.label] is block
+    finally:
+        store.close()
+
+
+def test_project_from_store(tmp_path):
+    program = _program()
+    path = str(tmp_path / 'ir.store')
+    p = Project('test', lifter=program.lifter(), ir_store=path)
+    stored = Project('test', ir_store=path)
+    try:
+        name = program.class_names[1]
+        assert not stored.classes.is_loaded(name)
+        assert (name, 'm0', ('int',)) in stored.methods
+        assert stored.classes.is_loaded(name)
+
+        edges = lambda project: sorted((a.class_name, a.name, b.class_name, b.name)
+                                       for a, b in project.callgraph().graph.edges)
+        assert edges(stored) == edges(p)
+    finally:
+        stored.classes.store.close()
+
+
+def test_lazy_bodies(tmp_path):
+    program = _program()
+    path = str(tmp_path / 'ir.store')
+    write_ir_store(program.classes, path)
+
+    store = IRStore(path)
+    try:
+        decoded = []
+        cls = store.load_class(program.class_names[1], on_body=decoded.append)
+        method, other = cls.methods[:2]
+        blocks = method.blocks
+        assert not decoded
+
+        # using any field decodes the whole body, and replaces the proxies
+        block = method.block_by_label[0]
+        assert decoded == [method]
+        assert type(method.blocks) is list and type(method.block_by_label) is dict
+        assert blocks[0] is block and blocks == method.blocks
+        assert isinstance(method.exceptional_preds, dict)
+        assert not is_body_loaded(other)
+
+        # pickled as the decoded values
+        copied = pickle.loads(pickle.dumps(other))
+        assert type(copied.blocks) is list and len(copied.blocks) == len(other.blocks)
+    finally:
+        store.close()
+
+
+def test_project_store_lazy(tmp_path):
+    program = _program()
+    path = str(tmp_path / 'ir.store')
+    Project('test', lifter=program.lifter(), ir_store=path)
+    stored = Project('test', ir_store=path)
+    try:
+        # the hierarchy only reads the class headers
+        stored.hierarchy()
+        assert all(not is_body_loaded(m) for cls in stored.classes.values() for m in cls.methods)
+        assert len(stored.classes) == len(program.classes)
+
+        method = stored.methods[(program.class_names[1], 'm0', ('int',))]
+        block = method.blocks[1]
+        assert stored.blocks_to_methods[block] is method
+        assert stored.stmts_to_blocks[block.statements[0]] is block
+
+        # replacing a class decodes nothing else
+        name = program.class_names[2]
+        stored.replace_classes([klass(name, [])])
+        assert stored.classes[name].methods == []
+        assert all(not is_body_loaded(m) for cls in stored.classes.values()
+                   for m in cls.methods if m.class_name != program.class_names[1])
+        assert stored.blocks_to_methods[block] is method
+    finally:
+        stored.classes.store.close()
+
+
+class NotIR:
+    def __init__(self, value):
+        self.value = value
+
+
+def test_types_not_allowed(tmp_path):
+    path = str(tmp_path / 'ir.store')
+    with pytest.raises(IRStoreError):
+        write_ir_store({'A': NotIR(1)}, path)
+
+    # a store naming a type that is no longer allowed is not decoded
+    allow_module(NotIR.__module__)
+    try:
+        cls = klass('A', [])
+        cls.fields = {'x': NotIR(1)}
+        write_ir_store({'A': cls}, path)
+    finally:
+        ir_store._ALLOWED_MODULES.discard(NotIR.__module__)
+
+    store = IRStore(path)
+    try:
+        with pytest.raises(IRStoreError):
+            store.load_class('A')
+    finally:
+        store.close()
@@ -0,0 +1,68 @@
+import networkx
+
+from turi.cfg.paths import PathQuery
+
+
+def _diamond():
+    # two paths from 0 to 3, and 4 is not on any of them
+    return networkx.DiGraph([(0, 1), (0, 2), (1, 3), (2, 3), (3, 4)])
+
+
+def test_paths_match_networkx():
+    g = networkx.gnp_random_graph(8, 0.35, seed=4, directed=True)
+    q = PathQuery(g, 0, 7)
+    assert sorted(map(tuple, q.paths())) == sorted(map(tuple, networkx.all_simple_paths(g, 0, 7)))
+    assert not q.truncated
+
+
+def test_max_paths_truncated():
+    q = PathQuery(_diamond(), 0, 3)
+    assert q.nodes == {0, 1, 2, 3}
+
+    assert len(list(q.paths(max_paths=1))) == 1
+    assert q.truncated
+
+    # exactly max_paths paths: nothing was left out
+    assert len(list(q.paths(max_paths=2))) == 2
+    assert not q.truncated
+
+    assert len(list(q.collapsed_paths(max_paths=2))) == 2
+    assert not q.truncated
+
+
+def _ladder(n):
+    # 2 ** n paths from 0 to 3 * n
+    g = networkx.DiGraph()
+    for i in range(n):
+        a = 3 * i
+        g.add_edges_from([(a, a + 1), (a, a + 2), (a + 1, a + 3), (a + 2, a + 3)])
+    return g
+
+
+def test_shortest_paths_match_networkx():
+    g = networkx.gnp_random_graph(10, 0.3, seed=2, directed=True)
+    q = PathQuery(g, 0, 9)
+    expected = [len(p) for p in networkx.shortest_simple_paths(g, 0, 9)]
+    paths = list(q.shortest_paths(k=len(expected) + 1))
+    assert [len(p) for p in paths] == expected
+    assert sorted(map(tuple, paths)) == sorted(map(tuple, networkx.all_simple_paths(g, 0, 9)))
+    assert not q.truncated
+
+    assert [len(p) for p in q.shortest_paths(k=3)] == expected[:3]
+
+
+def test_shortest_paths_timeout():
+    q = PathQuery(_ladder(50), 0, 150)
+    assert q.nodes
+    # the deadline is checked before the first path is searched
+    assert list(q.shortest_paths(k=5, timeout=0)) == []
+    assert q.truncated
+
+
+def test_get_paths_bounded():
+    from turi.cfg.cfg_base import CFGBase
+
+    cfg = CFGBase()
+    cfg.graph = _ladder(16)
+    assert len(list(cfg.get_paths(0, 48))) == PathQuery.MAX_PATHS
+    assert len(list(cfg.get_paths(0, 48, max_paths=None))) == 2 ** 16
@@ -0,0 +1,102 @@
+from programs import *
+
+
+def _new(name, class_name):
+    return SootAssignStmt(local(name, class_name), SootNewExpr(class_name, class_name))
+
+
+def _field(base, field):
+    return SootInstanceFieldRef('Q', local(base, 'P'), (field, 'P'))
+
+
+def test_field_may_alias():
+    main = method('P', 'main', [[_new('a', 'P'), _new('b', 'P'), _new('x', 'Q'),
+                                 SootAssignStmt(local('c', 'P'), local('a', 'P')),
+                                 SootAssignStmt(_field('a', 'f'), local('x', 'Q')),
+                                 SootAssignStmt(local('y', 'Q'), _field('c', 'f')),
+                                 SootAssignStmt(local('z', 'Q'), _field('b', 'g')),
+                                 ret()]], static=True, ret='void')
+    p = project(klass('P', [main]), klass('Q', []))
+    pt = p.pointsto()
+
+    assert pt.field_may_alias(main, 'a', main, 'c', 'f')
+    assert pt.field_may_alias(main, 'a', main, 'c', ('f', 'P'))
+    # the bases do not share an object
+    assert not pt.field_may_alias(main, 'a', main, 'b', 'f')
+    # g is never accessed on the object of a and c
+    assert not pt.field_may_alias(main, 'a', main, 'c', 'g')
+    assert pt.field_may_alias(main, 'b', main, 'b', 'g')
+
+
+def _ref(name, class_name):
+    return local(name, class_name)
+
+
+def _impl(class_name):
+    return method(class_name, 'm', [[this(class_name), ret()]], ret='void')
+
+
+def _call_m(base):
+    return call(SootInterfaceInvokeExpr('void', 'I', 'm', (), [], _ref(base, 'I')))
+
+
+def _dispatch_project():
+    iface = klass('I', [method('I', 'm', [], ret='void', attrs=('PUBLIC', 'ABSTRACT'))],
+                  attrs=('PUBLIC', 'INTERFACE', 'ABSTRACT'))
+    a = klass('A', [_impl('A')], interfaces=['I'])
+    b = klass('B', [_impl('B')], interfaces=['I'])
+    field = SootInstanceFieldRef('I', _ref('h', 'Main'), ('f', 'Main'))
+
+    main = method('Main', 'main', [[
+        this('Main'),
+        _new('x', 'A'),
+        _call_m('x'),
+        # through a field
+        _new('h', 'Main'),
+        _new('b0', 'B'),
+        SootAssignStmt(field, _ref('b0', 'B')),
+        SootAssignStmt(_ref('y', 'I'), field),
+        _call_m('y'),
+        # copy cycle a <- c <- a, fed by x
+        SootAssignStmt(_ref('a', 'I'), _ref('x', 'A')),
+        SootAssignStmt(_ref('c', 'I'), _ref('a', 'I')),
+        SootAssignStmt(_ref('a', 'I'), _ref('c', 'I')),
+        _call_m('c'),
+        # returned by a call
+        SootAssignStmt(_ref('r', 'I'), SootStaticInvokeExpr('I', 'Main', 'mk', (), [])),
+        _call_m('r'),
+        # passed as a parameter
+        call(SootStaticInvokeExpr('void', 'Main', 'use', ('I',), [_ref('x', 'A')])),
+        ret()]], ret='void')
+    mk = method('Main', 'mk', [[_new('o', 'B'), SootReturnStmt(_ref('o', 'B'))]], static=True, ret='I')
+    use = method('Main', 'use', [[SootIdentityStmt(_ref('p', 'I'), SootParamRef('I', 0)), _call_m('p'), ret()]],
+                 params=('I',), static=True, ret='void')
+    # no caller in the project: its parameter is unknown
+    ext = method('Main', 'ext', [[SootIdentityStmt(_ref('q', 'I'), SootParamRef('I', 0)), _call_m('q'), ret()]],
+                 params=('I',), static=True, ret='void')
+
+    return project(iface, a, b, klass('Main', [main, mk, use, ext])), main, use, ext
+
+
+def test_dispatch_targets():
+    p, main, use, ext = _dispatch_project()
+    h = p.hierarchy()
+    declared = p.methods[('I', 'm', ())]
+
+    def targets(container, stmt):
+        return sorted(t.class_name for t in h.resolve_invoke(stmt.invoke_expr, declared, container))
+
+    stmts = main.blocks[0].statements
+    # class hierarchy only
+    assert targets(main, stmts[2]) == ['A', 'B']
+
+    p.pointsto()
+    assert [targets(main, stmts[i]) for i in (2, 7, 11, 13)] == [['A'], ['B'], ['A'], ['B']]
+    assert targets(use, use.blocks[0].statements[1]) == ['A']
+    # unknown receiver: the hierarchy targets are kept
+    assert targets(ext, ext.blocks[0].statements[1]) == ['A', 'B']
+
+    # the call graph is built with the filtered targets
+    cg = p.callgraph()
+    assert sorted(m.class_name for m in cg.next(use)) == ['A']
+    assert sorted(m.class_name for m in cg.next(ext)) == ['A', 'B']
@@ -0,0 +1,42 @@
+import random
+
+import networkx
+import pytest
+
+from programs import project
+from synthetic import SyntheticProgram
+
+from turi.project import Project
+from turi.reachability import ReachabilityIndex
+
+
+def _check(cg, index, rng):
+    graph = cg.graph
+    for src in graph:
+        reachable = networkx.descendants(graph, src) | {src}
+        assert index.reachable(src) == reachable
+        assert index.reaching(src) == networkx.ancestors(graph, src) | {src}
+        for dst in graph:
+            assert index.can_reach(src, dst) == (dst in reachable)
+        targets = rng.sample(list(graph), min(3, len(graph)))
+        assert index.can_reach_any(src, targets) == bool(reachable & set(targets))
+
+
+@pytest.mark.parametrize('exact', [True, False])
+def test_callgraph(exact):
+    program = SyntheticProgram(depth=3, fanout=2, methods_per_class=3, blocks_per_method=3, call_density=0.4, seed=4)
+    cg = Project('synthetic', lifter=program.lifter()).callgraph()
+    assert cg.graph.number_of_edges()
+    _check(cg, ReachabilityIndex(cg, exact=exact), random.Random(0))
+
+
+@pytest.mark.parametrize('exact', [True, False])
+def test_random_graphs(exact):
+    # random graphs, with cycles, in place of the call graph of an empty project
+    cg = project().callgraph()
+    rng = random.Random(1)
+    for seed in range(40):
+        n = rng.randint(1, 40)
+        cg.graph = networkx.gnp_random_graph(n, rng.uniform(0.01, 0.15), seed=seed, directed=True)
+        cg._invalidate()
+        _check(cg, ReachabilityIndex(cg, exact=exact, labelings=rng.randint(1, 4), seed=seed), rng)
@@ -0,0 +1,140 @@
+import pytest
+
+from synthetic import SyntheticProgram, SootBinopExpr
+
+from programs import method, klass, project, local, const, param, ret, assign, call, static_call, virtual_call
+
+from turi.project import Project
+from turi.instrumentation import Instrumentation
+
+
+def _project():
+    program = SyntheticProgram(depth=2, fanout=2, methods_per_class=3, blocks_per_method=3, stmts_per_block=3, seed=5)
+    return Project('synthetic', lifter=program.lifter(), instrumentation=Instrumentation()), program
+
+
+def _input(class_name):
+    return {'type': 'method_var', 'class_name': class_name, 'method_name': 'm1',
+            'method_params': ('int',), 'var_name': 'p0'}
+
+
+SLICERS = {
+    'forward': lambda p: p.forwardslicer(),
+    'forward_k1': lambda p: p.forwardslicer(context_k=1),
+    'backward': lambda p: p.backwardslicer(),
+    'backward_k1': lambda p: p.backwardslicer(context_k=1),
+}
+
+
+@pytest.mark.parametrize('kind', sorted(SLICERS))
+def test_iter_slice_matches_slice(kind):
+    p, program = _project()
+    make = SLICERS[kind]
+    inp = _input(program.class_names[0])
+
+    full = make(p)
+    full.slice(inp)
+
+    streamed = make(p)
+    items = list(streamed.iter_slice(inp))
+    assert set(item.block for item in items) == full.affected_blocks == streamed.affected_blocks
+    # each block is yielded once
+    assert len(items) == len(full.affected_blocks)
+    assert all(item.method is p.blocks_to_methods[item.block] for item in items)
+
+
+@pytest.mark.parametrize('kind', sorted(SLICERS))
+def test_iter_slice_early_exit(kind):
+    p, program = _project()
+    make = SLICERS[kind]
+    direction = kind.split('_')[0]
+    inp = _input(program.class_names[0])
+
+    full = make(p)
+    full.slice(inp)
+    visits = p.instrumentation.counters[direction + '_slicer.block_visits']
+
+    stopped = make(p)
+    items = stopped.iter_slice(inp, release=True)
+    first = next(items)
+    items.close()
+
+    # stopped after the first block: fewer visits, and the tainted sets are released
+    assert p.instrumentation.counters[direction + '_slicer.block_visits'] - visits < visits
+    assert first.block in stopped.affected_blocks
+    assert len(stopped.affected_blocks) < len(full.affected_blocks)
+    assert stopped._tainted == {}
+
+    # reaches() stops at the first block of the method
+    methods = set(p.blocks_to_methods[b] for b in full.affected_blocks)
+    for method in list(methods)[:3]:
+        assert make(p).reaches(inp, method)
+    for method in [m for m in p.methods.values() if m not in methods][:3]:
+        assert not make(p).reaches(inp, method)
+
+
+def _add(a, b):
+    return SootBinopExpr('int', '+', local(a), local(b))
+
+
+def _models_project():
+    # valueOf (0->ret) and append (0->base) are modeled, length has no flow, lib.Unknown.f is not modeled
+    m = method('M', 'm', [[param('p0'), assign('s', static_call('java.lang.String', 'valueOf', [local('p0')]))],
+                          [assign('n', virtual_call(local('s'), 'java.lang.String', 'length'))],
+                          [call(virtual_call(local('sb'), 'java.lang.StringBuilder', 'append', [local('p0')])),
+                           assign('k', virtual_call(local('q'), 'java.lang.StringBuilder', 'append', [local('n')]))],
+                          [assign('u', static_call('lib.Unknown', 'f', [local('p0')]))],
+                          [ret()]], params=('int',), static=True)
+    return project(klass('M', [m])), m
+
+
+def _var_input(class_name, method_name, params, var):
+    return {'type': 'method_var', 'class_name': class_name, 'method_name': method_name,
+            'method_params': params, 'var_name': var}
+
+
+def test_forward_external_models():
+    p, m = _models_project()
+    slicer = p.forwardslicer()
+    slicer.slice(_var_input('M', 'm', ('int',), 'p0'))
+    tainted = slicer.tainted_in_method(m)
+
+    # modeled flows propagate the taint
+    assert 's' in tainted and 'sb' in tainted
+    # a model without the flow stops it
+    assert 'n' not in tainted and 'q' not in tainted and 'k' not in tainted
+    # unmodeled external calls fall back to tainting what they set
+    assert 'u' in tainted
+
+
+def test_backward_external_models():
+    p, m = _models_project()
+    slicer = p.backwardslicer()
+    slicer.slice(_var_input('M', 'm', ('int',), 'n'))
+
+    # length() has no flow into its return value
+    assert 's' not in slicer.tainted_in_method(m)
+    assert slicer.affected_blocks == set([m.blocks[1]])
+
+    slicer = p.backwardslicer()
+    slicer.slice(_var_input('M', 'm', ('int',), 's'))
+    assert 'p0' in slicer.tainted_in_method(m)
+
+
+def test_backward_call_ret_past_external_call():
+    # t depends on an unmodeled external call and on a call to id, in the same block:
+    # the external call must not hide the return of id
+    c = method('B', 'c', [[assign('x', const(1))],
+                          [assign('s', static_call('java.lang.String', 'valueOf', [local('x')]))],
+                          [assign('e', static_call('lib.Unknown', 'f', [local('x')])),
+                           assign('y', static_call('B', 'id', [local('x')]))],
+                          [assign('t', _add('e', 'y')), assign('r', _add('s', 't'))],
+                          [ret('r')]], static=True)
+    id_ = method('B', 'id', [[param('a')], [ret('a')]], params=('int',), static=True)
+    p = project(klass('B', [c, id_]))
+
+    slicer = p.backwardslicer()
+    slicer.slice(_var_input('B', 'c', (), 'r'))
+    assert set(c.blocks[:4]) <= slicer.affected_blocks
+    assert id_.blocks[0] in slicer.affected_blocks
+    assert set(['x', 's', 'e', 'y']) <= slicer.tainted_in_method(c)
@@ -0,0 +1,31 @@
+from programs import *
+
+from turi.stub import PACKAGE_SCANNER, StubRegistry, call_stub
+
+
+def _classes():
+    return project(klass('com.app.A', []), klass('com.app.sub.B', []), klass('com.application.C', []),
+                   klass(PACKAGE_SCANNER, [])).classes
+
+
+def _package(name):
+    return [SootIntConstant('java.lang.String', '"{}"'.format(name))]
+
+
+def test_package_stub_on_declaring_class():
+    classes = _classes()
+    registry = StubRegistry(None, classes)
+
+    res = registry.call(PACKAGE_SCANNER, 'getClassesForPackage', None, _package('com.app'))
+    assert sorted(c.name for c in res) == ['com.app.A', 'com.app.sub.B']
+
+    # same method name on another class is not stubbed
+    assert registry.call('com.app.A', 'getClassesForPackage', None, _package('com.app')) is None
+    assert ('com.app.A', 'getClassesForPackage') not in registry
+
+
+def test_call_stub():
+    classes = _classes()
+    res = call_stub('getClassesForPackage', classes, _package('com.application'))
+    assert [c.name for c in res] == ['com.application.C']
+    assert call_stub('getClasses', classes, _package('com.app')) is None
@@ -0,0 +1,76 @@
+from programs import *
+
+
+SOURCES = [('Ext', 'source')]
+SINKS = [('Ext', 'sink')]
+
+
+def _helper_program(*callers):
+    # M() { r = Ext.source(); return r; }
+    m = method('A', 'M', [[assign('r', static_call('Ext', 'source')), ret('r')]], static=True)
+    return project(klass('A', [m] + list(callers)))
+
+
+def _sink_caller(name):
+    # name() { x = A.M(); Ext.sink(x); }
+    return method('A', name, [[assign('x', static_call('A', 'M')),
+                               call(static_call('Ext', 'sink', [local('x')], ret='void')),
+                               ret()]], static=True, ret='void')
+
+
+def _sink_lines(p, sites):
+    return sorted(p.blocks_to_methods[block].name for block, _ in sites)
+
+
+def test_taint_intraprocedural():
+    m = method('A', 'f', [[assign('x', static_call('Ext', 'source')),
+                           assign('y', SootBinopExpr('int', '+', local('x'), const(1))),
+                           assign('z', const(0)),
+                           call(static_call('Ext', 'sink', [local('y')], ret='void')),
+                           call(static_call('Ext', 'sink', [local('z')], ret='void')),
+                           ret()]], static=True, ret='void')
+    p = project(klass('A', [m]))
+    flows = p.taint(SOURCES, SINKS).run()
+    assert [flow.sink[1] for flow in flows] == [3]
+
+
+def test_taint_unbalanced_return():
+    p = _helper_program(_sink_caller('A1'))
+    flows = p.taint(SOURCES, SINKS).run()
+    assert _sink_lines(p, [flow.sink for flow in flows]) == ['A1']
+
+
+def test_taint_unbalanced_return_all_callers():
+    p = _helper_program(_sink_caller('A1'), _sink_caller('B1'))
+    flows = p.taint(SOURCES, SINKS).run()
+    assert _sink_lines(p, [flow.sink for flow in flows]) == ['A1', 'B1']
+
+
+def test_ifds_unbalanced_return():
+    p = _helper_program(_sink_caller('A1'))
+    assert _sink_lines(p, p.ifds_taint(SOURCES, SINKS).run()) == ['A1']
+
+
+def test_ifds_unbalanced_return_with_seeded_caller():
+    # A1 contains a source too, so it enters M with the zero fact: B1 must still get the return
+    a1 = method('A', 'A1', [[assign('x', static_call('A', 'M')),
+                             assign('y', static_call('Ext', 'source')),
+                             call(static_call('Ext', 'sink', [local('x')], ret='void')),
+                             ret()]], static=True, ret='void')
+    for callers in ([a1, _sink_caller('B1')], [_sink_caller('B1'), a1]):
+        p = _helper_program(*callers)
+        assert _sink_lines(p, p.ifds_taint(SOURCES, SINKS).run()) == ['A1', 'B1']
+        assert _sink_lines(p, [flow.sink for flow in p.taint(SOURCES, SINKS).run()]) == ['A1', 'B1']
+
+
+def test_ifds_context_sensitive():
+    # id(a) { return a; } is called with a tainted and a clean value
+    ident = method('A', 'id', [[param('a'), ret('a')]], params=('int',), static=True)
+    main = method('A', 'main', [[assign('x', static_call('Ext', 'source')),
+                                 assign('y', static_call('A', 'id', [local('x')])),
+                                 assign('z', static_call('A', 'id', [const(1)])),
+                                 call(static_call('Ext', 'sink', [local('y')], ret='void')),
+                                 call(static_call('Ext', 'sink', [local('z')], ret='void')),
+                                 ret()]], static=True, ret='void')
+    p = project(klass('A', [ident, main]))
+    assert [index for _, index in p.ifds_taint(SOURCES, SINKS).run()] == [3]
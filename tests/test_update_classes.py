@@ -0,0 +1,95 @@
+import pytest
+
+from synthetic import SyntheticProgram, SyntheticLifter
+
+from turi.project import Project
+from turi.cfg import CallSite, ReturnSite
+
+
+def _program(seed):
+    return SyntheticProgram(depth=3, fanout=2, methods_per_class=3, blocks_per_method=3, interfaces=2, seed=seed)
+
+
+def _node(p, node):
+    if isinstance(node, (CallSite, ReturnSite)):
+        m = p.blocks_to_methods[node.block]
+        return type(node).__name__, m.class_name, m.name, node.block.label, node.index
+    m = p.blocks_to_methods[node]
+    return m.class_name, m.name, node.label
+
+
+def _graph(p, graph):
+    return (sorted(_node(p, n) for n in graph.graph.nodes),
+            sorted((_node(p, a), _node(p, b), kind) for a, b, kind in graph.graph.edges(data='kind')))
+
+
+def _callgraph(p):
+    cg = p.callgraph().graph
+    return (sorted((m.class_name, m.name) for m in cg.nodes),
+            sorted(((a.class_name, a.name), (b.class_name, b.name)) for a, b in cg.edges))
+
+
+def _hierarchy(p):
+    h = p.hierarchy()
+    res = []
+    for cls in p.classes.values():
+        if 'INTERFACE' in cls.attrs:
+            res.append((cls.name, sorted(c.name for c in h.get_implementers(cls))))
+        else:
+            res.append((cls.name, sorted(c.name for c in h.get_sub_classes(cls))))
+    return sorted(res)
+
+
+def _state(p):
+    return {
+        'hierarchy': _hierarchy(p),
+        'cfgfull': _graph(p, p.cfgfull()),
+        'cfgfull_retedges': _graph(p, p.cfgfull_retedges()),
+        'supergraph': _graph(p, p.supergraph()),
+        'callgraph': _callgraph(p),
+    }
+
+
+def _build(p):
+    p.hierarchy()
+    p.cfgfull()
+    p.cfgfull_retedges()
+    p.supergraph()
+    p.callgraph()
+
+
+def _check(p, classes):
+    fresh = Project('fresh', lifter=SyntheticLifter(dict(classes)))
+    expected = _state(fresh)
+    got = _state(p)
+    for name in expected:
+        assert got[name] == expected[name], name
+
+
+@pytest.mark.parametrize('replaced', [[1], [0, 3], [2, 5, 6]])
+def test_update_matches_fresh_project(replaced):
+    old = _program(1)
+    new = _program(7 + replaced[0])
+    classes = dict(old.classes)
+
+    p = Project('updated', lifter=SyntheticLifter(dict(old.classes)))
+    _build(p)
+    supergraph = p.supergraph()
+
+    # new versions of some classes
+    names = [old.class_names[i] for i in replaced]
+    p.replace_classes([new.classes[name] for name in names])
+    classes.update((name, new.classes[name]) for name in names)
+    assert p.supergraph() is supergraph
+    _check(p, classes)
+
+    # remove a leaf class, then add it back
+    leaf = old.class_names[-1]
+    p.remove_classes([leaf])
+    del classes[leaf]
+    _check(p, classes)
+
+    p.add_classes([old.classes[leaf]])
+    classes[leaf] = old.classes[leaf]
+    _check(p, classes)
+    assert set(supergraph._edge_refs) == set(supergraph.graph.edges)
@@ -1 +1,6 @@
+import logging
+
 from .project import Project
+
+# logging is left to the application, e.g. logging.getLogger('turi').setLevel(logging.DEBUG)
+logging.getLogger('turi').addHandler(logging.NullHandler())
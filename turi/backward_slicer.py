@@ -4,10 +4,12 @@ from queue import Queue
 
 from .statements import *
 from .utils import walk_all_blocks
+from .common import SliceItem
+from .budget import StateCodec
+from .models import RET, invoke_locations
+from .context import CallStrings, EMPTY
 
-logging.basicConfig()
-log = logging.getLogger('BackwardSlicer')
-log.setLevel(logging.DEBUG)
+log = logging.getLogger('turi.BackwardSlicer')
 
 
 class BackwardSlicerError(Exception):
@@ -22,19 +24,42 @@ class BackwardSlicer:
     """
         Backward Slicer: staring from some input, go back to code paths that
         affect the input
+
+        With context_k, the traversal is context sensitive: blocks are visited
+        in the context of the last context_k call sites (blocks) the slice entered
+        callees from, and a slice leaving a callee through its parameters only goes
+        back to the call site it came from.
     """
     MAX_ITER = 5000
     MAX_ITERS_BLOCK = 30
 
-    def __init__(self, project, max_iter=None):
+    def __init__(self, project, max_iter=None, allowed_blocks=None, context_k=None):
         self.project = project
         if max_iter:
             self.MAX_ITER = max_iter
+        # if set, the traversal never leaves these blocks (e.g., a source-sink chop)
+        self.allowed_blocks = allowed_blocks
         self.iters_per_block = {}
         self.affected_blocks = set()
         self._tainted = {}
+        # context sensitive mode: tainted variables per (block, context)
+        self.contexts = CallStrings(context_k) if context_k else None
+        self._ctx_tainted = {}
         self._input_data = None
         self._input = None
+        # worklist state, kept to resume a slice stopped by its budget
+        self._position = 0
+        self._queue = None
+        self._visited = set()
+        self._iterations = 0
+        # True if MAX_ITER stopped the traversal of an input
+        self._iter_exceeded = False
+        # context sensitive mode: keys in the queue, size of the tainted sets at the last visit
+        self._pending = set()
+        self._visited_sizes = {}
+        # why the slice is partial: exceeded budget ('time' or 'memory', resume() continues it),
+        # or 'iterations' if MAX_ITER stopped the traversal of an input
+        self.incomplete = None
 
     @property
     def input_blocks(self):
@@ -53,12 +78,13 @@ class BackwardSlicer:
         except:
             return set()
 
-    def _merge_tainted(self, curr_block, prev_block):
-        curr_tainted = self._tainted[curr_block]
+    def _merge_tainted(self, curr_block, prev_block, tainted=None):
+        tainted = self._tainted if tainted is None else tainted
+        curr_tainted = tainted[curr_block]
 
-        if prev_block in self._tainted:
+        if prev_block in tainted:
             # time to merge
-            prev_tainted = self._tainted[prev_block]
+            prev_tainted = tainted[prev_block]
             new_tainted = dict([(m, s) for (m, s) in prev_tainted.items() if m not in curr_tainted])
             new_tainted.update(dict([(m, s) for (m, s) in curr_tainted.items() if m not in prev_tainted]))
             new_tainted.update(dict([(m, s.union(curr_tainted[m])) for (m, s) in prev_tainted.items() if m in curr_tainted]))
@@ -66,41 +92,211 @@ class BackwardSlicer:
 
         return curr_tainted
 
-    def slice(self, input, input_data=None):
+    def slice(self, input, input_data=None, budget=None):
+        """
+            :param budget: a budget.Budget, if it is exceeded the slice stops and
+                           incomplete is set (see checkpoint() and resume()).
+                           incomplete is 'iterations' if MAX_ITER cut the traversal.
+        """
+        with self.project.instrumentation.phase('backward_slicer.slice'):
+            for _ in self._slice(input, input_data, budget):
+                pass
+
+    def resume(self, checkpoint=None, budget=None):
+        """
+            Continue an incomplete slice, from checkpoint if given
+        """
+        if checkpoint is not None:
+            self._restore(checkpoint)
+        elif self._input_data is None:
+            raise BackwardSlicerError('No slice to resume')
+        with self.project.instrumentation.phase('backward_slicer.slice'):
+            for _ in self._run(budget):
+                pass
+
+    def iter_slice(self, input, input_data=None, release=False, budget=None):
+        """
+            Generator variant of slice(): yields a SliceItem for each block as soon
+            as it is added to the slice. The caller can stop at any time.
+
+            :param release: drop the tainted variables when the iteration ends or is stopped
+        """
+        try:
+            for item in self._slice(input, input_data, budget):
+                yield item
+        finally:
+            if release:
+                self._release()
+
+    def reaches(self, input, method):
+        """
+            True if some block of method is in the slice of input (stops at the first one)
+        """
+        for item in self.iter_slice(input, release=True):
+            if item.method is method:
+                return True
+        return False
+
+    def _release(self):
+        self._tainted = {}
+        self._ctx_tainted = {}
+        self.iters_per_block = {}
+        self._queue = None
+        self._visited = set()
+        self._pending = set()
+        self._visited_sizes = {}
+
+    def checkpoint(self):
+        """
+            State of the slice as plain data (it can be pickled), to resume() it later,
+            e.g. with a bigger budget. It is exact after slice() or resume() returned.
+        """
+        blocks = StateCodec(self.project)
+        keys = StateCodec(self.project, self.contexts)
+        return {
+            'context_k': self.contexts.k if self.contexts is not None else None,
+            'input': self._input,
+            'input_data': [(blocks.block(block), var, i) for block, var, i in self._input_data or []],
+            'position': self._position,
+            'queue': None if self._queue is None else [keys.key(self._key(b, ctx)) for b, ctx in list(self._queue.queue)],
+            'visited': sorted(keys.key(k) for k in self._visited),
+            'iterations': self._iterations,
+            'iter_exceeded': self._iter_exceeded,
+            'iters_per_block': sorted((keys.key(k), n) for k, n in self.iters_per_block.items()),
+            'pending': sorted(keys.key(k) for k in self._pending),
+            'visited_sizes': sorted((keys.key(k), n) for k, n in self._visited_sizes.items()),
+            'affected_blocks': sorted(blocks.block(b) for b in self.affected_blocks),
+            'tainted': blocks.encode_tainted(self._tainted),
+            'ctx_tainted': keys.encode_tainted(self._ctx_tainted) if self.contexts else None,
+            'incomplete': self.incomplete,
+        }
+
+    def _restore(self, checkpoint):
+        context_k = self.contexts.k if self.contexts is not None else None
+        if checkpoint['context_k'] != context_k:
+            raise BackwardSlicerError('Checkpoint of a slice with context_k=%s' % checkpoint['context_k'])
+
+        blocks = StateCodec(self.project)
+        keys = StateCodec(self.project, self.contexts)
+        self._input = checkpoint['input']
+        self._input_data = [(blocks.resolve_block(b), var, i) for b, var, i in checkpoint['input_data']]
+        self._position = checkpoint['position']
+        self._queue = None
+        if checkpoint['queue'] is not None:
+            self._queue = Queue()
+            for k in checkpoint['queue']:
+                key = keys.resolve_key(k)
+                self._queue.put(key if self.contexts else (key, EMPTY))
+        self._visited = set(keys.resolve_key(k) for k in checkpoint['visited'])
+        self._iterations = checkpoint['iterations']
+        self._iter_exceeded = checkpoint['iter_exceeded']
+        self.iters_per_block = dict((keys.resolve_key(k), n) for k, n in checkpoint['iters_per_block'])
+        self._pending = set(keys.resolve_key(k) for k in checkpoint['pending'])
+        self._visited_sizes = dict((keys.resolve_key(k), n) for k, n in checkpoint['visited_sizes'])
+        self.affected_blocks = set(blocks.resolve_block(b) for b in checkpoint['affected_blocks'])
+        self._tainted = blocks.decode_tainted(checkpoint['tainted'])
+        self._ctx_tainted = keys.decode_tainted(checkpoint['ctx_tainted']) if self.contexts else {}
+        self.incomplete = checkpoint['incomplete']
+
+    def _affect(self, block, statements, tainted):
+        """
+            Add block to the slice, returns its SliceItem if it is new
+        """
+        if block in self.affected_blocks:
+            return None
+        self.affected_blocks.add(block)
+
+        unique = []
+        for stmt in statements:
+            if not any(stmt is s for s in unique):
+                unique.append(stmt)
+        return SliceItem(block, self.project.blocks_to_methods[block], tuple(unique), frozenset(tainted))
+
+    def _slice(self, input, input_data=None, budget=None):
         self._input = input
         if not input_data:
             self._input_data = self.locate_input()
         else:
             self._input_data = input_data
-
-        for input_block, var, input_stmt_index in self._input_data:
-            # traverse CFG
-            queue = Queue()
-            queue.put(input_block)
-            iterations = 0
-            visited = set()
-            tainted_input = {self.project.blocks_to_methods[input_block]: set([var])}
-            self._tainted[input_block] = tainted_input
-            self.affected_blocks.add(input_block)
-
-            while not queue.empty() and iterations < self.MAX_ITER:
-                curr_block = queue.get()
+        self._position = 0
+        self._queue = None
+        self._iter_exceeded = False
+        return self._run(budget)
+
+    def _run(self, budget=None):
+        instr = self.project.instrumentation
+        self.incomplete = None
+        if budget is not None:
+            budget.start()
+
+        # tainted variables per worklist key: block, or (block, context)
+        tainted = self._tainted if self.contexts is None else self._ctx_tainted
+
+        def push(block, ctx):
+            if self.contexts is not None:
+                key = (block, ctx)
+                if key in self._pending or self._visited_sizes.get(key) == self._tainted_size(tainted[key]):
+                    return
+                self._pending.add(key)
+            self._queue.put((block, ctx))
+            if instr.enabled:
+                instr.count('backward_slicer.queue_pushes')
+
+        while self._position < len(self._input_data):
+            input_block, var, input_stmt_index = self._input_data[self._position]
+            if self._queue is None:
+                # traverse CFG
+                self._queue = Queue()
+                self._pending = set()
+                self._visited_sizes = {}
+                self._iterations = 0
+                self._visited = set()
+                tainted_input = {self.project.blocks_to_methods[input_block]: set([var])}
+                tainted[self._key(input_block, EMPTY)] = tainted_input
+                item = self._affect(input_block, (), [var])
+                if item:
+                    yield item
+                push(input_block, EMPTY)
+
+            queue = self._queue
+            pending = self._pending
+            visited_sizes = self._visited_sizes
+            visited = self._visited
+
+            while not queue.empty() and self._iterations < self.MAX_ITER:
+                if budget is not None:
+                    self.incomplete = budget.exceeded()
+                    if self.incomplete:
+                        log.info('Slice stopped: %s budget exceeded', self.incomplete)
+                        if instr.enabled:
+                            instr.count('backward_slicer.budget_exceeded')
+                        if self.contexts is not None:
+                            self._fold_contexts()
+                        return
+
+                curr_block, curr_ctx = queue.get()
+                curr_key = self._key(curr_block, curr_ctx)
+                pending.discard(curr_key)
                 curr_method = self.project.blocks_to_methods[curr_block]
-                iterations += 1
+                self._iterations += 1
+                if instr.enabled:
+                    instr.count('backward_slicer.block_visits')
 
-                if curr_block in visited:
-                    if curr_block not in self.iters_per_block:
-                        self.iters_per_block[curr_block] = 0
-                    self.iters_per_block[curr_block] += 1
+                if curr_key in visited:
+                    if curr_key not in self.iters_per_block:
+                        self.iters_per_block[curr_key] = 0
+                    self.iters_per_block[curr_key] += 1
 
-                    iters_curr_block = self.iters_per_block[curr_block]
+                    iters_curr_block = self.iters_per_block[curr_key]
                     if iters_curr_block >= self.MAX_ITERS_BLOCK:
+                        if instr.enabled:
+                            instr.count('backward_slicer.max_iters_block')
                         continue
                 else:
-                    visited.add(curr_block)
+                    visited.add(curr_key)
 
                 # get variable to follow for this block
-                curr_tainted = self._tainted[curr_block].get(curr_method, [])
+                curr_tainted = tainted[curr_key].get(curr_method, [])
 
                 if curr_block == input_block:
                     # if curr_block is the input one, we don't want to consider
@@ -120,26 +316,33 @@ class BackwardSlicer:
                                                    stmt_index=stmt_index)
 
                     if set_stmts:
-                        self.affected_blocks.add(curr_block)
+                        item = self._affect(curr_block, set_stmts, curr_tainted)
+                        if item:
+                            yield item
                         # Get the list of variables used in the assignment statements
                         # which involve one or more tainted variables.
                         # Also, get the list of assignment statements those assign
                         # the return values of function calls (rvalue) to variables (lvalue)
                         new_use, new_call_use = self.get_use(set_stmts)
                         for use_var in new_use:
-                            self._tainted[curr_block][curr_method].add(use_var)
+                            tainted[curr_key][curr_method].add(use_var)
 
                         # Get a list of the return values and corresponding blocks 
                         # of the functions which have their return values assigned to
                         # variables living in the current scope. Iterate over this list.
                         for ret_block, ret_var in self.get_call_ret(new_call_use):
+                            if self.allowed_blocks is not None and ret_block not in self.allowed_blocks:
+                                continue
                             called_m = self.project.blocks_to_methods[ret_block]
-                            if ret_block not in self._tainted:
-                                self._tainted[ret_block] = {}
-                            if called_m not in self._tainted[ret_block]:
-                                self._tainted[ret_block][called_m] = set()
-                            self._tainted[ret_block][called_m].add(ret_var)
-                            queue.put(ret_block)
+                            # entering the callee from the current block
+                            ret_ctx = self.contexts.push(curr_ctx, curr_block) if self.contexts else EMPTY
+                            ret_key = self._key(ret_block, ret_ctx)
+                            if ret_key not in tainted:
+                                tainted[ret_key] = {}
+                            if called_m not in tainted[ret_key]:
+                                tainted[ret_key][called_m] = set()
+                            tainted[ret_key][called_m].add(ret_var)
+                            push(ret_block, ret_ctx)
 
                     # $r3.<init>($r7)
                     # $r3 is tainted, we want to taint $r7
@@ -150,20 +353,81 @@ class BackwardSlicer:
                                                        stmt_index=stmt_index)
 
                     if call_taints:
-                        self.affected_blocks.add(curr_block)
+                        item = self._affect(curr_block, (), curr_tainted)
+                        if item:
+                            yield item
                         for var_name in call_taints:
-                            self._tainted[curr_block][curr_method].add(var_name)
+                            tainted[curr_key][curr_method].add(var_name)
 
-                curr_tainted = self._tainted[curr_block].get(curr_method, [])
+                curr_tainted = tainted[curr_key].get(curr_method, [])
 
                 for call_method, var_name in self.tainted_params(curr_block, curr_tainted):
-                    if call_method not in self._tainted[curr_block]:
-                        self._tainted[curr_block][call_method] = set()
-                    self._tainted[curr_block][call_method].add(var_name)
+                    if call_method not in tainted[curr_key]:
+                        tainted[curr_key][call_method] = set()
+                    tainted[curr_key][call_method].add(var_name)
+
+                if self.contexts is not None:
+                    visited_sizes[curr_key] = self._tainted_size(tainted[curr_key])
 
                 for prev_block in self.project.cfgfull().get_prev_blocks(curr_block):
-                    queue.put(prev_block)
-                    self._tainted[prev_block] = self._merge_tainted(curr_block, prev_block)
+                    if self.allowed_blocks is not None and prev_block not in self.allowed_blocks:
+                        continue
+                    prev_ctx = self._prev_context(curr_ctx, curr_method, prev_block)
+                    if prev_ctx is None:
+                        # not the call site the callee was entered from
+                        continue
+                    prev_key = self._key(prev_block, prev_ctx)
+                    tainted[prev_key] = self._merge_tainted(curr_key, prev_key, tainted)
+                    if self.contexts is not None and tainted[prev_key] is tainted[curr_key]:
+                        # do not share the sets: changes are detected by size
+                        tainted[prev_key] = dict((m, set(v)) for m, v in tainted[curr_key].items())
+                    push(prev_block, prev_ctx)
+
+            if not queue.empty():
+                self._iter_exceeded = True
+                if instr.enabled:
+                    instr.count('backward_slicer.max_iter')
+
+            self._queue = None
+            self._position += 1
+
+        if self.contexts is not None:
+            self._fold_contexts()
+
+        if self._iter_exceeded:
+            self.incomplete = 'iterations'
+            log.info('Slice cut: MAX_ITER reached')
+
+    def _key(self, block, ctx):
+        return block if self.contexts is None else (block, ctx)
+
+    def _prev_context(self, ctx, method, prev_block):
+        """
+            Context of prev_block, reached backward from a block of method in context ctx.
+            None if prev_block is a call site that does not match the context.
+        """
+        if self.contexts is None or self.project.blocks_to_methods[prev_block] is method:
+            return ctx
+
+        # leaving method through its entry, back to a call site
+        call_site = self.contexts.top(ctx)
+        if call_site is None:
+            # unknown caller (the slice started here, or the context was truncated)
+            return EMPTY
+        if call_site is not prev_block:
+            return None
+        return self.contexts.pop(ctx)
+
+    @staticmethod
+    def _tainted_size(tainted):
+        return len(tainted) + sum(len(v) for v in tainted.values())
+
+    def _fold_contexts(self):
+        # tainted variables per block, merged over the contexts
+        for (block, _), methods in self._ctx_tainted.items():
+            merged = self._tainted.setdefault(block, {})
+            for method, vars in methods.items():
+                merged.setdefault(method, set()).update(vars)
 
     def locate_input(self):
         res = []
@@ -230,7 +494,8 @@ class BackwardSlicer:
         """
         res = []
 
-        for var in vars:
+        # in a fixed order, the calls found are followed in the order of their statements
+        for var in sorted(vars, key=repr):
             if stmt_index:
                 var_res = self.get_set_var_stmts(block.statements[:stmt_index], var)
             else:
@@ -258,6 +523,17 @@ class BackwardSlicer:
         for stmt in stmts:
             if is_invoke(stmt) and not is_assign(stmt):
                 invoke_expr = stmt.invoke_expr
+
+                model = self.project.external_model(invoke_expr)
+                if model is not None:
+                    # external method: taint what flows into the tainted locations
+                    locations = invoke_locations(stmt)
+                    tainted_locs = [loc for loc, name in locations.items() if name in vars]
+                    for loc in model.backward(tainted_locs):
+                        if loc in locations:
+                            res.append(locations[loc])
+                    continue
+
                 if hasattr(invoke_expr, 'base'):
                     if invoke_expr.base.name in vars:
                         for arg in invoke_expr.args:
@@ -287,8 +563,8 @@ class BackwardSlicer:
             try:
                 method = self.project.methods[(cls_name, method_name, method_params)]
             except KeyError as e:
-                # external methods are not supported
-                return []
+                # external methods are handled by get_use through their models
+                continue
 
             container_m = self.project.blocks_to_methods[self.project.stmts_to_blocks[stmt]]
             targets = self.project.hierarchy().resolve_invoke(stmt.right_op, method, container_m)
@@ -369,13 +645,24 @@ class BackwardSlicer:
             assign the return value of a function call
         """
         var_used = set()
-        call_ret_used = set()
+        # calls in the order of their statements
+        call_ret_used = []
 
         for stmt in statements:
             # handle the different use scenarios
             if is_assign(stmt) and is_invoke(stmt.right_op):
                 invoke_expr = stmt.right_op
 
+                model = self.project.external_model(invoke_expr)
+                if model is not None:
+                    # --- external method, e.g., new = var.toString()
+                    # taint only what flows into the return value
+                    locations = invoke_locations(stmt)
+                    for loc in model.backward([RET]):
+                        if loc in locations:
+                            var_used.add(locations[loc])
+                    continue
+
                 if hasattr(invoke_expr, 'base'):
                     # --- use object method
                     # --- e.g., new = var.method()
@@ -388,7 +675,8 @@ class BackwardSlicer:
                     if hasattr(arg, 'name'):
                         var_used.add(arg.name)
 
-                call_ret_used.add(stmt)
+                if not any(stmt is s for s in call_ret_used):
+                    call_ret_used.append(stmt)
 
             elif is_assign(stmt):
                 right_op = stmt.right_op
@@ -455,47 +743,6 @@ class BackwardSlicer:
 
         return var_used, call_ret_used
 
-    def get_conditional_stmts(self, block, vars):
-        target_blocks = []
-        cond_stmts = []
-
-        method = self.project.blocks_to_methods[block]
-
-        for var in vars:
-            for stmt in block.statements:
-                if is_switch(stmt) and hasattr(stmt.key, 'name'):
-                    if stmt.key.name == var:
-                        cond_stmts.append(stmt)
-
-                        label = stmt.default_target
-                        target_block = method.block_by_label[label]
-                        target_blocks.append(target_block)
-                        labels = stmt.lookup_values_and_targets.values()
-
-                        # switch targets
-                        for label in labels:
-                            target_block = method.block_by_label[label]
-                            target_blocks.append(target_block)
-
-                elif is_condition(stmt):
-                    condition = stmt.condition
-                    if hasattr(condition, 'value'):
-                        if hasattr(condition.value, 'name'):
-                            if condition.value.name == var:
-                                cond_stmts.append(stmt)
-
-                    if hasattr(condition, 'value1'):
-                        if hasattr(condition.value1, 'name'):
-                            if condition.value1.name == var:
-                                cond_stmts.append(stmt)
-
-                    if hasattr(condition, 'value2'):
-                        if hasattr(condition.value2, 'name'):
-                            if condition.value2.name == var:
-                                cond_stmts.append(stmt)
-
-        return cond_stmts, target_blocks
-
     def get_set_var_stmts(self, stmts, var):
         """
             Given a list of statements and a "variable" name,
@@ -0,0 +1,149 @@
+"""
+    Budgets and checkpoints of anytime slicing
+
+    A slicer given a Budget stops when the wall-clock time or the memory of the
+    process goes over it, flags its results as incomplete, and keeps its state:
+
+        slicer = p.backwardslicer()
+        slicer.slice(input, budget=Budget(seconds=2))
+        if slicer.incomplete in ('time', 'memory'):
+            state = slicer.checkpoint()
+            ...
+            slicer = p.backwardslicer()
+            slicer.resume(state, budget=Budget(seconds=20))
+
+    incomplete is 'iterations' when MAX_ITER cut the traversal of an input: the
+    slice is partial, but resuming it does not go further (raise max_iter instead).
+
+    A checkpoint is plain data (tuples, lists, dicts, strings and numbers), which
+    can be pickled and loaded in another process, on a project of the same app.
+"""
+
+import os
+import sys
+import time
+
+from .utils import get_method_key
+
+
+def current_memory():
+    """
+        Resident memory of the process in bytes (its peak where /proc is not
+        available), None if it cannot be measured
+    """
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Budget:
+    """
+        Limits of a slicing run: wall-clock seconds and resident memory (bytes).
+        The clock starts when the run starts; memory is sampled every MEMORY_EVERY checks.
+    """
+    MEMORY_EVERY = 64
+
+    def __init__(self, seconds=None, memory=None):
+        self.seconds = seconds
+        self.memory = memory
+        self._deadline = None
+        self._checks = 0
+
+    def start(self):
+        self._deadline = time.monotonic() + self.seconds if self.seconds is not None else None
+        self._checks = 0
+        return self
+
+    def exceeded(self):
+        """
+            Name of the exceeded limit ('time' or 'memory'), None if within the budget
+        """
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            return 'time'
+
+        if self.memory is not None:
+            check = self._checks % self.MEMORY_EVERY == 0
+            self._checks += 1
+            if check:
+                used = current_memory()
+                if used is not None and used > self.memory:
+                    return 'memory'
+
+        return None
+
+
+class StateCodec:
+    """
+        Converts the state of a slicer to plain data and back.
+        Blocks are referred to by method key and label, contexts by their call
+        strings, and tainted sets (and dicts) shared by several blocks stay shared.
+        The encoding does not depend on the hashes of the objects or on the
+        order variables and methods were tainted in: sets and the methods of
+        the dicts are sorted, the worklist keeps its order.
+    """
+
+    def __init__(self, project, contexts=None):
+        self.project = project
+        self.contexts = contexts
+
+    def block(self, block):
+        return get_method_key(self.project.blocks_to_methods[block]), block.label
+
+    def resolve_block(self, data):
+        method_key, label = data
+        return self.project.methods[tuple(method_key)].block_by_label[label]
+
+    def key(self, key):
+        # worklist key: block, or (block, context)
+        if self.contexts is None:
+            return self.block(key)
+        block, ctx = key
+        return self.block(block), tuple(self.block(b) for b in self.contexts.call_string(ctx))
+
+    def resolve_key(self, data):
+        if self.contexts is None:
+            return self.resolve_block(data)
+        block, call_string = data
+        return self.resolve_block(block), self.contexts.context(tuple(self.resolve_block(b) for b in call_string))
+
+    def encode_tainted(self, tainted):
+        """
+            {key: {method: set of vars}} -> (sets, dicts, [(key, dict index)])
+        """
+        set_ids, sets = {}, []
+        dict_ids, dicts = {}, []
+
+        def set_ref(s):
+            if id(s) not in set_ids:
+                set_ids[id(s)] = len(sets)
+                # variables are names, or (field, class) tuples
+                sets.append(sorted(s, key=repr))
+            return set_ids[id(s)]
+
+        def dict_ref(d):
+            if id(d) not in dict_ids:
+                items = sorted(d.items(), key=lambda item: get_method_key(item[0]))
+                entries = [(get_method_key(m), set_ref(s)) for m, s in items]
+                dict_ids[id(d)] = len(dicts)
+                dicts.append(entries)
+            return dict_ids[id(d)]
+
+        refs = [(self.key(k), dict_ref(d)) for k, d in tainted.items()]
+        return sets, dicts, refs
+
+    def decode_tainted(self, data):
+        set_data, dict_data, refs = data
+        sets = [set(vars) for vars in set_data]
+        dicts = [dict((self.project.methods[tuple(m)], sets[s]) for m, s in entries) for entries in dict_data]
+        return dict((self.resolve_key(k), dicts[d]) for k, d in refs)
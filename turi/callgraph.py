@@ -4,12 +4,12 @@ import logging
 from collections import defaultdict
 
 from .statements import *
-from .utils import walk_all_blocks
+from .utils import walk_all_blocks, get_method_key
 from .hierarchy import NoConcreteDispatch
+from .callgraph_archive import CallGraphWriter, CallGraphArchive
+from .reachability import ReachabilityIndex
 
-logging.basicConfig()
-log = logging.getLogger('CallGraph')
-log.setLevel(logging.DEBUG)
+log = logging.getLogger('turi.CallGraph')
 
 
 class CallGraph:
@@ -21,11 +21,26 @@ class CallGraph:
         self.project = project
         self.graph = networkx.DiGraph()
         self._call_sites = defaultdict(lambda: defaultdict(list))
+        self._sccs = None
+        self._scc_index = None
+        self._reachability = None
+        # bookkeeping for incremental updates
+        self._invoke_targets = {}
+        self._invokes_by_class = defaultdict(set)
         self.build()
 
     def build(self):
-        for block in walk_all_blocks(self.project.classes):
-            method = self.project.blocks_to_methods[block]
+        self._invalidate()
+        with self.project.instrumentation.phase('callgraph.build'):
+            for block in walk_all_blocks(self.project.classes):
+                method = self.project.blocks_to_methods[block]
+                self.graph.add_node(method)
+                for stmt in block.statements:
+                    if is_invoke(stmt):
+                        self._add_invoke(method, block, stmt)
+
+    def _add_method(self, method):
+        for block in method.blocks:
             self.graph.add_node(method)
             for stmt in block.statements:
                 if is_invoke(stmt):
@@ -42,6 +57,10 @@ class CallGraph:
         method_name = invoke_expr.method_name
         method_params = invoke_expr.method_params
 
+        # the call site has to be re-resolved if its class changes
+        self._invokes_by_class[cls_name].add((container_m, block, invoke))
+        invoke_targets = self._invoke_targets.setdefault(invoke, [])
+
         if cls_name not in self.project.classes:
             # external classes are currently not supported
             return
@@ -64,12 +83,200 @@ class CallGraph:
                 self.graph.add_node(target)
                 self.graph.add_edge(container_m, target)
                 self._call_sites[container_m][target].append(invoke_expr)
+                invoke_targets.append(target)
+
+    def _remove_invoke(self, container_m, block, invoke):
+        invoke_expr = invoke.invoke_expr if hasattr(invoke, 'invoke_expr') else invoke.right_op
+
+        for target in self._invoke_targets.pop(invoke, []):
+            if container_m not in self._call_sites or target not in self._call_sites[container_m]:
+                # one of the methods has been removed already
+                continue
+
+            call_sites = self._call_sites[container_m][target]
+            call_sites.remove(invoke_expr)
+            if not call_sites:
+                del self._call_sites[container_m][target]
+                if self.graph.has_edge(container_m, target):
+                    self.graph.remove_edge(container_m, target)
+
+    def _remove_method(self, method):
+        for block in method.blocks:
+            for stmt in block.statements:
+                if stmt in self._invoke_targets:
+                    self._remove_invoke(method, block, stmt)
+                    invoke_expr = stmt.invoke_expr if hasattr(stmt, 'invoke_expr') else stmt.right_op
+                    self._invokes_by_class[invoke_expr.class_name].discard((method, block, stmt))
+
+        if method in self.graph:
+            for caller in self.graph.predecessors(method):
+                self._call_sites[caller].pop(method, None)
+            self.graph.remove_node(method)
+        self._call_sites.pop(method, None)
+
+    def update(self, removed_methods, added_methods, affected):
+        """
+            Incrementally update the call graph: remove and add methods, then re-resolve
+            the call sites that target (or are contained in) the affected classes
+        """
+        self._invalidate()
+        added_methods = set(added_methods)
+
+        for method in removed_methods:
+            self._remove_method(method)
+
+        for method in added_methods:
+            self._add_method(method)
+
+        sites = set()
+        for cls_name in affected:
+            sites |= self._invokes_by_class.get(cls_name, set())
+
+            # calls from the affected classes may be dispatched differently
+            if cls_name in self.project.classes:
+                for method in self.project.classes[cls_name].methods:
+                    for block in method.blocks:
+                        for stmt in block.statements:
+                            if stmt in self._invoke_targets:
+                                sites.add((method, block, stmt))
+
+        for container_m, block, invoke in sites:
+            if container_m in added_methods:
+                continue
+
+            self._remove_invoke(container_m, block, invoke)
+            self._add_invoke(container_m, block, invoke)
 
     def get_call_sites(self, method, target):
         return self._call_sites[method][target]
 
+    def _call_site_positions(self, method):
+        # (block index, statement index) of each invoke expression in the method
+        positions = {}
+        for block_index, block in enumerate(method.blocks):
+            for stmt_index, stmt in enumerate(block.statements):
+                if is_invoke(stmt):
+                    invoke_expr = stmt.invoke_expr if hasattr(stmt, 'invoke_expr') else stmt.right_op
+                    positions[id(invoke_expr)] = (block_index, stmt_index)
+        return positions
+
+    def export(self, path, call_sites=False):
+        """
+            Write the call graph to a compact archive (see callgraph_archive),
+            which can be queried without loading it in memory
+
+            :param path: output file
+            :param call_sites: also store the (block index, statement index) of the call sites
+        """
+        with CallGraphWriter(path, call_sites=call_sites) as writer:
+            for method in self.graph.nodes:
+                src_key = get_method_key(method)
+                writer.add_node(src_key)
+                positions = self._call_site_positions(method) if call_sites else None
+
+                for target in self.graph.successors(method):
+                    sites = ()
+                    if call_sites:
+                        sites = [positions[id(e)] for e in self._call_sites[method][target] if id(e) in positions]
+                    writer.add_edge(src_key, get_method_key(target), sites)
+
+    @staticmethod
+    def load(path):
+        """
+            Memory-map a call graph archive written by export()
+        """
+        return CallGraphArchive(path)
+
     def next(self, method):
         return self.graph.successors(method)
 
     def prev(self, method):
         return self.graph.predecessors(method)
+
+    def _invalidate(self):
+        self._sccs = None
+        self._scc_index = None
+        self._reachability = None
+
+    def sccs(self):
+        """
+            Strongly connected components of the call graph, in reverse
+            topological order (callees before their callers)
+        """
+        if self._sccs is None:
+            condensation = networkx.condensation(self.graph)
+            order = reversed(list(networkx.topological_sort(condensation)))
+            self._sccs = [frozenset(condensation.nodes[n]['members']) for n in order]
+            self._scc_index = dict((m, i) for i, scc in enumerate(self._sccs) for m in scc)
+
+        return self._sccs
+
+    def scc(self, method):
+        """
+            The strongly connected component containing method
+        """
+        self.sccs()
+        return self._sccs[self._scc_index[method]]
+
+    def reachability(self):
+        """
+            Reachability index of the call graph (see reachability.ReachabilityIndex)
+        """
+        if self._reachability is None:
+            self._reachability = ReachabilityIndex(self)
+
+        return self._reachability
+
+    def can_reach(self, src, dst):
+        return self.reachability().can_reach(src, dst)
+
+    def is_recursive(self, scc):
+        """
+            An SCC is recursive if it has more than one method or a self-call
+        """
+        if len(scc) > 1:
+            return True
+
+        method = next(iter(scc))
+        return self.graph.has_edge(method, method)
+
+    def schedule(self, analysis, bottom_up=True, max_iters=None):
+        """
+            Run a per-method analysis over the whole call graph, one SCC at a time.
+            Bottom-up visits callees before callers, top-down the opposite.
+
+            :param analysis: callback taking a method and returning True if its
+                             result changed (only meaningful in recursive SCCs)
+            :param bottom_up: visit order
+            :param max_iters: max number of rounds for a recursive SCC
+        """
+        sccs = self.sccs() if bottom_up else reversed(self.sccs())
+
+        for scc in sccs:
+            if not self.is_recursive(scc):
+                analysis(next(iter(scc)))
+                continue
+
+            # iterate the SCC until a fixed point is reached
+            worklist = list(scc)
+            queued = set(worklist)
+            rounds = dict((m, 0) for m in scc)
+
+            while worklist:
+                method = worklist.pop()
+                queued.discard(method)
+                rounds[method] += 1
+
+                if not analysis(method):
+                    continue
+
+                if max_iters is not None and rounds[method] >= max_iters:
+                    log.warning('Max iterations reached in recursive SCC')
+                    continue
+
+                # dependents of the method inside the SCC need to be re-analyzed
+                dependents = self.prev(method) if bottom_up else self.next(method)
+                for dep in dependents:
+                    if dep in scc and dep not in queued:
+                        worklist.append(dep)
+                        queued.add(dep)
@@ -0,0 +1,346 @@
+"""
+    Compact on-disk call graphs
+
+    Layout (little endian, sections aligned to 8 bytes):
+        header
+        string data        method keys, utf-8, 'class|name|param,param'
+        string offsets     uint64[n_nodes + 1]
+        sorted ids         uint32[n_nodes], node IDs sorted by key (for lookups)
+        forward offsets    uint32[n_nodes + 1]   (CSR over the edges, by source)
+        forward targets    uint32[n_edges]
+        reverse offsets    uint32[n_nodes + 1]   (CSR over the edges, by target)
+        reverse sources    uint32[n_edges]
+        reverse edge ids   uint32[n_edges], index of each reverse edge in the forward arrays
+        site offsets       uint32[n_edges + 1]   (only with call sites)
+        sites              uint32[2 * n_sites], (block index, statement index) pairs
+"""
+
+import os
+import sys
+import mmap
+import struct
+import logging
+
+from array import array
+from bisect import bisect_left
+
+log = logging.getLogger('turi.CallGraphArchive')
+
+
+MAGIC = b'TURICG01'
+FLAG_CALL_SITES = 1
+
+# magic, flags, n_nodes, n_edges, n_sites, then the offsets of the 10 sections
+_HEADER = struct.Struct('<8sIIQQ10Q')
+
+_SECTIONS = ('strings', 'string_offsets', 'sorted_ids', 'fwd_offsets', 'fwd_targets',
+             'rev_offsets', 'rev_sources', 'rev_edge_ids', 'site_offsets', 'sites')
+
+
+class CallGraphArchiveError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+def encode_method_key(key):
+    cls_name, method_name, params = key
+    return '{}|{}|{}'.format(cls_name, method_name, ','.join(params))
+
+
+def decode_method_key(s):
+    cls_name, method_name, params = s.split('|')
+    return cls_name, method_name, tuple(p for p in params.split(',') if p)
+
+
+def _to_le(arr):
+    if sys.byteorder != 'little':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+class CallGraphWriter:
+    """
+        Streaming writer: method keys are written to disk as soon as they are
+        added, only the (integer) edge arrays are kept in memory until close()
+    """
+
+    def __init__(self, path, call_sites=False):
+        self.path = path
+        self.call_sites = call_sites
+        self._fp = open(path, 'wb')
+        self._fp.write(b'\0' * _HEADER.size)
+
+        self._ids = {}
+        self._string_offsets = array('Q', [0])
+        self._edge_src = array('I')
+        self._edge_dst = array('I')
+        self._edge_sites = []
+
+    def add_node(self, key):
+        """
+            Add a method key, returns its ID
+        """
+        if key in self._ids:
+            return self._ids[key]
+
+        node_id = len(self._ids)
+        self._ids[key] = node_id
+
+        data = encode_method_key(key).encode('utf-8')
+        self._fp.write(data)
+        self._string_offsets.append(self._string_offsets[-1] + len(data))
+
+        return node_id
+
+    def add_edge(self, src_key, dst_key, sites=()):
+        """
+            Add a call edge, with the (block index, statement index) of its call sites
+        """
+        self._edge_src.append(self.add_node(src_key))
+        self._edge_dst.append(self.add_node(dst_key))
+        if self.call_sites:
+            self._edge_sites.append(sites)
+
+    def _align(self):
+        pad = -self._fp.tell() % 8
+        self._fp.write(b'\0' * pad)
+
+    def _write_section(self, arr):
+        self._align()
+        offset = self._fp.tell()
+        self._fp.write(_to_le(arr))
+        return offset
+
+    def close(self):
+        n_nodes = len(self._ids)
+        n_edges = len(self._edge_src)
+        offsets = {'strings': _HEADER.size}
+
+        offsets['string_offsets'] = self._write_section(self._string_offsets)
+
+        # lookups by key go through a binary search over the sorted keys
+        keys = sorted(self._ids.items(), key=lambda item: encode_method_key(item[0]))
+        offsets['sorted_ids'] = self._write_section(array('I', (i for _, i in keys)))
+        del keys
+
+        # forward CSR: edges sorted by source
+        order = sorted(range(n_edges), key=lambda e: (self._edge_src[e], self._edge_dst[e]))
+        fwd_offsets = array('I', [0] * (n_nodes + 1))
+        for e in order:
+            fwd_offsets[self._edge_src[e] + 1] += 1
+        for i in range(n_nodes):
+            fwd_offsets[i + 1] += fwd_offsets[i]
+
+        offsets['fwd_offsets'] = self._write_section(fwd_offsets)
+        offsets['fwd_targets'] = self._write_section(array('I', (self._edge_dst[e] for e in order)))
+
+        # reverse CSR, pointing back to the forward edge indexes
+        rev_order = sorted(range(n_edges), key=lambda i: (self._edge_dst[order[i]], self._edge_src[order[i]]))
+        rev_offsets = array('I', [0] * (n_nodes + 1))
+        for i in rev_order:
+            rev_offsets[self._edge_dst[order[i]] + 1] += 1
+        for i in range(n_nodes):
+            rev_offsets[i + 1] += rev_offsets[i]
+
+        offsets['rev_offsets'] = self._write_section(rev_offsets)
+        offsets['rev_sources'] = self._write_section(array('I', (self._edge_src[order[i]] for i in rev_order)))
+        offsets['rev_edge_ids'] = self._write_section(array('I', rev_order))
+
+        n_sites = 0
+        flags = 0
+        if self.call_sites:
+            flags |= FLAG_CALL_SITES
+            site_offsets = array('I', [0])
+            sites = array('I')
+            for e in order:
+                for block_index, stmt_index in self._edge_sites[e]:
+                    sites.append(block_index)
+                    sites.append(stmt_index)
+                site_offsets.append(len(sites) // 2)
+            n_sites = len(sites) // 2
+            offsets['site_offsets'] = self._write_section(site_offsets)
+            offsets['sites'] = self._write_section(sites)
+        else:
+            offsets['site_offsets'] = 0
+            offsets['sites'] = 0
+
+        self._fp.seek(0)
+        self._fp.write(_HEADER.pack(MAGIC, flags, n_nodes, n_edges, n_sites,
+                                    *[offsets[s] for s in _SECTIONS]))
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._fp.close()
+
+
+class CallGraphArchive:
+    """
+        Memory-mapped call graph archive: queries read the arrays in place,
+        without materializing the graph
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fp = open(path, 'rb')
+        if os.fstat(self._fp.fileno()).st_size < _HEADER.size:
+            raise CallGraphArchiveError('Not a call graph archive')
+        self._mmap = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        header = _HEADER.unpack_from(self._mmap, 0)
+        if header[0] != MAGIC:
+            raise CallGraphArchiveError('Not a call graph archive')
+
+        self.flags, self.num_nodes, self.num_edges, self.num_sites = header[1:5]
+        self._offsets = dict(zip(_SECTIONS, header[5:]))
+
+        n = self.num_nodes
+        m = self.num_edges
+        self._string_offsets = self._array('string_offsets', 'Q', n + 1)
+        self._sorted_ids = self._array('sorted_ids', 'I', n)
+        self._fwd_offsets = self._array('fwd_offsets', 'I', n + 1)
+        self._fwd_targets = self._array('fwd_targets', 'I', m)
+        self._rev_offsets = self._array('rev_offsets', 'I', n + 1)
+        self._rev_sources = self._array('rev_sources', 'I', m)
+        self._rev_edge_ids = self._array('rev_edge_ids', 'I', m)
+
+        if self.has_call_sites:
+            self._site_offsets = self._array('site_offsets', 'I', m + 1)
+            self._sites = self._array('sites', 'I', 2 * self.num_sites)
+
+    def _array(self, section, typecode, length):
+        start = self._offsets[section]
+        size = array(typecode).itemsize * length
+        if sys.byteorder == 'little':
+            return self._view[start:start + size].cast(typecode)
+
+        # big endian hosts pay for a copy
+        arr = array(typecode)
+        arr.frombytes(self._view[start:start + size])
+        arr.byteswap()
+        return arr
+
+    @property
+    def has_call_sites(self):
+        return bool(self.flags & FLAG_CALL_SITES)
+
+    def __len__(self):
+        return self.num_nodes
+
+    def _key_string(self, node_id):
+        start = self._offsets['strings'] + self._string_offsets[node_id]
+        end = self._offsets['strings'] + self._string_offsets[node_id + 1]
+        return bytes(self._view[start:end]).decode('utf-8')
+
+    def key(self, node_id):
+        return decode_method_key(self._key_string(node_id))
+
+    def node_id(self, key):
+        """
+            ID of a method key, binary search over the sorted keys
+        """
+        target = encode_method_key(key)
+        lo, hi = 0, self.num_nodes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_string(self._sorted_ids[mid]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo < self.num_nodes and self._key_string(self._sorted_ids[lo]) == target:
+            return self._sorted_ids[lo]
+
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self.node_id(key)
+            return True
+        except KeyError:
+            return False
+
+    def successor_ids(self, node_id):
+        return self._fwd_targets[self._fwd_offsets[node_id]:self._fwd_offsets[node_id + 1]].tolist()
+
+    def predecessor_ids(self, node_id):
+        return self._rev_sources[self._rev_offsets[node_id]:self._rev_offsets[node_id + 1]].tolist()
+
+    def next(self, key):
+        return [self.key(i) for i in self.successor_ids(self.node_id(key))]
+
+    def prev(self, key):
+        return [self.key(i) for i in self.predecessor_ids(self.node_id(key))]
+
+    def _edge_index(self, src_id, dst_id):
+        start = self._fwd_offsets[src_id]
+        end = self._fwd_offsets[src_id + 1]
+        # targets of a node are sorted
+        i = bisect_left(self._fwd_targets, dst_id, start, end)
+        if i < end and self._fwd_targets[i] == dst_id:
+            return i
+        return None
+
+    def has_edge(self, src_key, dst_key):
+        return self._edge_index(self.node_id(src_key), self.node_id(dst_key)) is not None
+
+    def get_call_sites(self, src_key, dst_key):
+        """
+            (block index, statement index) of the calls from src to dst
+        """
+        if not self.has_call_sites:
+            raise CallGraphArchiveError('Archive written without call sites')
+
+        edge = self._edge_index(self.node_id(src_key), self.node_id(dst_key))
+        if edge is None:
+            return []
+
+        start = self._site_offsets[edge]
+        end = self._site_offsets[edge + 1]
+        return [(self._sites[2 * i], self._sites[2 * i + 1]) for i in range(start, end)]
+
+    def edges(self):
+        for src_id in range(self.num_nodes):
+            src_key = self.key(src_id)
+            for dst_id in self.successor_ids(src_id):
+                yield src_key, self.key(dst_id)
+
+    def to_networkx(self):
+        """
+            Materialize the archive as a graph of method keys
+        """
+        import networkx
+        graph = networkx.DiGraph()
+        keys = [self.key(i) for i in range(self.num_nodes)]
+        graph.add_nodes_from(keys)
+        for src_id in range(self.num_nodes):
+            for dst_id in self.successor_ids(src_id):
+                graph.add_edge(keys[src_id], keys[dst_id])
+        return graph
+
+    def close(self):
+        # release the exported buffers before closing the map
+        for name in ('_string_offsets', '_sorted_ids', '_fwd_offsets', '_fwd_targets',
+                     '_rev_offsets', '_rev_sources', '_rev_edge_ids', '_site_offsets', '_sites'):
+            arr = getattr(self, name, None)
+            if isinstance(arr, memoryview):
+                arr.release()
+        self._view.release()
+        self._mmap.close()
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
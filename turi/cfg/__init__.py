@@ -2,3 +2,4 @@ from .cfg_base import CFGBase
 from .cfg_full import CFGFull
 from .cfg_methods import CFGMethod, get_method_CFGs
 
+from .supergraph import SuperGraph, CallSite, ReturnSite
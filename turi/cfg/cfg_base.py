@@ -1,10 +1,10 @@
 import logging
-import networkx
 
 from ..statements import is_condition, is_switch, is_jump, is_invoke, is_ret
+from .paths import PathQuery
 
-logging.basicConfig()
-log = logging.getLogger("CFGBase")
+log = logging.getLogger("turi.CFGBase")
+# unknown statements are reported at debug level, and there are many
 log.setLevel(logging.WARN)
 
 
@@ -35,8 +35,23 @@ class CFGBase:
     def get_prev_blocks(self, block):
         return self.graph.predecessors(block)
 
-    def get_paths(self, source, sink):
-        return networkx.all_simple_paths(self.graph, source, sink)
+    def path_query(self, source, sink):
+        """
+            Path queries (counting, shortest paths, enumeration) restricted to the source-sink chop
+        """
+        return PathQuery(self.graph, source, sink)
+
+    def get_paths(self, source, sink, max_length=None, max_paths=PathQuery.MAX_PATHS, timeout=PathQuery.TIMEOUT):
+        """
+            Lazily stream the simple paths from source to sink, bounded in length (edges),
+            number of paths and time (seconds). By default at most PathQuery.MAX_PATHS
+            paths in PathQuery.TIMEOUT seconds: pass None to lift a bound, and use
+            path_query() to know whether the paths were truncated.
+        """
+        return self.path_query(source, sink).paths(max_length=max_length, max_paths=max_paths, timeout=timeout)
+
+    def _add_edge(self, src, dst):
+        self.graph.add_edge(src, dst)
 
     def _add_method(self, method):
         link_previous_block = False
@@ -46,7 +61,7 @@ class CFGBase:
             self.graph.add_node(block)
 
             if link_previous_block:
-                self.graph.add_edge(previous_block, block)
+                self._add_edge(previous_block, block)
 
             link_previous_block = False
             previous_block = None
@@ -71,14 +86,14 @@ class CFGBase:
 
             for excep_pred in method.exceptional_preds[block]:
                 self.graph.add_node(excep_pred)
-                self.graph.add_edge(excep_pred, block)
+                self._add_edge(excep_pred, block)
 
     def _add_jump(self, method, block, stmt):
         target_block_label = stmt.target
         target_block = method.block_by_label[target_block_label]
 
         self.graph.add_node(target_block)
-        self.graph.add_edge(block, target_block)
+        self._add_edge(block, target_block)
 
     def _add_switch(self, method, block, stmt):
         # Switch default target
@@ -86,14 +101,14 @@ class CFGBase:
         target_block = method.block_by_label[target_block_label]
 
         self.graph.add_node(target_block)
-        self.graph.add_edge(block, target_block)
+        self._add_edge(block, target_block)
 
         # Switch targets
         for target_block_label in stmt.lookup_values_and_targets.values():
             target_block = method.block_by_label[target_block_label]
 
             self.graph.add_node(target_block)
-            self.graph.add_edge(block, target_block)
+            self._add_edge(block, target_block)
 
     def _link_to_next(self, block):
         '''
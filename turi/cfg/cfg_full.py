@@ -1,13 +1,13 @@
 import networkx
 import logging
 
+from collections import defaultdict
+
 from ..cfg import CFGBase
 from ..statements import is_ret
-from ..hierarchy import NoConcreteDispatch
+from ..hierarchy import NoConcreteDispatch, NATIVE, ABSTRACT
 
-logging.basicConfig()
-log = logging.getLogger("CFGFull")
-log.setLevel(logging.DEBUG)
+log = logging.getLogger("turi.CFGFull")
 
 
 class CFGFull(CFGBase):
@@ -20,13 +20,21 @@ class CFGFull(CFGBase):
         self.project = project
         self.graph = networkx.DiGraph()
         self.ret_edges = ret_edges
+        # bookkeeping for incremental updates
+        self._edge_refs = defaultdict(int)
+        self._invoke_edges = {}
+        self._invoke_targets = {}
+        self._invokes_by_class = defaultdict(set)
+        # method -> blocks ending with a return
+        self._ret_blocks = {}
 
         self.build()
 
     def build(self):
-        for cls_name, cls in self.project.classes.items():
-            for method in cls.methods:
-                self._add_method(method)
+        with self.project.instrumentation.phase('cfgfull.build'):
+            for cls_name, cls in self.project.classes.items():
+                for method in cls.methods:
+                    self._add_method(method)
 
     def _add_invoke(self, container_m, block, invoke):
         if hasattr(invoke, 'invoke_expr'):
@@ -35,20 +43,40 @@ class CFGFull(CFGBase):
         else:
             invoke_expr = invoke.right_op
 
+        # the call site has to be re-resolved if its class changes
+        self._invokes_by_class[invoke_expr.class_name].add((container_m, block, invoke))
+        edges = self._invoke_edges.setdefault(invoke, [])
+        targets = self._invoke_targets[invoke] = self._resolve_targets(container_m, invoke_expr)
+
+        for target in targets:
+            self.graph.add_node(target.blocks[0])
+            self._add_edge(block, target.blocks[0])
+            edges.append((block, target.blocks[0]))
+
+            if self.ret_edges:
+                # add an edge for returning after call
+                ret_blocks = self._get_method_ret_blocks(target)
+                for ret_block in ret_blocks:
+                    self.graph.add_node(ret_block)
+                    self._add_edge(ret_block, block)
+                    edges.append((ret_block, block))
+
+    def _resolve_targets(self, container_m, invoke_expr):
+        """
+            Project methods (with a body) invoke_expr may call
+        """
         cls_name = invoke_expr.class_name
-        method_name = invoke_expr.method_name
-        method_params = invoke_expr.method_params
 
         if cls_name not in self.project.classes:
             # external classes are not supported
-            return
+            return []
 
         try:
-            method = self.project.methods[(cls_name, method_name, method_params)]
+            method = self.project.methods[(cls_name, invoke_expr.method_name, invoke_expr.method_params)]
         except KeyError as e:
             # TODO should we add a dummy node for "external" methods?
             log.warning("Cannot handle call to external method")
-            return
+            return []
 
         try:
             targets = self.project.hierarchy().resolve_invoke(invoke_expr, method, container_m)
@@ -56,30 +84,108 @@ class CFGFull(CFGBase):
             targets = []
             log.warning('Could not resolve concrete dispatch. External method?')
 
+        hierarchy = self.project.hierarchy()
+        res = []
         for target in targets:
-            if 'NATIVE' in target.attrs or 'ABSTRACT' in target.attrs:
+            if hierarchy.flags(target) & (NATIVE | ABSTRACT):
                 # TODO should we use a dummy node for native methods?
                 continue
 
             if target.class_name in self.project.classes:
-                self.graph.add_node(target.blocks[0])
-                self.graph.add_edge(block, target.blocks[0])
+                res.append(target)
+
+        return res
+
+    def call_targets(self, invoke):
+        """
+            Methods the call edges of an invoke statement lead to
+        """
+        return self._invoke_targets.get(invoke, ())
+
+    def _add_edge(self, src, dst):
+        # the same edge can be added by several statements
+        self._edge_refs[(src, dst)] += 1
+        self.graph.add_edge(src, dst)
+
+    def _remove_edge(self, src, dst):
+        edge = (src, dst)
+        if edge not in self._edge_refs:
+            # one of the nodes has been removed already
+            return
+
+        self._edge_refs[edge] -= 1
+        if self._edge_refs[edge] == 0:
+            del self._edge_refs[edge]
+            self.graph.remove_edge(src, dst)
 
-                if self.ret_edges:
-                    # add an edge for returning after call
-                    ret_blocks = self._get_method_ret_blocks(target)
-                    for ret_block in ret_blocks:
-                        self.graph.add_node(ret_block)
-                        self.graph.add_edge(ret_block, block)
+    def _remove_invoke(self, container_m, block, invoke):
+        self._invoke_targets.pop(invoke, None)
+        for src, dst in self._invoke_edges.pop(invoke, []):
+            self._remove_edge(src, dst)
+
+    def _remove_method(self, method):
+        for block in method.blocks:
+            for stmt in block.statements:
+                if stmt in self._invoke_edges:
+                    self._remove_invoke(method, block, stmt)
+                    invoke_expr = stmt.invoke_expr if hasattr(stmt, 'invoke_expr') else stmt.right_op
+                    self._invokes_by_class[invoke_expr.class_name].discard((method, block, stmt))
+
+        self._ret_blocks.pop(method, None)
+        for block in method.blocks:
+            if block not in self.graph:
+                continue
+
+            for edge in list(self.graph.in_edges(block)) + list(self.graph.out_edges(block)):
+                self._edge_refs.pop(edge, None)
+            self.graph.remove_node(block)
+
+    def update(self, removed_methods, added_methods, affected):
+        """
+            Incrementally update the CFG: remove and add methods, then re-resolve
+            the call sites that target (or are contained in) the affected classes
+        """
+        removed_methods = set(removed_methods)
+        added_methods = set(added_methods)
+
+        for method in removed_methods:
+            self._remove_method(method)
+
+        for method in added_methods:
+            self._add_method(method)
+
+        sites = set()
+        for cls_name in affected:
+            sites |= self._invokes_by_class.get(cls_name, set())
+
+            # calls from the affected classes may be dispatched differently
+            if cls_name in self.project.classes:
+                for method in self.project.classes[cls_name].methods:
+                    for block in method.blocks:
+                        for stmt in block.statements:
+                            if stmt in self._invoke_edges:
+                                sites.add((method, block, stmt))
+
+        for container_m, block, invoke in sites:
+            if container_m in added_methods:
+                continue
+
+            self._remove_invoke(container_m, block, invoke)
+            self._add_invoke(container_m, block, invoke)
 
     def _get_method_ret_blocks(self, method):
-        ret_blocks = set()
+        # computed once per method, not once per call site
+        if method in self._ret_blocks:
+            return self._ret_blocks[method]
+
+        ret_blocks = []
 
         for block in method.blocks:
             for stmt in block.statements:
                 # Return statement
                 if is_ret(stmt):
-                    ret_blocks.add(block)
+                    ret_blocks.append(block)
                     break
 
-        return ret_blocks
+        self._ret_blocks[method] = tuple(ret_blocks)
+        return self._ret_blocks[method]
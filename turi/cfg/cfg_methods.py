@@ -3,10 +3,10 @@ import logging
 
 from ..cfg import CFGBase
 from ..statements import is_condition, is_switch, is_jump
+from .dominators import UNDEFINED, immediate_dominators, tree_intervals, \
+    add_virtual_exit, control_dependences
 
-logging.basicConfig()
-log = logging.getLogger("CFGMethods")
-log.setLevel(logging.DEBUG)
+log = logging.getLogger("turi.CFGMethods")
 
 
 class CFGMethod(CFGBase):
@@ -21,6 +21,16 @@ class CFGMethod(CFGBase):
         self.method = method
         self.graph = networkx.DiGraph()
 
+        # dominance data, computed lazily over interned block IDs
+        self._blocks = None
+        self._block_ids = None
+        self._idom = None
+        self._dom_intervals = None
+        self._ipdom = None
+        self._pdom_intervals = None
+        self._dependents = None
+        self._controllers = None
+
         self.build()
 
     def build(self):
@@ -32,7 +42,7 @@ class CFGMethod(CFGBase):
             self.graph.add_node(block)
 
             if link_previous_block:
-                self.graph.add_edge(previous_block, block)
+                self._add_edge(previous_block, block)
 
             link_previous_block = False
             previous_block = None
@@ -55,7 +65,135 @@ class CFGMethod(CFGBase):
 
             for excep_pred in self.method.exceptional_preds[block]:
                 self.graph.add_node(excep_pred)
-                self.graph.add_edge(excep_pred, block)
+                self._add_edge(excep_pred, block)
+
+    def _intern_blocks(self):
+        if self._block_ids is not None:
+            return
+
+        # the entry block gets ID 0
+        self._blocks = list(self.method.blocks)
+        method_blocks = set(self._blocks)
+        self._blocks.extend(b for b in self.graph.nodes() if b not in method_blocks)
+        self._block_ids = dict((b, i) for i, b in enumerate(self._blocks))
+
+        self._succs = [[self._block_ids[s] for s in self.graph.successors(b)] for b in self._blocks]
+        self._preds = [[self._block_ids[p] for p in self.graph.predecessors(b)] for b in self._blocks]
+
+    def _compute_dominators(self):
+        if self._idom is not None:
+            return
+
+        self._intern_blocks()
+        if not self._blocks:
+            self._idom = []
+            self._dom_intervals = ([], [])
+            return
+
+        self._idom = immediate_dominators(0, self._succs, self._preds)
+        self._dom_intervals = tree_intervals(0, self._idom)
+
+    def _compute_post_dominators(self):
+        if self._ipdom is not None:
+            return
+
+        self._intern_blocks()
+        exit_node, succs, preds = add_virtual_exit(self._succs, self._preds)
+        # post-dominators are the dominators of the reversed graph
+        self._ipdom = immediate_dominators(exit_node, preds, succs)
+        self._pdom_intervals = tree_intervals(exit_node, self._ipdom)
+
+        self._dependents = [set(d) for d in control_dependences(succs, self._ipdom, exit_node)]
+        self._controllers = [set() for _ in self._blocks]
+        for node, deps in enumerate(self._dependents):
+            for dep in deps:
+                self._controllers[dep].add(node)
+
+    def _tree(self, idom, root):
+        tree = networkx.DiGraph()
+        tree.add_nodes_from(self._blocks)
+        for node, parent in enumerate(idom[:len(self._blocks)]):
+            if node != root and parent != UNDEFINED and parent < len(self._blocks):
+                tree.add_edge(self._blocks[parent], self._blocks[node])
+        return tree
+
+    def immediate_dominator(self, block):
+        """
+            The immediate dominator of block, None for the entry and unreachable blocks
+        """
+        self._compute_dominators()
+        node = self._block_ids[block]
+        idom = self._idom[node]
+        if idom == UNDEFINED or idom == node:
+            return None
+        return self._blocks[idom]
+
+    def immediate_post_dominator(self, block):
+        """
+            The immediate post-dominator of block, None if it is the (virtual) exit
+        """
+        self._compute_post_dominators()
+        ipdom = self._ipdom[self._block_ids[block]]
+        if ipdom == UNDEFINED or ipdom == len(self._blocks):
+            return None
+        return self._blocks[ipdom]
+
+    def dominates(self, block_a, block_b):
+        self._compute_dominators()
+        a = self._block_ids[block_a]
+        b = self._block_ids[block_b]
+        pre, post = self._dom_intervals
+        if pre[a] == UNDEFINED or pre[b] == UNDEFINED:
+            return False
+        return pre[a] <= pre[b] and post[b] <= post[a]
+
+    def post_dominates(self, block_a, block_b):
+        self._compute_post_dominators()
+        a = self._block_ids[block_a]
+        b = self._block_ids[block_b]
+        pre, post = self._pdom_intervals
+        return pre[a] <= pre[b] and post[b] <= post[a]
+
+    def dominator_tree(self):
+        """
+            Dominator tree: an edge goes from each immediate dominator to the blocks it dominates
+        """
+        self._compute_dominators()
+        return self._tree(self._idom, 0)
+
+    def post_dominator_tree(self):
+        """
+            Post-dominator tree, the virtual exit node is left out
+        """
+        self._compute_post_dominators()
+        return self._tree(self._ipdom, len(self._blocks))
+
+    def control_dependence_graph(self):
+        """
+            Control-dependence graph: an edge goes from a branching block to
+            each block whose execution it decides
+        """
+        self._compute_post_dominators()
+        cdg = networkx.DiGraph()
+        cdg.add_nodes_from(self._blocks)
+        for node, deps in enumerate(self._dependents):
+            for dep in deps:
+                cdg.add_edge(self._blocks[node], self._blocks[dep])
+        return cdg
+
+    def control_dependents(self, block):
+        """
+            Blocks control dependent on block
+        """
+        self._compute_post_dominators()
+        return [self._blocks[d] for d in self._dependents[self._block_ids[block]]]
+
+    def controlling_blocks(self, block):
+        """
+            Blocks block is control dependent on
+        """
+        self._compute_post_dominators()
+        return [self._blocks[c] for c in self._controllers[self._block_ids[block]]]
 
 
 def get_method_CFGs(classes):
@@ -0,0 +1,165 @@
+"""
+    Dominance utilities over interned node IDs
+
+    Nodes are the integers 0..n-1, edges are given as adjacency lists.
+    Immediate dominators are computed with the Cooper-Harvey-Kennedy
+    iterative algorithm ("A Simple, Fast Dominance Algorithm").
+"""
+
+UNDEFINED = -1
+
+
+def postorder(entry, succs):
+    """
+        Iterative DFS postorder of the nodes reachable from entry
+    """
+    visited = [False] * len(succs)
+    visited[entry] = True
+    order = []
+    stack = [(entry, iter(succs[entry]))]
+
+    while stack:
+        node, it = stack[-1]
+        for succ in it:
+            if not visited[succ]:
+                visited[succ] = True
+                stack.append((succ, iter(succs[succ])))
+                break
+        else:
+            stack.pop()
+            order.append(node)
+
+    return order
+
+
+def immediate_dominators(entry, succs, preds):
+    """
+        Returns the list of immediate dominators, indexed by node ID.
+        The entry is its own immediate dominator, unreachable nodes are UNDEFINED.
+    """
+    order = postorder(entry, succs)
+    po_num = [UNDEFINED] * len(succs)
+    for i, node in enumerate(order):
+        po_num[node] = i
+
+    idom = [UNDEFINED] * len(succs)
+    idom[entry] = entry
+    rpo = order[-2::-1]
+
+    changed = True
+    while changed:
+        changed = False
+        for node in rpo:
+            new_idom = UNDEFINED
+            for pred in preds[node]:
+                if idom[pred] == UNDEFINED:
+                    continue
+
+                if new_idom == UNDEFINED:
+                    new_idom = pred
+                    continue
+
+                # intersect the two dominator chains
+                a, b = pred, new_idom
+                while a != b:
+                    while po_num[a] < po_num[b]:
+                        a = idom[a]
+                    while po_num[b] < po_num[a]:
+                        b = idom[b]
+                new_idom = a
+
+            if idom[node] != new_idom:
+                idom[node] = new_idom
+                changed = True
+
+    return idom
+
+
+def tree_intervals(root, idom):
+    """
+        Pre/post numbering of the dominator tree:
+        a dominates b iff pre[a] <= pre[b] and post[b] <= post[a]
+    """
+    children = [[] for _ in idom]
+    for node, parent in enumerate(idom):
+        if parent != UNDEFINED and node != root:
+            children[parent].append(node)
+
+    pre = [UNDEFINED] * len(idom)
+    post = [UNDEFINED] * len(idom)
+    counter = 0
+    stack = [(root, False)]
+
+    while stack:
+        node, done = stack.pop()
+        if done:
+            post[node] = counter
+            counter += 1
+            continue
+
+        pre[node] = counter
+        counter += 1
+        stack.append((node, True))
+        for child in children[node]:
+            stack.append((child, False))
+
+    return pre, post
+
+
+def add_virtual_exit(succs, preds):
+    """
+        Extend the graph with a virtual exit node (returned) reached from every node
+        without successors. Nodes that cannot reach any exit (infinite loops)
+        get an extra edge to the virtual exit as well, so that every node is
+        post-dominated by it.
+    """
+    n = len(succs)
+    exit_node = n
+    succs = [list(s) for s in succs] + [[]]
+    preds = [list(p) for p in preds] + [[]]
+
+    for node in range(n):
+        if not succs[node]:
+            succs[node].append(exit_node)
+            preds[exit_node].append(node)
+
+    reaches_exit = [False] * (n + 1)
+
+    def _mark(start):
+        reaches_exit[start] = True
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for pred in preds[node]:
+                if not reaches_exit[pred]:
+                    reaches_exit[pred] = True
+                    stack.append(pred)
+
+    _mark(exit_node)
+
+    # connect the last node of each region that never reaches an exit
+    for node in range(n - 1, -1, -1):
+        if not reaches_exit[node]:
+            succs[node].append(exit_node)
+            preds[exit_node].append(node)
+            _mark(node)
+
+    return exit_node, succs, preds
+
+
+def control_dependences(succs, ipdom, exit_node):
+    """
+        Control dependences (Ferrante et al.) from the post-dominator tree.
+        Returns, for each node, the list of nodes control dependent on it.
+    """
+    dependents = [[] for _ in range(exit_node)]
+
+    for node in range(exit_node):
+        stop = ipdom[node]
+        for succ in succs[node]:
+            runner = succ
+            while runner != stop and runner != exit_node and runner != UNDEFINED:
+                dependents[node].append(runner)
+                runner = ipdom[runner]
+
+    return dependents
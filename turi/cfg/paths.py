@@ -0,0 +1,291 @@
+"""
+    Path queries between two nodes of a graph
+
+    Every query is restricted to the chop of (source, sink): the nodes reachable
+    from the source that can reach the sink. Paths through loops are collapsed
+    by condensing the strongly connected components of the chop.
+"""
+
+import time
+import heapq
+import networkx
+
+from itertools import count
+from collections import deque
+
+
+def forward_reachable(graph, sources, allowed=None):
+    """
+        Nodes reachable from sources (included), optionally only through allowed nodes
+    """
+    seen = set(s for s in sources if allowed is None or s in allowed)
+    queue = deque(seen)
+    while queue:
+        node = queue.popleft()
+        for succ in graph.successors(node):
+            if succ not in seen and (allowed is None or succ in allowed):
+                seen.add(succ)
+                queue.append(succ)
+    return seen
+
+
+def backward_reachable(graph, sinks, allowed=None):
+    """
+        Nodes that can reach sinks (included), optionally only through allowed nodes
+    """
+    seen = set(s for s in sinks if allowed is None or s in allowed)
+    queue = deque(seen)
+    while queue:
+        node = queue.popleft()
+        for pred in graph.predecessors(node):
+            if pred not in seen and (allowed is None or pred in allowed):
+                seen.add(pred)
+                queue.append(pred)
+    return seen
+
+
+def chop(graph, sources, sinks):
+    """
+        Nodes on some path from sources to sinks
+    """
+    forward = forward_reachable(graph, sources)
+    return backward_reachable(graph, [s for s in sinks if s in forward], allowed=forward)
+
+
+class PathQuery:
+    """
+        Paths from source to sink in graph.
+        Enumerations stop after timeout seconds, setting truncated.
+    """
+    CHECK_EVERY = 1024
+    # bounds of CFGBase.get_paths, the number of paths can be exponential
+    MAX_PATHS = 10000
+    TIMEOUT = 30
+
+    def __init__(self, graph, source, sink):
+        self.graph = graph
+        self.source = source
+        self.sink = sink
+        self.truncated = False
+        self._chop = None
+        self._dist = None
+        self._condensed = None
+
+    @property
+    def nodes(self):
+        """
+            The chop: nodes on some path from source to sink
+        """
+        if self._chop is None:
+            if self.source in self.graph and self.sink in self.graph:
+                self._chop = chop(self.graph, [self.source], [self.sink])
+            else:
+                self._chop = set()
+        return self._chop
+
+    def subgraph(self):
+        return self.graph.subgraph(self.nodes)
+
+    def _distances(self):
+        # min number of edges from each node of the chop to the sink
+        if self._dist is None:
+            nodes = self.nodes
+            self._dist = {}
+            if nodes:
+                self._dist[self.sink] = 0
+                queue = deque([self.sink])
+                while queue:
+                    node = queue.popleft()
+                    for pred in self.graph.predecessors(node):
+                        if pred in nodes and pred not in self._dist:
+                            self._dist[pred] = self._dist[node] + 1
+                            queue.append(pred)
+        return self._dist
+
+    def distance(self):
+        """
+            Length (in edges) of the shortest path, None if there is none
+        """
+        return self._distances().get(self.source)
+
+    def condensed(self):
+        """
+            The chop with its strongly connected components condensed:
+            a DAG whose nodes have the 'members' of the component
+        """
+        if self._condensed is None:
+            self._condensed = networkx.condensation(self.subgraph())
+        return self._condensed
+
+    def _component(self, node):
+        return self.condensed().graph['mapping'][node]
+
+    def count_paths(self):
+        """
+            Number of paths from source to sink, loops collapsed
+            (each strongly connected component counts as a single node)
+        """
+        if not self.nodes:
+            return 0
+
+        dag = self.condensed()
+        src = self._component(self.source)
+        dst = self._component(self.sink)
+
+        counts = {dst: 1}
+        for node in reversed(list(networkx.topological_sort(dag))):
+            if node != dst:
+                counts[node] = sum(counts.get(succ, 0) for succ in dag.successors(node))
+        return counts.get(src, 0)
+
+    def collapsed_paths(self, max_paths=None, timeout=None):
+        """
+            Paths in the condensed chop, as lists of components (frozensets of nodes)
+        """
+        if not self.nodes:
+            return
+
+        dag = self.condensed()
+        members = dict((n, frozenset(dag.nodes[n]['members'])) for n in dag)
+        dst = self._component(self.sink)
+        for path in self._dfs(dag, self._component(self.source), dst, set(dag), None, None, max_paths, timeout):
+            yield [members[n] for n in path]
+
+    def paths(self, max_length=None, max_paths=None, timeout=None):
+        """
+            Lazily stream the simple paths from source to sink
+
+            :param max_length: max number of edges of the paths
+            :param max_paths: max number of paths
+            :param timeout: max seconds spent enumerating
+        """
+        if not self.nodes:
+            return
+
+        dist = self._distances() if max_length is not None else None
+        for path in self._dfs(self.graph, self.source, self.sink, self.nodes, max_length, dist, max_paths, timeout):
+            yield path
+
+    def _dfs(self, graph, source, sink, nodes, max_length, dist, max_paths, timeout):
+        self.truncated = False
+        found = 0
+        for path in self._walk(graph, source, sink, nodes, max_length, dist, timeout):
+            if max_paths is not None and found >= max_paths:
+                # truncated only if there is one more path
+                self.truncated = True
+                return
+            yield path
+            found += 1
+
+    def _walk(self, graph, source, sink, nodes, max_length, dist, timeout):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        steps = 0
+
+        if source == sink:
+            yield [source]
+            return
+
+        path = [source]
+        on_path = set(path)
+        stack = [iter(graph.successors(source))]
+
+        while stack:
+            steps += 1
+            if deadline is not None and steps % self.CHECK_EVERY == 0 and time.monotonic() > deadline:
+                self.truncated = True
+                return
+
+            for succ in stack[-1]:
+                if succ not in nodes or succ in on_path:
+                    continue
+                # prune nodes that cannot reach the sink within the max length
+                if dist is not None and len(path) + dist[succ] > max_length:
+                    continue
+
+                if succ == sink:
+                    yield path + [succ]
+                    continue
+
+                path.append(succ)
+                on_path.add(succ)
+                stack.append(iter(graph.successors(succ)))
+                break
+            else:
+                stack.pop()
+                on_path.discard(path.pop())
+
+    def shortest_paths(self, k=1, timeout=None):
+        """
+            The k shortest simple paths (by number of edges), shortest first.
+            Yen's algorithm with breadth-first searches in the chop: timeout is
+            also checked inside the searches, before the first path is found.
+        """
+        self.truncated = False
+        if not self.nodes:
+            return
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        path = self._bfs(self.source, set(), set(), deadline)
+        if path is None:
+            return
+
+        found = [path]
+        seen = set([tuple(path)])
+        candidates = []
+        order = count()
+        yield path
+
+        while len(found) < k:
+            last = found[-1]
+            for i in range(len(last) - 1):
+                root = last[:i + 1]
+                # edges used by the paths already found with the same root
+                removed = set((p[i], p[i + 1]) for p in found if p[:i + 1] == root)
+                spur = self._bfs(last[i], set(root[:-1]), removed, deadline)
+                if self.truncated:
+                    return
+                if spur is not None:
+                    path = root[:-1] + spur
+                    if tuple(path) not in seen:
+                        seen.add(tuple(path))
+                        heapq.heappush(candidates, (len(path), next(order), path))
+
+            if not candidates:
+                return
+            _, _, path = heapq.heappop(candidates)
+            found.append(path)
+            yield path
+
+    def _bfs(self, source, blocked, removed, deadline):
+        """
+            A shortest path from source to the sink in the chop, avoiding the blocked
+            nodes and the removed edges. None if there is none, or if the deadline
+            passed (truncated is set).
+        """
+        if deadline is not None and time.monotonic() > deadline:
+            self.truncated = True
+            return None
+
+        nodes = self.nodes
+        parents = {source: None}
+        queue = deque([source])
+        steps = 0
+        while queue:
+            steps += 1
+            if deadline is not None and steps % self.CHECK_EVERY == 0 and time.monotonic() > deadline:
+                self.truncated = True
+                return None
+
+            node = queue.popleft()
+            if node == self.sink:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parents[node]
+                return path[::-1]
+
+            for succ in self.graph.successors(node):
+                if succ in nodes and succ not in parents and succ not in blocked and (node, succ) not in removed:
+                    parents[succ] = node
+                    queue.append(succ)
+        return None
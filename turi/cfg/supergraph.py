@@ -0,0 +1,169 @@
+import logging
+
+from collections import namedtuple, deque
+
+from .cfg_full import CFGFull
+from ..statements import is_invoke, get_invoke_expr
+
+log = logging.getLogger("turi.SuperGraph")
+
+
+class _SiteNode(namedtuple('_SiteNode', ['block', 'index'])):
+    # call and return sites of the same statement are different nodes
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.block, self.index))
+
+
+# a call statement (index in the block) is split in a call site node and a return site node
+class CallSite(_SiteNode):
+    __slots__ = ()
+
+
+class ReturnSite(_SiteNode):
+    __slots__ = ()
+
+
+# edge kinds
+INTRA = 'intra'
+CALL = 'call'
+RETURN = 'return'
+CALL_TO_RETURN = 'call_to_return'
+
+
+class SuperGraph(CFGFull):
+    """
+        Interprocedural supergraph: every call statement has a call site node
+        (linked to the entries of the callees) and a return site node (linked from
+        the exits of the callees, and from the call site by a call-to-return edge).
+        Block nodes stand for the code of the block before its first call, and the
+        successors of a block with calls leave from its last return site.
+
+        Traversals through valid paths only (valid_forward, valid_backward) match
+        calls and returns: they never return to a call site other than the one
+        the callee was entered from.
+    """
+
+    def __init__(self, project):
+        # block -> indexes of its call statements
+        self._block_calls = {}
+        super(SuperGraph, self).__init__(project)
+
+    def _calls(self, block):
+        if block not in self._block_calls:
+            self._block_calls[block] = [i for i, stmt in enumerate(block.statements) if is_invoke(stmt)]
+        return self._block_calls[block]
+
+    def block_end(self, block):
+        """
+            The node the control flow leaves block from
+        """
+        calls = self._calls(block)
+        return ReturnSite(block, calls[-1]) if calls else block
+
+    def _link(self, src, dst, kind):
+        self._edge_refs[(src, dst)] += 1
+        self.graph.add_edge(src, dst, kind=kind)
+
+    def _add_edge(self, src, dst):
+        # intraprocedural edges between blocks
+        if not isinstance(src, _SiteNode):
+            src = self.block_end(src)
+        self._link(src, dst, INTRA)
+
+    def _add_invoke(self, container_m, block, invoke):
+        invoke_expr = get_invoke_expr(invoke)
+        self._invokes_by_class[invoke_expr.class_name].add((container_m, block, invoke))
+
+        index = next(i for i, stmt in enumerate(block.statements) if stmt is invoke)
+        calls = self._calls(block)
+        position = calls.index(index)
+        previous = ReturnSite(block, calls[position - 1]) if position else block
+
+        call_site = CallSite(block, index)
+        return_site = ReturnSite(block, index)
+        # the edges inside the block stay when the call is re-resolved
+        if not self.graph.has_edge(previous, call_site):
+            self._link(previous, call_site, INTRA)
+        if not self.graph.has_edge(call_site, return_site):
+            self._link(call_site, return_site, CALL_TO_RETURN)
+
+        edges = self._invoke_edges.setdefault(invoke, [])
+        targets = self._invoke_targets[invoke] = self._resolve_targets(container_m, invoke_expr)
+        for target in targets:
+            entry = target.blocks[0]
+            self._link(call_site, entry, CALL)
+            edges.append((call_site, entry))
+
+            for ret_block in self._get_method_ret_blocks(target):
+                exit_node = self.block_end(ret_block)
+                self._link(exit_node, return_site, RETURN)
+                edges.append((exit_node, return_site))
+
+    def _remove_method(self, method):
+        # call and return edges, then the blocks
+        super(SuperGraph, self)._remove_method(method)
+
+        for block in method.blocks:
+            for index in self._block_calls.pop(block, ()):
+                for node in (CallSite(block, index), ReturnSite(block, index)):
+                    if node not in self.graph:
+                        continue
+                    for edge in list(self.graph.in_edges(node)) + list(self.graph.out_edges(node)):
+                        self._edge_refs.pop(edge, None)
+                    self.graph.remove_node(node)
+
+    def _traverse(self, nodes, kinds, reverse):
+        seen = set(n for n in nodes if n in self.graph)
+        queue = deque(seen)
+        adj = self.graph.pred if reverse else self.graph.succ
+        while queue:
+            node = queue.popleft()
+            for other, data in adj[node].items():
+                if data['kind'] in kinds and other not in seen:
+                    seen.add(other)
+                    queue.append(other)
+        return seen
+
+    def _crossing(self, nodes, kind, reverse):
+        adj = self.graph.pred if reverse else self.graph.succ
+        return set(other for node in nodes for other, data in adj[node].items() if data['kind'] == kind)
+
+    def valid_forward(self, sources):
+        """
+            Nodes reachable from sources through valid paths.
+            Returning from the methods of the sources goes back to all their callers.
+        """
+        # ascend: do not enter callees (the call-to-return edges skip them)
+        ascended = self._traverse(sources, (INTRA, CALL_TO_RETURN, RETURN), False)
+        # descend: enter the callees, without leaving them through return edges
+        descended = self._traverse(self._crossing(ascended, CALL, False), (INTRA, CALL_TO_RETURN, CALL), False)
+        return ascended | descended
+
+    def valid_backward(self, sinks):
+        """
+            Nodes that can reach sinks through valid paths
+        """
+        ascended = self._traverse(sinks, (INTRA, CALL_TO_RETURN, CALL), True)
+        descended = self._traverse(self._crossing(ascended, RETURN, True), (INTRA, CALL_TO_RETURN, RETURN), True)
+        return ascended | descended
+
+    def valid_chop(self, sources, sinks):
+        """
+            Nodes on valid paths from sources that reach sinks through valid paths
+        """
+        return self.valid_forward(sources) & self.valid_backward(sinks)
+
+    @staticmethod
+    def blocks_of(nodes):
+        """
+            Blocks of a set of nodes (the blocks of the call and return sites included)
+        """
+        return set(n.block if isinstance(n, _SiteNode) else n for n in nodes)
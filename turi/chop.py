@@ -0,0 +1,91 @@
+"""
+    Chops: the code between a source and a sink
+"""
+
+import logging
+
+from .forward_slicer import ForwardSlicer
+from .backward_slicer import BackwardSlicer
+
+log = logging.getLogger('turi.Chopper')
+
+
+class Chop:
+    """
+        Result of a chop: the blocks affected by the source (forward slice)
+        that also affect the sink (backward slice), along valid ICFG paths only.
+
+        It is a subset of the intersection of the two slices: the slices are
+        context insensitive, so through a callee shared by several call sites
+        they can meet on a path that enters the callee from one caller and
+        returns to another. Blocks only reached that way are not in the chop.
+    """
+
+    def __init__(self, blocks, forward, backward, reachable):
+        self.blocks = blocks
+        self.forward = forward
+        self.backward = backward
+        # blocks on some valid ICFG path from the source to the sink
+        self.reachable = reachable
+
+    def __contains__(self, block):
+        return block in self.blocks
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __len__(self):
+        return len(self.blocks)
+
+
+class Chopper:
+    """
+        Computes forward slice & backward slice, without slicing the whole program:
+        - both slices only visit the blocks on some valid (calls matched with returns)
+          ICFG path from the source to the sink
+        - the backward slice only visits the blocks reachable from the forward slice
+        - if the forward slice is empty, the backward slice is skipped
+    """
+
+    def __init__(self, project):
+        self.project = project
+
+    def chop(self, source, sink):
+        """
+            :param source: input of the forward slice (see ForwardSlicer.locate_input)
+            :param sink: input of the backward slice (see BackwardSlicer.locate_input)
+        """
+        with self.project.instrumentation.phase('chopper.chop'):
+            forward = ForwardSlicer(self.project)
+            forward._input = source
+            source_data = forward.locate_input()
+
+            backward = BackwardSlicer(self.project)
+            backward._input = sink
+            sink_data = backward.locate_input()
+
+            if not source_data or not sink_data:
+                log.warning('Source or sink not found')
+                return Chop(set(), forward, backward, set())
+
+            supergraph = self.project.supergraph()
+            source_blocks = [block for block, _ in source_data]
+            sink_blocks = [block for block, _, _ in sink_data]
+            reachable = supergraph.blocks_of(supergraph.valid_chop(source_blocks, sink_blocks))
+
+            source_data = [d for d in source_data if d[0] in reachable]
+            sink_data = [d for d in sink_data if d[0] in reachable]
+            if not source_data or not sink_data:
+                return Chop(set(), forward, backward, reachable)
+
+            forward.allowed_blocks = reachable
+            forward.slice(source, input_data=source_data)
+
+            affected = forward.affected_blocks & reachable
+            if not affected:
+                return Chop(set(), forward, backward, reachable)
+
+            backward.allowed_blocks = supergraph.blocks_of(supergraph.valid_forward(affected)) & reachable
+            backward.slice(sink, input_data=sink_data)
+
+            return Chop(affected & backward.affected_blocks, forward, backward, reachable)
@@ -10,6 +10,10 @@ from .statements import *
 
 XRef = namedtuple('XRef', ['cls', 'method', 'stmt', 'type'])
 
+# a block found by a slicer, with the statements that put it in the slice
+# and the tainted variables (of its method) that caused them
+SliceItem = namedtuple('SliceItem', ['block', 'method', 'statements', 'tainted'])
+
 
 def get_ast_leafs(st):
     def _get_ast_leafs_core(st, leafs=[]):
@@ -0,0 +1,61 @@
+"""
+    k-limited call strings, interned as small integers
+"""
+
+# the empty call string
+EMPTY = 0
+
+
+class CallStrings:
+    """
+        Call strings of at most k call sites (most recent first), interned:
+        contexts are integer IDs, EMPTY (0) is the empty call string
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self._ids = {(): EMPTY}
+        self._strings = [()]
+        self._push = {}
+
+    def __len__(self):
+        return len(self._strings)
+
+    def _intern(self, string):
+        ctx = self._ids.get(string)
+        if ctx is None:
+            ctx = len(self._strings)
+            self._ids[string] = ctx
+            self._strings.append(string)
+        return ctx
+
+    def push(self, ctx, call_site):
+        """
+            Context of a callee entered from call_site, the oldest call site is dropped beyond k
+        """
+        key = (ctx, call_site)
+        if key not in self._push:
+            self._push[key] = self._intern(((call_site,) + self._strings[ctx])[:self.k])
+        return self._push[key]
+
+    def top(self, ctx):
+        """
+            Most recent call site, None for the empty call string
+        """
+        string = self._strings[ctx]
+        return string[0] if string else None
+
+    def pop(self, ctx):
+        """
+            Context of the caller, returning to top(ctx)
+        """
+        return self._intern(self._strings[ctx][1:])
+
+    def call_string(self, ctx):
+        return self._strings[ctx]
+
+    def context(self, call_string):
+        """
+            Context of a call string (e.g., restored from a checkpoint)
+        """
+        return self._intern(tuple(call_string)[:self.k])
@@ -4,10 +4,12 @@ from queue import Queue
 
 from .statements import *
 from .utils import walk_all_blocks
+from .common import SliceItem
+from .budget import StateCodec
+from .models import invoke_locations
+from .context import CallStrings, EMPTY
 
-logging.basicConfig()
-log = logging.getLogger('ForwardSlicer')
-log.setLevel(logging.DEBUG)
+log = logging.getLogger('turi.ForwardSlicer')
 
 
 class ForwardSlicerError(Exception):
@@ -22,20 +24,44 @@ class ForwardSlicer:
     """
         Forward Slicer: staring from some input, follow code paths that are
         affected by such input
+
+        Tainted return values flow back to the call sites of the method. With
+        context_k, the traversal is context sensitive: blocks are visited in the
+        context of the last context_k call sites (blocks) the slice entered
+        callees from, and a slice leaving a callee through a return only goes
+        back to the call site it came from.
     """
     MAX_ITER = 5000
     MAX_ITERS_BLOCK = 30
 
-    def __init__(self, project, max_iter=None):
+    def __init__(self, project, max_iter=None, allowed_blocks=None, context_k=None):
         self.project = project
         if max_iter:
             self.MAX_ITER = max_iter
+        # if set, the traversal never leaves these blocks (e.g., a source-sink chop)
+        self.allowed_blocks = allowed_blocks
         self.iters_per_block = {}
         self.affected_blocks = set()
         # tainted variable in each block
         self._tainted = {}
+        # context sensitive mode: tainted variables per (block, context)
+        self.contexts = CallStrings(context_k) if context_k else None
+        self._ctx_tainted = {}
         self._input_data = None
         self._input = None
+        # worklist state, kept to resume a slice stopped by its budget
+        self._position = 0
+        self._queue = None
+        self._visited = set()
+        self._iterations = 0
+        # True if MAX_ITER stopped the traversal of an input
+        self._iter_exceeded = False
+        # context sensitive mode: keys in the queue, size of the tainted sets at the last visit
+        self._pending = set()
+        self._visited_sizes = {}
+        # why the slice is partial: exceeded budget ('time' or 'memory', resume() continues it),
+        # or 'iterations' if MAX_ITER stopped the traversal of an input
+        self.incomplete = None
 
     @property
     def input_blocks(self):
@@ -50,12 +76,13 @@ class ForwardSlicer:
     def tainted_in_method(self, method):
         return set.union(*[self._tainted[b][method] for b in method.blocks if b in self._tainted])
 
-    def _merge_tainted(self, curr_block, next_block):
-        curr_tainted = self._tainted[curr_block]
+    def _merge_tainted(self, curr_block, next_block, tainted=None):
+        tainted = self._tainted if tainted is None else tainted
+        curr_tainted = tainted[curr_block]
 
-        if next_block in self._tainted:
+        if next_block in tainted:
             # time to merge
-            next_tainted = self._tainted[next_block]
+            next_tainted = tainted[next_block]
 
             new_tainted = dict([(m, s) for (m, s) in next_tainted.items() if m not in curr_tainted])
             new_tainted.update(dict([(m, s) for (m, s) in curr_tainted.items() if m not in next_tainted]))
@@ -64,41 +91,214 @@ class ForwardSlicer:
 
         return curr_tainted
 
-    def slice(self, input):
+    def slice(self, input, input_data=None, budget=None):
+        """
+            :param budget: a budget.Budget, if it is exceeded the slice stops and
+                           incomplete is set (see checkpoint() and resume()).
+                           incomplete is 'iterations' if MAX_ITER cut the traversal.
+        """
+        with self.project.instrumentation.phase('forward_slicer.slice'):
+            for _ in self._slice(input, input_data, budget):
+                pass
+
+    def resume(self, checkpoint=None, budget=None):
+        """
+            Continue an incomplete slice, from checkpoint if given
+        """
+        if checkpoint is not None:
+            self._restore(checkpoint)
+        elif self._input_data is None:
+            raise ForwardSlicerError('No slice to resume')
+        with self.project.instrumentation.phase('forward_slicer.slice'):
+            for _ in self._run(budget):
+                pass
+
+    def iter_slice(self, input, input_data=None, release=False, budget=None):
+        """
+            Generator variant of slice(): yields a SliceItem for each block as soon
+            as it is added to the slice. The caller can stop at any time.
+
+            :param release: drop the tainted variables when the iteration ends or is stopped
+        """
+        try:
+            for item in self._slice(input, input_data, budget):
+                yield item
+        finally:
+            if release:
+                self._release()
+
+    def reaches(self, input, method):
+        """
+            True if some block of method is in the slice of input (stops at the first one)
+        """
+        for item in self.iter_slice(input, release=True):
+            if item.method is method:
+                return True
+        return False
+
+    def _release(self):
+        self._tainted = {}
+        self._ctx_tainted = {}
+        self.iters_per_block = {}
+        self._queue = None
+        self._visited = set()
+        self._pending = set()
+        self._visited_sizes = {}
+
+    def checkpoint(self):
+        """
+            State of the slice as plain data (it can be pickled), to resume() it later,
+            e.g. with a bigger budget. It is exact after slice() or resume() returned.
+        """
+        blocks = StateCodec(self.project)
+        keys = StateCodec(self.project, self.contexts)
+        return {
+            'context_k': self.contexts.k if self.contexts is not None else None,
+            'input': self._input,
+            'input_data': [(blocks.block(block), var) for block, var in self._input_data or []],
+            'position': self._position,
+            'queue': None if self._queue is None else [keys.key(self._key(b, ctx)) for b, ctx in list(self._queue.queue)],
+            'visited': sorted(keys.key(k) for k in self._visited),
+            'iterations': self._iterations,
+            'iter_exceeded': self._iter_exceeded,
+            'iters_per_block': sorted((keys.key(k), n) for k, n in self.iters_per_block.items()),
+            'pending': sorted(keys.key(k) for k in self._pending),
+            'visited_sizes': sorted((keys.key(k), n) for k, n in self._visited_sizes.items()),
+            'affected_blocks': sorted(blocks.block(b) for b in self.affected_blocks),
+            'tainted': blocks.encode_tainted(self._tainted),
+            'ctx_tainted': keys.encode_tainted(self._ctx_tainted) if self.contexts else None,
+            'incomplete': self.incomplete,
+        }
+
+    def _restore(self, checkpoint):
+        context_k = self.contexts.k if self.contexts is not None else None
+        if checkpoint['context_k'] != context_k:
+            raise ForwardSlicerError('Checkpoint of a slice with context_k=%s' % checkpoint['context_k'])
+
+        blocks = StateCodec(self.project)
+        keys = StateCodec(self.project, self.contexts)
+        self._input = checkpoint['input']
+        self._input_data = [(blocks.resolve_block(b), var) for b, var in checkpoint['input_data']]
+        self._position = checkpoint['position']
+        self._queue = None
+        if checkpoint['queue'] is not None:
+            self._queue = Queue()
+            for k in checkpoint['queue']:
+                key = keys.resolve_key(k)
+                self._queue.put(key if self.contexts else (key, EMPTY))
+        self._visited = set(keys.resolve_key(k) for k in checkpoint['visited'])
+        self._iterations = checkpoint['iterations']
+        self._iter_exceeded = checkpoint['iter_exceeded']
+        self.iters_per_block = dict((keys.resolve_key(k), n) for k, n in checkpoint['iters_per_block'])
+        self._pending = set(keys.resolve_key(k) for k in checkpoint['pending'])
+        self._visited_sizes = dict((keys.resolve_key(k), n) for k, n in checkpoint['visited_sizes'])
+        self.affected_blocks = set(blocks.resolve_block(b) for b in checkpoint['affected_blocks'])
+        self._tainted = blocks.decode_tainted(checkpoint['tainted'])
+        self._ctx_tainted = keys.decode_tainted(checkpoint['ctx_tainted']) if self.contexts else {}
+        self.incomplete = checkpoint['incomplete']
+
+    def _affect(self, block, statements, tainted):
+        """
+            Add block to the slice, returns its SliceItem if it is new
+        """
+        if block in self.affected_blocks:
+            return None
+        self.affected_blocks.add(block)
+
+        unique = []
+        for stmt in statements:
+            if not any(stmt is s for s in unique):
+                unique.append(stmt)
+        return SliceItem(block, self.project.blocks_to_methods[block], tuple(unique), frozenset(tainted))
+
+    def _slice(self, input, input_data=None, budget=None):
         self._input = input
-        self._input_data = self.locate_input()
-
-        for input_block, var in self._input_data:
-            # traverse CFG
-            queue = Queue()
-            queue.put(input_block)
-            iterations = 0
-            visited = set()
-            tainted_input = {self.project.blocks_to_methods[input_block]: set([var])}
-            self._tainted[input_block] = tainted_input
-            self.affected_blocks.add(input_block)
-
-            while not queue.empty() and iterations < self.MAX_ITER:
-                curr_block = queue.get()
+        if not input_data:
+            self._input_data = self.locate_input()
+        else:
+            self._input_data = input_data
+        self._position = 0
+        self._queue = None
+        self._iter_exceeded = False
+        return self._run(budget)
+
+    def _run(self, budget=None):
+        instr = self.project.instrumentation
+        self.incomplete = None
+        if budget is not None:
+            budget.start()
+
+        # tainted variables per worklist key: block, or (block, context)
+        tainted = self._tainted if self.contexts is None else self._ctx_tainted
+
+        def push(block, ctx):
+            if self.contexts is not None:
+                key = (block, ctx)
+                if key in self._pending or self._visited_sizes.get(key) == self._tainted_size(tainted[key]):
+                    return
+                self._pending.add(key)
+            self._queue.put((block, ctx))
+            if instr.enabled:
+                instr.count('forward_slicer.queue_pushes')
+
+        while self._position < len(self._input_data):
+            input_block, var = self._input_data[self._position]
+            if self._queue is None:
+                # traverse CFG
+                self._queue = Queue()
+                self._pending = set()
+                self._visited_sizes = {}
+                self._iterations = 0
+                self._visited = set()
+                tainted_input = {self.project.blocks_to_methods[input_block]: set([var])}
+                tainted[self._key(input_block, EMPTY)] = tainted_input
+                item = self._affect(input_block, (), [var])
+                if item:
+                    yield item
+                push(input_block, EMPTY)
+
+            queue = self._queue
+            pending = self._pending
+            visited_sizes = self._visited_sizes
+            visited = self._visited
+
+            while not queue.empty() and self._iterations < self.MAX_ITER:
+                if budget is not None:
+                    self.incomplete = budget.exceeded()
+                    if self.incomplete:
+                        log.info('Slice stopped: %s budget exceeded', self.incomplete)
+                        if instr.enabled:
+                            instr.count('forward_slicer.budget_exceeded')
+                        if self.contexts is not None:
+                            self._fold_contexts()
+                        return
+
+                curr_block, curr_ctx = queue.get()
+                curr_key = self._key(curr_block, curr_ctx)
+                pending.discard(curr_key)
                 curr_method = self.project.blocks_to_methods[curr_block]
-                iterations += 1
-
-                if curr_block in visited:
-                    if curr_block not in self.iters_per_block:
-                        self.iters_per_block[curr_block] = 0
-                    self.iters_per_block[curr_block] += 1
+                self._iterations += 1
+                if instr.enabled:
+                    instr.count('forward_slicer.block_visits')
+
+                if curr_key in visited:
+                    if curr_key not in self.iters_per_block:
+                        self.iters_per_block[curr_key] = 0
+                    self.iters_per_block[curr_key] += 1
                     # log.debug('Visiting block already visited')
 
-                    iters_curr_block = self.iters_per_block[curr_block]
+                    iters_curr_block = self.iters_per_block[curr_key]
                     if iters_curr_block >= self.MAX_ITERS_BLOCK:
+                        if instr.enabled:
+                            instr.count('forward_slicer.max_iters_block')
                         # skip it
                         # log.debug('Skipping block: visited too many times')
                         continue
                 else:
-                    visited.add(curr_block)
+                    visited.add(curr_key)
 
                 # get variable to follow for this block
-                curr_tainted = self._tainted[curr_block].get(curr_method, [])
+                curr_tainted = tainted[curr_key].get(curr_method, [])
 
                 # better work at the statement granularity?
                 for i in range(len(curr_block.statements)):
@@ -111,30 +311,112 @@ class ForwardSlicer:
 
                     # add blocks affected by the condition statements
                     for t_block in target_blocks:
-                        self.affected_blocks.add(t_block)
+                        item = self._affect(t_block, cond_stmts, curr_tainted)
+                        if item:
+                            yield item
 
                     # TODO taint object fields
                     if assign_stmts or call_stmts or cond_stmts:
-                        self.affected_blocks.add(curr_block)
-                        new_set = self.get_set(curr_block, assign_stmts)
+                        item = self._affect(curr_block, assign_stmts + [stmt for stmt, _ in call_stmts] + cond_stmts,
+                                            curr_tainted)
+                        if item:
+                            yield item
+                        new_set = self.get_set(curr_block, assign_stmts, curr_tainted)
                         for set_var, var_method in new_set:
-                            self._tainted[curr_block][var_method].add(set_var)
+                            tainted[curr_key][var_method].add(set_var)
 
                         new_calls_set = self.get_calls_set(call_stmts, curr_block)
                         for set_var, var_method in new_calls_set:
-                            if var_method not in self._tainted[curr_block]:
-                                self._tainted[curr_block][var_method] = set()
-                            self._tainted[curr_block][var_method].add(set_var)
+                            if var_method not in tainted[curr_key]:
+                                tainted[curr_key][var_method] = set()
+                            tainted[curr_key][var_method].add(set_var)
 
                         new_fields_set = self.get_fields_set(assign_stmts)
                         for field, field_method in new_fields_set:
-                            if field_method not in self._tainted[curr_block]:
-                                self._tainted[curr_block][field_method] = set()
-                            self._tainted[curr_block][field_method].add(field)
+                            if field_method not in tainted[curr_key]:
+                                tainted[curr_key][field_method] = set()
+                            tainted[curr_key][field_method].add(field)
+
+                # tainted return values: back to the call sites
+                for call_block, stmt in self.get_call_ret(curr_block, curr_tainted):
+                    if self.allowed_blocks is not None and call_block not in self.allowed_blocks:
+                        continue
+                    call_ctx = self._ret_context(curr_ctx, call_block)
+                    if call_ctx is None:
+                        # not the call site the callee was entered from
+                        continue
+                    call_key = self._key(call_block, call_ctx)
+                    caller = self.project.blocks_to_methods[call_block]
+                    call_tainted = tainted.setdefault(call_key, {}).setdefault(caller, set())
+                    if stmt.left_op.name in call_tainted:
+                        continue
+                    call_tainted.add(stmt.left_op.name)
+                    item = self._affect(call_block, [stmt], call_tainted)
+                    if item:
+                        yield item
+                    push(call_block, call_ctx)
+
+                if self.contexts is not None:
+                    visited_sizes[curr_key] = self._tainted_size(tainted[curr_key])
 
                 for next_block in self.project.cfgfull().get_next_blocks(curr_block):
-                    queue.put(next_block)
-                    self._tainted[next_block] = self._merge_tainted(curr_block, next_block)
+                    if self.allowed_blocks is not None and next_block not in self.allowed_blocks:
+                        continue
+                    next_ctx = curr_ctx
+                    if self.contexts is not None and self.project.blocks_to_methods[next_block] is not curr_method:
+                        # entering a callee from the current block
+                        next_ctx = self.contexts.push(curr_ctx, curr_block)
+                    next_key = self._key(next_block, next_ctx)
+                    tainted[next_key] = self._merge_tainted(curr_key, next_key, tainted)
+                    if self.contexts is not None and tainted[next_key] is tainted[curr_key]:
+                        # do not share the sets: changes are detected by size
+                        tainted[next_key] = dict((m, set(v)) for m, v in tainted[curr_key].items())
+                    push(next_block, next_ctx)
+
+            if not queue.empty():
+                self._iter_exceeded = True
+                if instr.enabled:
+                    instr.count('forward_slicer.max_iter')
+
+            self._queue = None
+            self._position += 1
+
+        if self.contexts is not None:
+            self._fold_contexts()
+
+        if self._iter_exceeded:
+            self.incomplete = 'iterations'
+            log.info('Slice cut: MAX_ITER reached')
+
+    def _key(self, block, ctx):
+        return block if self.contexts is None else (block, ctx)
+
+    def _ret_context(self, ctx, call_block):
+        """
+            Context of call_block, returned to from a callee in context ctx.
+            None if call_block is not the call site the callee was entered from.
+        """
+        if self.contexts is None:
+            return EMPTY
+
+        call_site = self.contexts.top(ctx)
+        if call_site is None:
+            # unknown caller (the slice started in the callee, or the context was truncated)
+            return EMPTY
+        if call_site is not call_block:
+            return None
+        return self.contexts.pop(ctx)
+
+    @staticmethod
+    def _tainted_size(tainted):
+        return len(tainted) + sum(len(v) for v in tainted.values())
+
+    def _fold_contexts(self):
+        # tainted variables per block, merged over the contexts
+        for (block, _), methods in self._ctx_tainted.items():
+            merged = self._tainted.setdefault(block, {})
+            for method, vars in methods.items():
+                merged.setdefault(method, set()).update(vars)
 
     def locate_input(self):
         res = []
@@ -327,27 +609,19 @@ class ForwardSlicer:
         return assigns, calls
 
     def get_conditional_stmts(self, block, vars):
+        """
+            Given a block and a list of variables, returns the conditional
+            statements on those variables and the blocks control dependent on them
+        """
         target_blocks = []
         cond_stmts = []
 
-        method = self.project.blocks_to_methods[block]
-
         for var in vars:
             for stmt in block.statements:
                 if is_switch(stmt) and hasattr(stmt.key, 'name'):
                     if stmt.key.name == var:
                         cond_stmts.append(stmt)
 
-                        label = stmt.default_target
-                        target_block = method.block_by_label[label]
-                        target_blocks.append(target_block)
-                        labels = stmt.lookup_values_and_targets.values()
-
-                        # switch targets
-                        for label in labels:
-                            target_block = method.block_by_label[label]
-                            target_blocks.append(target_block)
-
                 elif is_condition(stmt):
                     condition = stmt.condition
                     if hasattr(condition, 'value'):
@@ -365,6 +639,10 @@ class ForwardSlicer:
                             if condition.value2.name == var:
                                 cond_stmts.append(stmt)
 
+        if cond_stmts:
+            method = self.project.blocks_to_methods[block]
+            target_blocks = self.project.cfgmethod(method).control_dependents(block)
+
         return cond_stmts, target_blocks
 
     def get_set_var_stmts(self, stmts, var):
@@ -383,16 +661,30 @@ class ForwardSlicer:
 
         return res
 
-    def get_set(self, block, stmts):
+    def get_set(self, block, stmts, vars=None):
         """
             Given a block and list of statements,
-            returns the list of variables set in those statements
+            returns the list of variables set in those statements.
+            If the tainted variables are given, calls to modeled
+            external methods only taint what the model propagates.
         """
         var_sets = set()
 
         method = self.project.blocks_to_methods[block]
 
         for stmt in stmts:
+            if vars is not None and is_invoke(stmt):
+                invoke_expr = stmt.invoke_expr if hasattr(stmt, 'invoke_expr') else stmt.right_op
+                model = self.project.external_model(invoke_expr)
+                if model is not None:
+                    # --- e.g., x = sb.append(var)
+                    locations = invoke_locations(stmt)
+                    tainted_locs = [loc for loc, name in locations.items() if name in vars]
+                    for loc in model.forward(tainted_locs):
+                        if loc in locations:
+                            var_sets.add((locations[loc], method))
+                    continue
+
             if is_assign(stmt):
                 if hasattr(stmt.left_op, 'name'):
                     var_sets.add((stmt.left_op.name, method))
@@ -470,6 +762,28 @@ class ForwardSlicer:
 
         return res
 
+    def get_call_ret(self, block, vars):
+        """
+            Given a block and a list of variables, returns the call sites
+            (block, assignment statement) that a tainted return value of the
+            block flows to, e.g. y = obj.method(x)
+        """
+        res = []
+
+        if not any(is_ret(stmt) and hasattr(stmt, 'value') and hasattr(stmt.value, 'name')
+                   and stmt.value.name in vars for stmt in block.statements):
+            return res
+
+        method = self.project.blocks_to_methods[block]
+        cfg = self.project.cfgfull()
+        for call_block in cfg.get_prev_blocks(method.blocks[0]):
+            for stmt in call_block.statements:
+                if is_assign(stmt) and is_invoke(stmt.right_op) and hasattr(stmt.left_op, 'name'):
+                    if method in cfg.call_targets(stmt):
+                        res.append((call_block, stmt))
+
+        return res
+
     def get_fields_set(self, stmts):
         """
             Given a list of statements,
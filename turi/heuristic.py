@@ -1,15 +1,41 @@
 import logging
+import multiprocessing
 from collections import namedtuple
-from .statements import is_invoke, is_instance_field_ref, is_assign, is_static_field_ref
+from .statements import is_invoke
 from .utils import get_method_key
-from .stub import call_stub
+from .stub import PACKAGE_SCANNER
 
-logging.basicConfig()
-log = logging.getLogger("Heuristic")
-log.setLevel(logging.DEBUG)
+log = logging.getLogger("turi.Heuristic")
 
 Target = namedtuple("Target", ["type_op", "class_name", "method_name", "method_params", "var_name"])
 
+# heuristic used by the worker processes (inherited by fork, or rebuilt from the cache)
+_worker_heuristic = None
+
+
+def _init_worker_from_cache(app_path, pickled, ir_store=None):
+    global _worker_heuristic
+    from .project import Project
+    _worker_heuristic = Heuristic(Project(app_path, pickled=pickled, ir_store=ir_store))
+    _worker_heuristic._find_reflection_targets()
+
+
+def _resolve_in_worker(target):
+    h = _worker_heuristic
+    h._result = set()
+    h._analyze_reflection_targets(target)
+    # classes are sent back by name, the parent maps them to its own objects
+    return target, sorted(cls.name for cls in h._result)
+
+
+class HeuristicError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
 class Heuristic:
     """
         Heuristic class
@@ -21,26 +47,17 @@ class Heuristic:
         # reflection
         self._targets = set()
         self._collection_types = {'java.util.LinkedList', 'java.util.List'}
-        self._stubbed_methods = {('com.ainfosec.Util', 'getClassesForPackage')}
+        # methods stubbed even if they are defined in the project
+        self._stubbed_methods = {(PACKAGE_SCANNER, 'getClassesForPackage')}
+        self._stubs = project.stubs()
+        self._index = project.index()
         self._result = set()
         self.results = dict()
-
-    def _get_class_method(self, stmt):
-        if hasattr(stmt, 'invoke_expr'):
-            fld = 'invoke_expr'
-        else:
-            fld = 'right_op'
-
-        called_cls_name = getattr(stmt, fld).class_name
-        called_method_name = getattr(stmt, fld).method_name
-
-        return (called_cls_name, called_method_name)
-
-    def _is_reflection_class(self, stmt):
-        (cl, me) = self._get_class_method(stmt)
-        if ((cl == "java.lang.Object") and (me == "getClass")):
-            return True
-        return False
+        # memoization of the recursive resolution
+        self._memo = {}
+        self._in_progress = {}
+        self._resolvents = {}
+        self._field_stores = {}
 
     def _is_stubbed(self, class_name, method_name):
         if (class_name, method_name) in self._stubbed_methods:
@@ -48,50 +65,26 @@ class Heuristic:
         return False
 
     def _is_defined(self, class_name, method_name):
-        defined = False
-        if class_name in self._classes:
-            cls = self._classes[class_name]
-            for mm in cls.methods:
-                if method_name in mm.name:
-                    defined = True
-                    break
-        return defined
-
-    def _who_gets_field(self, fld_name, cls, method, stmt):
-        if is_assign(stmt):
-            left_op =  getattr(stmt, 'left_op')
-            right_op = getattr(stmt, 'right_op')
-
-            if is_instance_field_ref(right_op):
-                if hasattr(right_op, 'field'):
-                    if fld_name in right_op.field[0]:
-                        if 'SootLocal' in str(type(left_op)):
-                            return Target('method_var', cls.name, method.name, method.params, stmt.left_op.name)
+        return self._index.is_defined(class_name, method_name)
 
     def _who_stores_to_field(self, fld_name, cls, method, stmt):
         res = None
-        if is_assign(stmt):
-            left_op =  getattr(stmt, 'left_op')
-
-            # static
-            if is_static_field_ref(left_op):
-                if hasattr(left_op, 'field'):
-                    if fld_name in left_op.field[0]:
-                        if 'SootLocal' in str(type(stmt.right_op)):
-
-                            slicer = self._slice(Target('method_var', cls.name, method.name, method.params, stmt.right_op.name))
-                            for sl_block in slicer.affected_blocks:
-                                for sl_stmt in sl_block.statements:
-                                    if hasattr(sl_stmt, 'right_op'):
-                                        op = sl_stmt.right_op
-                                        if is_invoke(op):
-                                            if hasattr(op, 'method_name'):
-                                                sl_md_name = op.method_name
-                                                sl_cls_name = op.class_name
-
-                                                #we need stub
-                                                if not (self._is_defined(sl_cls_name, sl_md_name)) or self._is_stubbed(sl_cls_name, sl_md_name):
-                                                    res = call_stub(sl_md_name, self._classes, op.args)
+
+        if 'SootLocal' in str(type(stmt.right_op)):
+
+            slicer = self._slice(Target('method_var', cls.name, method.name, method.params, stmt.right_op.name))
+            for sl_block in slicer.affected_blocks:
+                for sl_stmt in sl_block.statements:
+                    if hasattr(sl_stmt, 'right_op'):
+                        op = sl_stmt.right_op
+                        if is_invoke(op):
+                            if hasattr(op, 'method_name'):
+                                sl_md_name = op.method_name
+                                sl_cls_name = op.class_name
+
+                                #we need stub
+                                if not (self._is_defined(sl_cls_name, sl_md_name)) or self._is_stubbed(sl_cls_name, sl_md_name):
+                                    res = self._stubs.call(sl_cls_name, sl_md_name, op.method_params, op.args)
         return res
 
     #find who stores in the field
@@ -99,53 +92,36 @@ class Heuristic:
         resolvents = set()
         cls = self._classes[resolvent[0]]
         fld_name = resolvent[1]
-        if fld_name in cls.fields:
-            fld = cls.fields[fld_name]
-        else:
+        if fld_name not in cls.fields:
             return resolvents
-        for method in cls.methods:
-            for block in method.blocks:
-                for stmt in block.statements:
-                    res = self._who_stores_to_field(fld_name, cls, method, stmt)
-                    if not res == None:
-                        resolvents = resolvents | res
+
+        for _, method, stmt in self._index.static_field_stores.get((cls.name, fld_name), []):
+            res = self._who_stores_to_field(fld_name, cls, method, stmt)
+            if not res == None:
+                resolvents = resolvents | res
         return resolvents
 
     def _find_reflection_targets(self):
-        for cls_name, cls in self._classes.items():
-            for method in cls.methods:
-                for block in method.blocks:
-                    for stmt in block.statements:
-                        if is_invoke(stmt):
-                            if (self._is_reflection_class(stmt)):
-                                ref_reg = getattr(stmt, 'right_op').base
-                                self._targets.add(Target('method_var', cls.name, method.name, method.params, stmt.right_op.base.name))
+        for cls, method, stmt in self._index.get_class_sites:
+            self._targets.add(Target('method_var', cls.name, method.name, method.params, stmt.right_op.base.name))
 
     def _find_store_to_list(self, resolvent):
         resolvents = set()
-        getters = set()
         cls = self._classes[resolvent[0]]
         fld_name = resolvent[1]
-        if fld_name in cls.fields:
-            fld = cls.fields[fld_name]
-        else:
+        if fld_name not in cls.fields:
             return resolvents
-        for method in cls.methods:
-            for block in method.blocks:
-                for stmt in block.statements:
-                    gets = self._who_gets_field(fld_name, cls, method, stmt)
-                    if not gets == None:
-                        getters.add(gets)
-                    #we are looking for addtion to list call, we are insterested in Arguments
-                    if hasattr(stmt, 'right_op'):
-                        if is_invoke(stmt.right_op):
-                            if 'java.util.LinkedList' in stmt.right_op.class_name:
-                                if 'add' in stmt.right_op.method_name:
-                                    for getter in getters:
-                                        if getter.var_name in stmt.right_op.base.name:
-                                            #argument reveals what we store to the collection
-                                            for arg in stmt.right_op.args:
-                                                resolvents.add(Target('method_var', cls.name, method.name, method.params, arg.name))
+
+        for _, method, get_stmt in self._index.instance_field_loads.get((cls.name, fld_name), []):
+            getter = get_stmt.left_op.name
+            #we are looking for addtion to list call, we are insterested in Arguments
+            for stmt in self._index.add_calls.get((method, getter), []):
+                invoke_expr = stmt.invoke_expr if hasattr(stmt, 'invoke_expr') else stmt.right_op
+                if invoke_expr.class_name in self._collection_types:
+                    #argument reveals what we store to the collection
+                    for arg in invoke_expr.args:
+                        if hasattr(arg, 'name'):
+                            resolvents.add(Target('method_var', cls.name, method.name, method.params, arg.name))
         return resolvents
 
     def _slice(self, target):
@@ -158,7 +134,12 @@ class Heuristic:
         slicer.slice(inp)
         return slicer
 
-    def _analyze_reflection_targets(self, target):
+    def _find_resolvents(self, target):
+        hit = target in self._resolvents
+        self._project.instrumentation.cache('heuristic.resolvents', hit)
+        if hit:
+            return self._resolvents[target]
+
         affected_methods = set()
 
         # Backward slicing
@@ -208,8 +189,38 @@ class Heuristic:
                     except KeyError as e:
                     # there is no class here, just go on
                         pass
+        self._resolvents[target] = resolvents
+        return resolvents
+
+    def _analyze_reflection_targets(self, target):
+        res, contrib, _ = self._resolve_target(target)
+        self._result = self._result | contrib
+        return res
+
+    def _resolve_target(self, target):
+        """
+            Returns the classes resolved for target, the classes resolved for the
+            collections it depends on, and the lowest depth of the targets in
+            progress that were reached (cycles). Only results that do not depend
+            on targets still in progress are memoized.
+        """
+        hit = target in self._memo
+        self._project.instrumentation.cache('heuristic.targets', hit)
+        if hit:
+            res, contrib = self._memo[target]
+            return res, contrib, len(self._in_progress)
+
+        if target in self._in_progress:
+            # cycle: this target is already being resolved further up
+            return set(), set(), self._in_progress[target]
+
+        depth = len(self._in_progress)
+        self._in_progress[target] = depth
+        low = depth
+
         res = set()
-        for resolvent in resolvents:
+        contrib = set()
+        for resolvent in self._find_resolvents(target):
             #if we find classes here -> we are done!
             if resolvent in self._classes:
                 res.add(self._classes[resolvent])
@@ -221,18 +232,70 @@ class Heuristic:
                     list_stores = self._find_store_to_list(resolvent)
 
                     for list_store in list_stores:
-                        clss = self._analyze_reflection_targets(list_store)
-                        if not clss == None:
-                            self._result = self._result | clss
+                        clss, sub_contrib, sub_low = self._resolve_target(list_store)
+                        contrib |= clss | sub_contrib
+                        low = min(low, sub_low)
 
-                    res = res | self._store_to_fld(resolvent)
-        return res
+                    if resolvent not in self._field_stores:
+                        self._field_stores[resolvent] = self._store_to_fld(resolvent)
+                    res = res | self._field_stores[resolvent]
+
+        del self._in_progress[target]
+        if low >= depth:
+            self._memo[target] = (res, contrib)
 
-    def resolve_reflection_targets(self):
+        return res, contrib, low
+
+    def resolve_reflection_targets(self, processes=None):
+        """
+            Resolve all the reflection targets.
+
+            :param processes: if greater than 1, resolve targets in a pool of processes.
+                              Workers share the project by fork, or reload it from
+                              the project cache (pickled or IR store) where fork is not available.
+        """
         # first we find the places where the classes/fields are accessed and memorise them
         self._find_reflection_targets()
+        # resolved targets are shared by all the targets of this run, the
+        # slices and field stores are recomputed as the classes may have changed
+        self._memo = {}
+        self._in_progress = {}
+        self._resolvents = {}
+        self._field_stores = {}
+
+        targets = sorted(self._targets)
+
+        if processes is not None and processes > 1 and len(targets) > 1:
+            self._resolve_parallel(targets, processes)
+            return
+
         # now the real deal
-        for target in self._targets:
+        for target in targets:
             self._result = set()
             self._analyze_reflection_targets(target)
             self.results[target] = self._result
+
+    def _resolve_parallel(self, targets, processes):
+        global _worker_heuristic
+
+        if 'fork' in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context('fork')
+            _worker_heuristic = self
+            initializer, initargs = None, ()
+
+        elif self._project.pickled is not None or self._project.ir_store is not None:
+            ctx = multiprocessing.get_context('spawn')
+            initializer = _init_worker_from_cache
+            initargs = (self._project.app_path, self._project.pickled, self._project.ir_store)
+
+        else:
+            raise HeuristicError('Parallel resolution needs fork or a cached project')
+
+        chunksize = max(1, len(targets) // (processes * 4))
+        try:
+            with ctx.Pool(processes, initializer=initializer, initargs=initargs) as pool:
+                # imap keeps the order of the targets: results are merged deterministically
+                for target, cls_names in pool.imap(_resolve_in_worker, targets, chunksize):
+                    self.results[target] = set(self._classes[name] for name in cls_names)
+        finally:
+            _worker_heuristic = None
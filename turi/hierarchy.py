@@ -1,8 +1,39 @@
 import logging
 
-logging.basicConfig()
-log = logging.getLogger('Hierarchy')
-log.setLevel(logging.DEBUG)
+from collections import defaultdict
+
+from .utils import get_method_key
+
+log = logging.getLogger('turi.Hierarchy')
+
+
+# modifier flags, as bit masks
+PUBLIC = 1 << 0
+PRIVATE = 1 << 1
+PROTECTED = 1 << 2
+STATIC = 1 << 3
+FINAL = 1 << 4
+SYNCHRONIZED = 1 << 5
+NATIVE = 1 << 6
+INTERFACE = 1 << 7
+ABSTRACT = 1 << 8
+
+_MODIFIERS = {'PUBLIC': PUBLIC,
+              'PRIVATE': PRIVATE,
+              'PROTECTED': PROTECTED,
+              'STATIC': STATIC,
+              'FINAL': FINAL,
+              'SYNCHRONIZED': SYNCHRONIZED,
+              'NATIVE': NATIVE,
+              'INTERFACE': INTERFACE,
+              'ABSTRACT': ABSTRACT}
+
+
+def modifiers_mask(attrs):
+    mask = 0
+    for attr in attrs:
+        mask |= _MODIFIERS.get(attr, 0)
+    return mask
 
 
 class HierarchyError(Exception):
@@ -33,46 +64,191 @@ class Hierarchy:
         self.dir_sub_interfaces = {}
         self.sub_classes = {}
         self.dir_sub_classes = {}
+        # direct children, by name of the super class / implemented interface
+        self._dir_sub_classes_by_name = defaultdict(list)
+        self._dir_implementers_by_name = defaultdict(list)
+        self._dir_sub_interfaces_by_name = defaultdict(list)
+        # cached closures
+        self._implementers = {}
+        self._concrete_implementers = {}
+        self._concrete_sub_classes = {}
+        self._abstract_dispatch = {}
+        # modifier masks of classes and methods, interned package IDs of classes
+        self._flags = {}
+        self._packages = {}
+        self._package_ids = {}
+        # points-to results restricting virtual dispatch, see Project.pointsto()
+        self.pointsto = None
         # init data
         self.init_hierarchy()
 
     def init_hierarchy(self):
-        for class_name, cls in self.project.classes.items():
-            # resolvingLevel?
-            if 'INTERFACE' in cls.attrs:
-                self.interface_implementers[cls] = []
-                self.dir_sub_interfaces[cls] = []
-            else:
-                self.dir_sub_classes[cls] = []
-
-        for class_name, cls in self.project.classes.items():
-            if self.has_super_class(cls):
-                if 'INTERFACE' in cls.attrs:
-                    # TODO
-                    # super_interfaces
-                    pass
-
-                else:
-                    super_class = self.project.classes[cls.super_class]
-                    self.dir_sub_classes[super_class].append(cls)
-
-                    for i_name in cls.interfaces:
-                        # get interface
-                        if i_name not in self.project.classes:
-                            continue
-                        i = self.project.classes[i_name]
-                        self.interface_implementers[i].append(cls)
-
-        # fill direct implementers with subclasses
-        for class_name, cls in self.project.classes.items():
-            if 'INTERFACE' in cls.attrs:
-                implementers = self.interface_implementers[cls]
-                s = set()
-
-                for c in implementers:
-                    s |= set(self.get_sub_classes_including(c))
-
-                self.interface_implementers[cls] = list(s)
+        with self.project.instrumentation.phase('hierarchy.init'):
+            for class_name, cls in self.project.classes.items():
+                self._link_class(cls)
+
+            for class_name, cls in self.project.classes.items():
+                self._add_class_entries(cls)
+
+            # fill direct implementers with subclasses
+            for class_name, cls in self.project.classes.items():
+                if self.flags(cls) & INTERFACE:
+                    self._fill_interface_implementers(cls)
+
+    def _intern_class(self, cls):
+        self._flags[cls] = modifiers_mask(cls.attrs)
+        for method in cls.methods:
+            self._flags[method] = modifiers_mask(method.attrs)
+
+        package = cls.name.rpartition('.')[0]
+        self._package_ids[cls] = self._packages.setdefault(package, len(self._packages))
+
+    def _forget_class(self, cls):
+        self._flags.pop(cls, None)
+        self._package_ids.pop(cls, None)
+        for method in cls.methods:
+            self._flags.pop(method, None)
+
+    def flags(self, thing):
+        """
+            Modifier mask of a class or method
+        """
+        try:
+            return self._flags[thing]
+        except KeyError:
+            mask = modifiers_mask(thing.attrs)
+            self._flags[thing] = mask
+            return mask
+
+    def package_id(self, cls):
+        try:
+            return self._package_ids[cls]
+        except KeyError:
+            self._intern_class(cls)
+            return self._package_ids[cls]
+
+    def _link_class(self, cls):
+        self._intern_class(cls)
+        if self.flags(cls) & INTERFACE:
+            # an interface "implements" its super interfaces
+            for i_name in cls.interfaces:
+                self._dir_sub_interfaces_by_name[i_name].append(cls)
+
+        else:
+            self._dir_sub_classes_by_name[cls.super_class].append(cls)
+
+            for i_name in cls.interfaces:
+                self._dir_implementers_by_name[i_name].append(cls)
+
+    def _unlink_class(self, cls):
+        if self.flags(cls) & INTERFACE:
+            for i_name in cls.interfaces:
+                self._dir_sub_interfaces_by_name[i_name].remove(cls)
+
+        else:
+            self._dir_sub_classes_by_name[cls.super_class].remove(cls)
+
+            for i_name in cls.interfaces:
+                self._dir_implementers_by_name[i_name].remove(cls)
+
+    def _add_class_entries(self, cls):
+        # resolvingLevel?
+        if self.flags(cls) & INTERFACE:
+            self.interface_implementers[cls] = []
+            self.dir_sub_interfaces[cls] = list(self._dir_sub_interfaces_by_name[cls.name])
+        else:
+            self.dir_sub_classes[cls] = list(self._dir_sub_classes_by_name[cls.name])
+
+    def _fill_interface_implementers(self, interface):
+        s = set()
+
+        for c in self._dir_implementers_by_name[interface.name]:
+            s |= set(self.get_sub_classes_including(c))
+
+        self.interface_implementers[interface] = list(s)
+
+    def ancestor_names(self, cls):
+        """
+            Names of all super classes and super interfaces of cls (transitively),
+            including the ones that are not part of the project
+        """
+        res = set()
+        stack = [cls]
+
+        while stack:
+            current = stack.pop()
+            names = list(current.interfaces)
+            if current.super_class:
+                names.append(current.super_class)
+
+            for name in names:
+                if name in res:
+                    continue
+                res.add(name)
+                if name in self.project.classes:
+                    stack.append(self.project.classes[name])
+
+        return res
+
+    def descendant_names(self, cls):
+        """
+            Names of all classes and interfaces that (transitively) extend or implement cls
+        """
+        res = set()
+        stack = [cls.name]
+
+        while stack:
+            name = stack.pop()
+            for c in self._dir_sub_classes_by_name.get(name, []) + \
+                    self._dir_implementers_by_name.get(name, []) + \
+                    self._dir_sub_interfaces_by_name.get(name, []):
+                if c.name not in res:
+                    res.add(c.name)
+                    stack.append(c.name)
+
+        return res
+
+    def update(self, removed, added, affected):
+        """
+            Incrementally update the hierarchy.
+            project.classes must already contain the added classes (and not the removed ones).
+
+            :param removed: removed (or replaced) class objects
+            :param added: added (or replacing) class objects
+            :param affected: names of the classes whose hierarchy entries changed
+        """
+        for cls in removed:
+            self._unlink_class(cls)
+            self._forget_class(cls)
+            self.interface_implementers.pop(cls, None)
+            self.dir_sub_interfaces.pop(cls, None)
+            self.dir_sub_classes.pop(cls, None)
+            self.sub_classes.pop(cls, None)
+            self.sub_interfaces.pop(cls, None)
+
+        for cls in added:
+            self._link_class(cls)
+
+        # refresh the direct children, invalidate cached closures of the affected classes
+        for name in affected:
+            cls = self.project.classes.get(name)
+            if cls is None:
+                continue
+            self._add_class_entries(cls)
+            self.sub_classes.pop(cls, None)
+            self.sub_interfaces.pop(cls, None)
+            self._implementers.pop(cls, None)
+            self._concrete_implementers.pop(cls, None)
+            self._concrete_sub_classes.pop(cls, None)
+
+        for key in list(self._abstract_dispatch):
+            if key[0].name in affected:
+                del self._abstract_dispatch[key]
+
+        for name in affected:
+            cls = self.project.classes.get(name)
+            if cls is not None and self.flags(cls) & INTERFACE:
+                self._fill_interface_implementers(cls)
 
     def has_super_class(self, cls):
         if cls.super_class:
@@ -116,18 +292,18 @@ class Hierarchy:
         if not self.is_visible_class(cls, method_cls):
             return False
 
-        if 'PUBLIC' in method.attrs:
+        if self.flags(method) & PUBLIC:
             return True
 
-        if 'PRIVATE' in method.attrs:
+        if self.flags(method) & PRIVATE:
             return cls == method_cls
 
         # package visibility
         # FIXME
-        package_from = cls.name.split('.')[:-1]
-        package_to = method_cls.name.split('.')[:-1]
+        package_from = self.package_id(cls)
+        package_to = self.package_id(method_cls)
 
-        if 'PROTECTED' in method.attrs:
+        if self.flags(method) & PROTECTED:
             is_sub = self.is_subclass_including(cls, method_cls)
             is_same_package = package_from == package_to
             return is_sub or is_same_package
@@ -135,20 +311,20 @@ class Hierarchy:
         return package_from == package_to
 
     def is_visible_class(self, cls_from, cls_to):
-        if 'PUBLIC' in cls_to.attrs:
+        if self.flags(cls_to) & PUBLIC:
             return True
 
-        if 'PROTECTED' in cls_to.attrs or 'PRIVATE' in cls_to.attrs:
+        if self.flags(cls_to) & (PROTECTED | PRIVATE):
             return False
 
         # package visibility
         # FIXME
-        package_from = cls_from.name.split('.')[:-1]
-        package_to = cls_to.name.split('.')[:-1]
+        package_from = self.package_id(cls_from)
+        package_to = self.package_id(cls_to)
         return package_from == package_to
 
     def get_super_classes(self, cls):
-        if 'INTERFACE' in cls.attrs:
+        if self.flags(cls) & INTERFACE:
             raise HierarchyError('This is an Interface')
 
         super_classes = []
@@ -172,24 +348,39 @@ class Hierarchy:
         return res
 
     def get_implementers(self, interface):
-        if 'INTERFACE' not in interface.attrs:
+        if not self.flags(interface) & INTERFACE:
             raise HierarchyError('This is not an interface')
 
+        if interface in self._implementers:
+            return self._implementers[interface]
+
         res_set = set()
 
         for i in self.get_sub_interfaces_including(interface):
             res_set |= set(self.interface_implementers[i])
 
-        return list(res_set)
+        self._implementers[interface] = list(res_set)
+        return self._implementers[interface]
+
+    def get_concrete_implementers(self, interface):
+        """
+            Non-abstract classes implementing interface (or one of its sub interfaces),
+            sub classes of the implementers included
+        """
+        if interface not in self._concrete_implementers:
+            self._concrete_implementers[interface] = \
+                [c for c in self.get_implementers(interface) if not self.flags(c) & ABSTRACT]
+
+        return self._concrete_implementers[interface]
 
     def get_sub_interfaces_including(self, interface):
-        res = self.get_sub_interfaces(interface)
+        res = list(self.get_sub_interfaces(interface))
         res.append(interface)
 
         return res
 
     def get_sub_interfaces(self, interface):
-        if 'INTERFACE' not in interface.attrs:
+        if not self.flags(interface) & INTERFACE:
             raise HierarchyError('This is not an interface')
 
         if interface in self.sub_interfaces:
@@ -204,7 +395,7 @@ class Hierarchy:
         return res
 
     def get_sub_classes(self, cls):
-        if 'INTERFACE' in cls.attrs:
+        if self.flags(cls) & INTERFACE:
             raise HierarchyError('This is an Interface. Class needed')
 
         if cls in self.sub_classes:
@@ -219,7 +410,7 @@ class Hierarchy:
         return res
 
     def get_sub_classes_including(self, cls):
-        if 'INTERFACE' in cls.attrs:
+        if self.flags(cls) & INTERFACE:
             raise HierarchyError('This is an Interface. Class needed')
 
         res = []
@@ -228,24 +419,40 @@ class Hierarchy:
 
         return res
 
+    def get_concrete_sub_classes_including(self, cls):
+        """
+            Non-abstract classes among cls and its sub classes
+        """
+        if cls not in self._concrete_sub_classes:
+            self._concrete_sub_classes[cls] = \
+                [c for c in set(self.get_sub_classes_including(cls)) if not self.flags(c) & ABSTRACT]
+
+        return self._concrete_sub_classes[cls]
+
     def resolve_abstract_dispatch(self, cls, method):
-        if 'INTERFACE' in cls.attrs:
-            classes_set = set()
-            for i in self.get_implementers(cls):
-                classes_set |= set(self.get_sub_classes_including(i))
-            classes = list(classes_set)
+        key = (cls, method)
+        hit = key in self._abstract_dispatch
+        self.project.instrumentation.cache('hierarchy.abstract_dispatch', hit)
+        if hit:
+            return list(self._abstract_dispatch[key])
+
+        if self.flags(cls) & INTERFACE:
+            # implementers already include their sub classes
+            classes = self.get_concrete_implementers(cls)
         else:
-            classes = self.get_sub_classes_including(cls)
+            classes = self.get_concrete_sub_classes_including(cls)
 
         res_set = set()
         for c in classes:
-            if 'ABSTRACT' not in c.attrs:
-                res_set.add(self.resolve_concrete_dispatch(c, method))
+            res_set.add(self.resolve_concrete_dispatch(c, method))
 
-        return list(res_set)
+        # in a fixed order: graphs built from the targets (and their traversals)
+        # do not depend on the hashes of the methods
+        self._abstract_dispatch[key] = sorted(res_set, key=get_method_key)
+        return list(self._abstract_dispatch[key])
 
     def resolve_concrete_dispatch(self, cls, method):
-        if 'INTERFACE' in cls.attrs:
+        if self.flags(cls) & INTERFACE:
             raise HierarchyError('class needed!')
 
         for c in self.get_super_classes_including(cls):
@@ -261,7 +468,7 @@ class Hierarchy:
         method_cls = self.project.classes[method.class_name]
         container_cls = self.project.classes[container.class_name]
 
-        if method.name == '<init>' or 'PRIVATE' in method.attrs:
+        if method.name == '<init>' or self.flags(method) & PRIVATE:
             return method
 
         elif self.is_subclass(method_cls, container_cls):
@@ -273,17 +480,22 @@ class Hierarchy:
     # Generic method to resolve invoke
     # Given an invoke expression it figures out which "technique" should apply
     def resolve_invoke(self, invoke_expr, method, container):
+        self.project.instrumentation.count('hierarchy.invoke_resolutions')
         invoke_type = str(type(invoke_expr))
         cls = self.project.classes[method.class_name]
 
         if 'VirtualInvokeExpr' in invoke_type:
             targets = self.resolve_abstract_dispatch(cls, method)
+            if self.pointsto is not None:
+                targets = self.pointsto.filter_targets(container, invoke_expr, targets)
 
         elif 'DynamicInvokeExpr' in invoke_type:
             targets = self.resolve_abstract_dispatch(cls, method)
 
         elif 'InterfaceInvokeExpr' in invoke_type:
             targets = self.resolve_abstract_dispatch(cls, method)
+            if self.pointsto is not None:
+                targets = self.pointsto.filter_targets(container, invoke_expr, targets)
 
         elif 'SpecialInvokeExpr' in invoke_type:
             t = self.resolve_special_dispatch(method, container)
@@ -0,0 +1,478 @@
+"""
+    IFDS tabulation solver (Reps, Horwitz, Sagiv) over turi's ICFG
+
+    Nodes are the statements of the project methods and facts are small integers,
+    both interned on demand. The solver keeps:
+    - path edges (jump functions): for each node, the facts holding at it and,
+      for each of them, the facts at the start of the method they come from
+    - end summaries: for each (callee, fact at the callee start), the facts at its
+      exit nodes, computed once and reused by every call site
+    - incoming edges: the call sites (and their facts) that entered a callee with a fact
+"""
+
+import logging
+
+from collections import deque
+
+from .statements import is_invoke, is_ret, is_assign, is_local_var, is_instance_field_ref, \
+    is_static_field_ref, get_invoke_expr, get_used_locals, get_field_key
+from .models import RET, invoke_locations
+from .utils import match_signature, get_param_locals
+
+log = logging.getLogger('turi.IFDS')
+
+
+ZERO = 0
+
+
+class FactTable:
+    """
+        Interned facts: fact <-> integer ID, ZERO (0) is the empty fact
+    """
+
+    def __init__(self):
+        self._ids = {None: ZERO}
+        self._facts = [None]
+
+    def id(self, fact):
+        try:
+            return self._ids[fact]
+        except KeyError:
+            self._ids[fact] = len(self._facts)
+            self._facts.append(fact)
+            return self._ids[fact]
+
+    def fact(self, fact_id):
+        return self._facts[fact_id]
+
+    def __len__(self):
+        return len(self._facts)
+
+
+class ICFG:
+    """
+        Statement-level interprocedural CFG, built lazily per method.
+        Nodes are integers, see method(), block(), stmt() and index() to go back to the IR.
+    """
+
+    def __init__(self, project):
+        self.project = project
+        self._nodes = []
+        self._succs = []
+        self._method_start = {}
+        self._method_exits = {}
+        self._stmt_nodes = {}
+        self._callees = {}
+
+    def _build_method(self, method):
+        start = len(self._nodes)
+        first = {}
+        for block in method.blocks:
+            first[block] = len(self._nodes)
+            for i, stmt in enumerate(block.statements):
+                self._stmt_nodes[stmt] = len(self._nodes)
+                self._nodes.append((method, block, i))
+                self._succs.append(None)
+
+        cfg = self.project.cfgmethod(method)
+        exits = []
+        for block in method.blocks:
+            n = first[block]
+            last = n + len(block.statements) - 1
+            for node in range(n, last):
+                self._succs[node] = (node + 1,)
+            self._succs[last] = tuple(first[b] for b in cfg.get_next_blocks(block) if b in first)
+            if not self._succs[last] or is_ret(block.statements[-1]):
+                exits.append(last)
+
+        self._method_start[method] = start
+        self._method_exits[method] = tuple(exits)
+
+    def start_node(self, method):
+        if method not in self._method_start:
+            self._build_method(method)
+        return self._method_start[method]
+
+    def exit_nodes(self, method):
+        if method not in self._method_exits:
+            self._build_method(method)
+        return self._method_exits[method]
+
+    def node(self, stmt):
+        """
+            Node of a statement
+        """
+        if stmt not in self._stmt_nodes:
+            self._build_method(self.project.blocks_to_methods[self.project.stmts_to_blocks[stmt]])
+        return self._stmt_nodes[stmt]
+
+    def succs(self, node):
+        return self._succs[node]
+
+    def method(self, node):
+        return self._nodes[node][0]
+
+    def block(self, node):
+        return self._nodes[node][1]
+
+    def index(self, node):
+        return self._nodes[node][2]
+
+    def stmt(self, node):
+        _, block, index = self._nodes[node]
+        return block.statements[index]
+
+    def is_call(self, node):
+        return is_invoke(self.stmt(node))
+
+    def is_exit(self, node):
+        return node in self.exit_nodes(self.method(node))
+
+    def callees(self, node):
+        """
+            Project methods (with a body) called at node
+        """
+        if node in self._callees:
+            return self._callees[node]
+
+        # the call edges of the full CFG
+        targets = self.project.cfgfull().call_targets(self.stmt(node))
+        targets = tuple(t for t in targets if t.blocks)
+
+        self._callees[node] = targets
+        return targets
+
+    def callers(self, method):
+        """
+            Call nodes that may call method
+        """
+        res = []
+        callgraph = self.project.callgraph()
+        if method not in callgraph.graph:
+            return res
+
+        for caller in callgraph.prev(method):
+            self.start_node(caller)
+            for block in caller.blocks:
+                for stmt in block.statements:
+                    if is_invoke(stmt):
+                        node = self._stmt_nodes[stmt]
+                        if method in self.callees(node):
+                            res.append(node)
+        return res
+
+
+class IFDSProblem:
+    """
+        A distributive dataflow problem: flow functions map a fact ID to the fact IDs it generates.
+        ZERO is always generated by ZERO.
+    """
+
+    def __init__(self, icfg):
+        self.icfg = icfg
+        self.facts = FactTable()
+
+    def initial_seeds(self):
+        """
+            (node, fact ID) pairs holding initially
+        """
+        return []
+
+    def normal_flow(self, node, succ, fact):
+        return (fact,)
+
+    def call_flow(self, node, callee, fact):
+        return (fact,)
+
+    def return_flow(self, call_node, callee, exit_node, return_site, fact):
+        return (fact,)
+
+    def call_to_return_flow(self, call_node, return_site, fact):
+        return (fact,)
+
+
+class IFDSSolver:
+    """
+        Tabulation solver. With follow_returns_past_seeds, facts reaching the exit
+        of a seeded method are returned to all its callers (unbalanced returns).
+    """
+
+    def __init__(self, problem, follow_returns_past_seeds=True, max_iter=None):
+        self.problem = problem
+        self.icfg = problem.icfg
+        self.follow_returns_past_seeds = follow_returns_past_seeds
+        self.max_iter = max_iter
+        self.truncated = False
+        # node -> {fact -> set of facts at the start of the method}
+        self._jump = {}
+        # (method, fact at start) -> set of (exit node, fact)
+        self._end_summary = {}
+        # (method, fact at start) -> {call node -> set of facts at the call}
+        self._incoming = {}
+        self._seed_methods = set()
+        self._worklist = deque()
+
+    def solve(self):
+        instr = self.icfg.project.instrumentation
+
+        with instr.phase('ifds.solve'):
+            for node, fact in self.problem.initial_seeds():
+                self._seed_methods.add(self.icfg.method(node))
+                self._propagate(ZERO, node, ZERO)
+                self._propagate(ZERO, node, fact)
+
+            iterations = 0
+            while self._worklist:
+                if self.max_iter is not None and iterations >= self.max_iter:
+                    self.truncated = True
+                    break
+                iterations += 1
+
+                d1, node, d2 = self._worklist.popleft()
+                if instr.enabled:
+                    instr.count('ifds.path_edges')
+
+                if self.icfg.is_call(node):
+                    self._process_call(d1, node, d2)
+                if self.icfg.is_exit(node):
+                    self._process_exit(d1, node, d2)
+                if not self.icfg.is_call(node):
+                    self._process_normal(d1, node, d2)
+
+        return self
+
+    def _propagate(self, d1, node, d2):
+        facts = self._jump.setdefault(node, {})
+        sources = facts.setdefault(d2, set())
+        if d1 not in sources:
+            sources.add(d1)
+            self._worklist.append((d1, node, d2))
+
+    def _process_normal(self, d1, node, d2):
+        for succ in self.icfg.succs(node):
+            for d3 in self.problem.normal_flow(node, succ, d2):
+                self._propagate(d1, succ, d3)
+
+    def _process_call(self, d1, node, d2):
+        return_sites = self.icfg.succs(node)
+
+        for callee in self.icfg.callees(node):
+            start = self.icfg.start_node(callee)
+            for d3 in self.problem.call_flow(node, callee, d2):
+                self._propagate(d3, start, d3)
+                self._incoming.setdefault((callee, d3), {}).setdefault(node, set()).add(d2)
+
+                # reuse the summary of the callee for d3
+                for exit_node, d4 in list(self._end_summary.get((callee, d3), ())):
+                    for return_site in return_sites:
+                        for d5 in self.problem.return_flow(node, callee, exit_node, return_site, d4):
+                            self._propagate(d1, return_site, d5)
+
+        for return_site in return_sites:
+            for d3 in self.problem.call_to_return_flow(node, return_site, d2):
+                self._propagate(d1, return_site, d3)
+
+    def _process_exit(self, d1, node, d2):
+        method = self.icfg.method(node)
+        summary = self._end_summary.setdefault((method, d1), set())
+        if (node, d2) in summary:
+            return
+        summary.add((node, d2))
+
+        incoming = self._incoming.get((method, d1), {})
+        for call_node, call_facts in list(incoming.items()):
+            for return_site in self.icfg.succs(call_node):
+                for d5 in self.problem.return_flow(call_node, method, node, return_site, d2):
+                    # every context the call fact holds in at the call site
+                    for d4 in call_facts:
+                        for d0 in list(self._jump.get(call_node, {}).get(d4, ())):
+                            self._propagate(d0, return_site, d5)
+
+        if self.follow_returns_past_seeds and d1 == ZERO and method in self._seed_methods:
+            # unbalanced returns, to the callers that did not enter method with ZERO
+            for call_node in self.icfg.callers(method):
+                if call_node in incoming:
+                    continue
+                caller = self.icfg.method(call_node)
+                self._seed_methods.add(caller)
+                for return_site in self.icfg.succs(call_node):
+                    for d5 in self.problem.return_flow(call_node, method, node, return_site, d2):
+                        self._propagate(ZERO, return_site, ZERO)
+                        self._propagate(ZERO, return_site, d5)
+
+    def facts_at(self, node):
+        """
+            IDs of the facts holding before node
+        """
+        return set(self._jump.get(node, ()))
+
+    def values_at(self, node):
+        """
+            Facts holding before node (ZERO excluded)
+        """
+        return set(self.problem.facts.fact(d) for d in self.facts_at(node) if d != ZERO)
+
+
+def _field_fact(ref):
+    key = get_field_key(ref)
+    return ('field',) + key if key is not None else None
+
+
+class IFDSTaintProblem(IFDSProblem):
+    """
+        Taint problem: facts are local names (tainted in the method of the node)
+        or ('field', name, class) for tainted fields.
+        Results of the calls to sources are tainted, the sinks are reported by sinks_reached().
+    """
+
+    def __init__(self, icfg, sources, sinks):
+        super().__init__(icfg)
+        self.sources = set(tuple(s) for s in sources)
+        self.sinks = set(tuple(s) for s in sinks)
+        self._params = {}
+
+    def initial_seeds(self):
+        seeds = []
+        for cls in self.icfg.project.classes.values():
+            for method in cls.methods:
+                for block in method.blocks:
+                    for stmt in block.statements:
+                        if is_invoke(stmt) and is_assign(stmt) and \
+                                match_signature(self.sources, get_invoke_expr(stmt)):
+                            seeds.append((self.icfg.start_node(method), ZERO))
+                            break
+        return seeds
+
+    def _is_field(self, fact):
+        value = self.facts.fact(fact)
+        return isinstance(value, tuple)
+
+    def normal_flow(self, node, succ, fact):
+        stmt = self.icfg.stmt(node)
+        if fact == ZERO or not is_assign(stmt):
+            return (fact,)
+
+        value = self.facts.fact(fact)
+        left_op = stmt.left_op
+        right_op = stmt.right_op
+
+        if is_instance_field_ref(right_op) or is_static_field_ref(right_op):
+            flows = _field_fact(right_op) == value
+        else:
+            flows = value in get_used_locals(right_op)
+
+        res = []
+        if is_local_var(left_op):
+            if value != left_op.name:
+                res.append(fact)
+            if flows:
+                res.append(self.facts.id(left_op.name))
+
+        else:
+            res.append(fact)
+            if flows and (is_instance_field_ref(left_op) or is_static_field_ref(left_op)):
+                field = _field_fact(left_op)
+                if field is not None:
+                    res.append(self.facts.id(field))
+            elif flows and is_local_var(getattr(left_op, 'base', None)):
+                # array element: the whole array is tainted
+                res.append(self.facts.id(left_op.base.name))
+
+        return res
+
+    def _callee_params(self, callee):
+        if callee not in self._params:
+            self._params[callee] = dict((loc, local.name) for loc, local in get_param_locals(callee).items())
+        return self._params[callee]
+
+    def call_flow(self, node, callee, fact):
+        if fact == ZERO or self._is_field(fact):
+            return (fact,)
+
+        stmt = self.icfg.stmt(node)
+        if match_signature(self.sources, get_invoke_expr(stmt)):
+            return ()
+
+        name = self.facts.fact(fact)
+        params = self._callee_params(callee)
+        return [self.facts.id(params[loc]) for loc, var in invoke_locations(stmt).items()
+                if loc != RET and var == name and loc in params]
+
+    def return_flow(self, call_node, callee, exit_node, return_site, fact):
+        if fact == ZERO:
+            return ()
+        if self._is_field(fact):
+            return (fact,)
+
+        ret = self.icfg.stmt(exit_node)
+        call = self.icfg.stmt(call_node)
+        if is_assign(call) and is_ret(ret) and getattr(ret, 'value', None) is not None:
+            if self.facts.fact(fact) in get_used_locals(ret.value):
+                return (self.facts.id(call.left_op.name),)
+        return ()
+
+    def call_to_return_flow(self, call_node, return_site, fact):
+        stmt = self.icfg.stmt(call_node)
+        locations = invoke_locations(stmt)
+        left = locations.get(RET)
+
+        if fact == ZERO:
+            if left is not None and match_signature(self.sources, get_invoke_expr(stmt)):
+                return (ZERO, self.facts.id(left))
+            return (ZERO,)
+
+        if self._is_field(fact):
+            return (fact,)
+
+        name = self.facts.fact(fact)
+        res = [] if name == left else [fact]
+
+        if not self.icfg.callees(call_node) and not match_signature(self.sources, get_invoke_expr(stmt)):
+            # external method: apply its model
+            tainted_locs = set(loc for loc, var in locations.items() if loc != RET and var == name)
+            if tainted_locs:
+                model = self.icfg.project.external_model(get_invoke_expr(stmt))
+                out = model.forward(tainted_locs) if model is not None else {RET}
+                res.extend(self.facts.id(locations[loc]) for loc in out if loc in locations)
+
+        return res
+
+    def sinks_reached(self, solver):
+        """
+            (block, stmt index) of the sink calls with a tainted argument
+        """
+        res = []
+        for node, facts in solver._jump.items():
+            stmt = self.icfg.stmt(node)
+            if not is_invoke(stmt) or not match_signature(self.sinks, get_invoke_expr(stmt)):
+                continue
+
+            args = set(var for loc, var in invoke_locations(stmt).items() if loc != RET)
+            if any(self.facts.fact(f) in args for f in facts if f != ZERO and not self._is_field(f)):
+                res.append((self.icfg.block(node), self.icfg.index(node)))
+        return res
+
+
+class IFDSTaintAnalysis:
+    """
+        Context-sensitive source-sink taint analysis on top of the IFDS solver
+    """
+
+    def __init__(self, project, sources, sinks, max_iter=None):
+        self.project = project
+        self.icfg = ICFG(project)
+        self.problem = IFDSTaintProblem(self.icfg, sources, sinks)
+        self.solver = IFDSSolver(self.problem, max_iter=max_iter)
+
+    def run(self):
+        """
+            Returns the (block, stmt index) of the sink calls reached by tainted values
+        """
+        self.solver.solve()
+        return self.problem.sinks_reached(self.solver)
+
+    def tainted_at(self, stmt):
+        """
+            Tainted locals (and fields) before stmt
+        """
+        return self.solver.values_at(self.icfg.node(stmt))
@@ -0,0 +1,72 @@
+"""
+    Program-wide statement indexes, built in a single pass
+"""
+
+import logging
+
+from collections import defaultdict
+
+from .statements import is_invoke, is_assign, is_instance_field_ref, is_static_field_ref, is_local_var
+from .utils import walk_all_statements
+
+log = logging.getLogger('turi.StatementIndex')
+
+
+class StatementIndex:
+    """
+        Indexes of the statements the heuristics look for:
+        - getClass() call sites
+        - static field stores and instance field loads, per (class, field)
+        - add* calls, per (method, base variable)
+        - method names defined by each class
+    """
+
+    def __init__(self, project):
+        self.project = project
+        # (cls, method, stmt)
+        self.get_class_sites = []
+        # (class name, field name) -> [(cls, method, stmt)]
+        self.static_field_stores = defaultdict(list)
+        self.instance_field_loads = defaultdict(list)
+        # (method, base name) -> [stmt]
+        self.add_calls = defaultdict(list)
+        # class name -> set of method names
+        self.defined_methods = {}
+
+        self.build()
+
+    def build(self):
+        with self.project.instrumentation.phase('index.build'):
+            for cls in self.project.classes.values():
+                self.defined_methods[cls.name] = set(m.name for m in cls.methods)
+
+            for cls, method, stmt in walk_all_statements(self.project.classes):
+                if is_invoke(stmt):
+                    self._add_invoke(cls, method, stmt)
+
+                elif is_assign(stmt):
+                    self._add_assign(cls, method, stmt)
+
+    def _add_invoke(self, cls, method, stmt):
+        invoke_expr = stmt.invoke_expr if hasattr(stmt, 'invoke_expr') else stmt.right_op
+
+        if invoke_expr.class_name == 'java.lang.Object' and invoke_expr.method_name == 'getClass':
+            if not hasattr(stmt, 'invoke_expr'):
+                self.get_class_sites.append((cls, method, stmt))
+
+        elif invoke_expr.method_name.startswith('add') and hasattr(invoke_expr, 'base'):
+            self.add_calls[(method, invoke_expr.base.name)].append(stmt)
+
+    def _add_assign(self, cls, method, stmt):
+        left_op = stmt.left_op
+        right_op = stmt.right_op
+
+        if is_static_field_ref(left_op) and hasattr(left_op, 'field'):
+            self.static_field_stores[(cls.name, left_op.field[0])].append((cls, method, stmt))
+
+        elif is_instance_field_ref(right_op) and hasattr(right_op, 'field'):
+            if is_local_var(left_op):
+                self.instance_field_loads[(cls.name, right_op.field[0])].append((cls, method, stmt))
+
+    def is_defined(self, class_name, method_name):
+        return method_name in self.defined_methods.get(class_name, ())
@@ -0,0 +1,129 @@
+"""
+    Opt-in instrumentation: per-phase timers and event counters
+
+    Pass an Instrumentation to the Project to enable it:
+
+        instr = Instrumentation()
+        p = Project(app_path, instrumentation=instr)
+        ...
+        instr.to_json('stats.json')
+
+    By default the project uses NULL_INSTRUMENTATION, whose methods do nothing.
+    Hot loops only record events if `enabled` is set.
+"""
+
+import json
+import time
+
+from collections import defaultdict
+
+
+class _Phase:
+    __slots__ = ('_instr', '_name', '_wall', '_cpu')
+
+    def __init__(self, instr, name):
+        self._instr = instr
+        self._name = name
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stats = self._instr.phases[self._name]
+        stats[0] += 1
+        stats[1] += time.perf_counter() - self._wall
+        stats[2] += time.process_time() - self._cpu
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class Instrumentation:
+    """
+        Records, per run:
+        - phases: number of calls, wall and CPU time (nested phases are included in their parents)
+        - counters: number of events (block visits, queue pushes, ...)
+        - caches: hits and misses
+    """
+    enabled = True
+
+    def __init__(self):
+        self.phases = defaultdict(lambda: [0, 0.0, 0.0])
+        self.counters = defaultdict(int)
+        self.caches = defaultdict(lambda: [0, 0])
+
+    def phase(self, name):
+        """
+            Context manager timing a phase
+        """
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def cache(self, name, hit):
+        """
+            Record a lookup in a cache
+        """
+        self.caches[name][0 if hit else 1] += 1
+
+    def hit_rate(self, name):
+        hits, misses = self.caches.get(name, (0, 0))
+        if hits + misses == 0:
+            return None
+        return hits / (hits + misses)
+
+    def reset(self):
+        self.phases.clear()
+        self.counters.clear()
+        self.caches.clear()
+
+    def to_dict(self):
+        return {
+            'phases': dict((name, {'calls': calls, 'wall': wall, 'cpu': cpu})
+                           for name, (calls, wall, cpu) in sorted(self.phases.items())),
+            'counters': dict(sorted(self.counters.items())),
+            'caches': dict((name, {'hits': hits, 'misses': misses, 'hit_rate': self.hit_rate(name)})
+                           for name, (hits, misses) in sorted(self.caches.items())),
+        }
+
+    def to_json(self, path=None):
+        """
+            JSON report of the run, written to path if given
+        """
+        data = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as fp:
+                fp.write(data)
+        return data
+
+
+class NullInstrumentation(Instrumentation):
+    """
+        Instrumentation that records nothing
+    """
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def count(self, name, n=1):
+        pass
+
+    def cache(self, name, hit):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
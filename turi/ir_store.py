@@ -0,0 +1,742 @@
+"""
+    Memory-mapped store of the lifted IR: a lazy, per-class replacement for pickling the classes
+
+    The object tree of each class is flattened into value nodes, stored column-wise:
+        kinds      uint8[n_nodes]    kind of the node (see below)
+        arg0       uint32[n_nodes]   string ID / type ID / int or float index / children start / body ID
+        arg1       uint32[n_nodes]   children start (objects) / number of children / body field
+        children   uint32[...]       node IDs of the children (list items, dict keys and values, fields)
+        ints       int64[...]
+        floats     float64[...]
+    plus a string table, a type table (class module, qualified name and field names),
+    a unit table (class name, root node) and a body table (root node of each method body).
+
+    A class is decoded, with its original types, the first time it is accessed.
+    The body of a method (its blocks and the dicts over them, see _BODY_FIELDS)
+    is a separate unit: the class holds proxies to it, and the body is decoded
+    the first time one of them is used, replacing the proxies on the method. So
+    the memory grows with the methods a query touches, and passes reading only
+    the class headers (the hierarchy) decode no statement. Passes walking every
+    statement (CFGFull, indexes, points-to) still decode the whole program.
+
+    Measured on the synthetic 'large' program (benchmarks/run.py: 343 classes,
+    3.4k methods, 25k blocks), private memory over the interpreter (the mapped
+    pages of the store are shared with the page cache and not counted):
+                        pickle          store
+        startup         1.6s, 193MB     0.001s, 0MB
+        one method      193MB           <1MB
+        + hierarchy     193MB           4MB
+        + CFGFull       427MB           420MB
+
+    The columns hold generic value nodes, not a per-statement layout: statements
+    are decoded a method body at a time, so the analyses get the IR objects
+    exactly as a freshly lifted class.
+
+    Only the types of allowed modules (pysoot's, see allow_module()) are decoded:
+    the store names the modules of its types, and loading it never imports others.
+"""
+
+import os
+import sys
+import mmap
+import struct
+import logging
+import importlib
+
+from array import array
+from collections import defaultdict
+from collections.abc import MutableMapping
+
+log = logging.getLogger('turi.IRStore')
+
+
+MAGIC = b'TURIIR02'
+
+# node kinds
+NONE = 0
+TRUE = 1
+FALSE = 2
+INT = 3
+BIGINT = 4
+FLOAT = 5
+STR = 6
+LIST = 7
+TUPLE = 8
+SET = 9
+FROZENSET = 10
+DICT = 11
+DEFAULTDICT = 12
+OBJECT = 13
+TYPE = 14
+BODY = 15
+
+# magic, n_strings, n_types, n_nodes, n_units, n_bodies, then the offsets of the 15 sections
+_HEADER = struct.Struct('<8sIIIII15Q')
+
+_SECTIONS = ('strings', 'string_offsets', 'type_modules', 'type_names', 'type_field_offsets',
+             'type_fields', 'kinds', 'arg0', 'arg1', 'children', 'ints', 'floats',
+             'unit_names', 'unit_roots', 'body_roots')
+
+# fields of a method holding its body: stored apart, decoded on first access
+_BODY_FIELDS = ('blocks', 'block_by_label', 'exceptional_preds', 'basic_cfg')
+
+_SEQUENCES = {list: LIST, tuple: TUPLE, set: SET, frozenset: FROZENSET}
+
+# modules (and their sub modules) whose classes can be stored, see allow_module()
+_ALLOWED_MODULES = {'pysoot'}
+
+# builtin types that can be stored as values (e.g., the default factory of a defaultdict)
+_BUILTIN_TYPES = dict((t.__name__, t) for t in (list, tuple, set, frozenset, dict, int, float, str, bool))
+
+
+class IRStoreError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+def allow_module(name):
+    """
+        Allow the classes of a module (and of its sub modules) in the stores, besides pysoot's IR
+    """
+    _ALLOWED_MODULES.add(name)
+
+
+def _is_allowed(module, name):
+    if module == 'builtins':
+        return name in _BUILTIN_TYPES
+    return any(module == m or module.startswith(m + '.') for m in _ALLOWED_MODULES)
+
+
+def _check_type(klass):
+    name = getattr(klass, '__qualname__', klass.__name__)
+    if not _is_allowed(klass.__module__, name):
+        raise IRStoreError('Cannot store value of type {}.{} (see allow_module)'.format(klass.__module__, name))
+
+
+def _to_le(arr):
+    if sys.byteorder != 'little':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _object_fields(obj):
+    """
+        Names of the attributes set on obj, from __slots__ and __dict__
+    """
+    fields = []
+    for klass in type(obj).__mro__:
+        slots = klass.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name not in ('__dict__', '__weakref__') and name not in fields and hasattr(obj, name):
+                fields.append(name)
+
+    for name in getattr(obj, '__dict__', ()):
+        if name not in fields:
+            fields.append(name)
+
+    return tuple(fields)
+
+
+class IRStoreWriter:
+    """
+        Flattens classes into the columns of the store
+    """
+
+    def __init__(self):
+        self._strings = {}
+        self._types = {}
+        self._type_modules = array('I')
+        self._type_names = array('I')
+        self._type_field_offsets = array('I', [0])
+        self._type_fields = array('I')
+
+        self._kinds = array('B')
+        self._arg0 = array('I')
+        self._arg1 = array('I')
+        self._children = array('I')
+        self._ints = array('q')
+        self._floats = array('d')
+
+        self._unit_names = array('I')
+        self._unit_roots = array('I')
+        self._body_roots = array('I')
+
+        # per unit memos: shared objects are stored once
+        self._memo = {}
+        self._keep_alive = []
+
+    def _string(self, s):
+        try:
+            return self._strings[s]
+        except KeyError:
+            self._strings[s] = len(self._strings)
+            return self._strings[s]
+
+    def _type(self, klass, fields):
+        key = (klass, fields)
+        try:
+            return self._types[key]
+        except KeyError:
+            pass
+
+        _check_type(klass)
+        type_id = len(self._types)
+        self._types[key] = type_id
+        self._type_modules.append(self._string(klass.__module__))
+        self._type_names.append(self._string(getattr(klass, '__qualname__', klass.__name__)))
+        for name in fields:
+            self._type_fields.append(self._string(name))
+        self._type_field_offsets.append(len(self._type_fields))
+        return type_id
+
+    def _new_node(self, kind, arg0=0, arg1=0):
+        self._kinds.append(kind)
+        self._arg0.append(arg0)
+        self._arg1.append(arg1)
+        return len(self._kinds) - 1
+
+    def _children_start(self, nodes):
+        start = len(self._children)
+        self._children.extend(nodes)
+        return start
+
+    def add_class(self, cls):
+        """
+            Add a class as a new unit
+        """
+        self._memo = {}
+        self._keep_alive = []
+        root = self._encode(cls)
+        self._unit_names.append(self._string(cls.name))
+        self._unit_roots.append(root)
+
+    def _add_body(self, method, fields):
+        """
+            Add the body fields of a method as a new unit, return its ID
+        """
+        # blocks are only referred to from the body, which has its own memo
+        memo, self._memo = self._memo, {}
+        root = self._encode(tuple(getattr(method, name) for name in fields))
+        self._memo = memo
+        self._body_roots.append(root)
+        return len(self._body_roots) - 1
+
+    def _encode(self, value):
+        if value is None:
+            return self._new_node(NONE)
+        if value is True:
+            return self._new_node(TRUE)
+        if value is False:
+            return self._new_node(FALSE)
+
+        vtype = type(value)
+        if vtype is str:
+            key = ('s', value)
+            if key not in self._memo:
+                self._memo[key] = self._new_node(STR, self._string(value))
+            return self._memo[key]
+
+        if vtype is int:
+            if -2 ** 63 <= value < 2 ** 63:
+                self._ints.append(value)
+                return self._new_node(INT, len(self._ints) - 1)
+            return self._new_node(BIGINT, self._string(str(value)))
+
+        if vtype is float:
+            self._floats.append(value)
+            return self._new_node(FLOAT, len(self._floats) - 1)
+
+        if isinstance(value, type):
+            _check_type(value)
+            return self._new_node(TYPE, self._string(value.__module__), self._string(value.__qualname__))
+
+        # containers and objects can be shared (and cyclic, for objects)
+        if id(value) in self._memo:
+            return self._memo[id(value)]
+        self._keep_alive.append(value)
+
+        if vtype in _SEQUENCES:
+            nodes = [self._encode(item) for item in value]
+            node = self._new_node(_SEQUENCES[vtype], self._children_start(nodes), len(nodes))
+
+        elif vtype is dict or vtype is defaultdict:
+            nodes = []
+            if vtype is defaultdict:
+                nodes.append(self._encode(value.default_factory))
+            for k, v in value.items():
+                nodes.append(self._encode(k))
+                nodes.append(self._encode(v))
+            kind = DICT if vtype is dict else DEFAULTDICT
+            node = self._new_node(kind, self._children_start(nodes), len(value))
+
+        else:
+            fields = _object_fields(value)
+            if not fields and not hasattr(value, '__dict__'):
+                raise IRStoreError('Cannot store value of type {}'.format(vtype.__name__))
+
+            # the node is allocated first, so that cycles can refer to it
+            node = self._new_node(OBJECT, self._type(vtype, fields))
+            self._memo[id(value)] = node
+
+            body_fields = [name for name in _BODY_FIELDS if name in fields] if 'blocks' in fields else []
+            body = self._add_body(value, body_fields) if body_fields else None
+            nodes = []
+            for name in fields:
+                if name in body_fields:
+                    nodes.append(self._new_node(BODY, body, body_fields.index(name)))
+                else:
+                    nodes.append(self._encode(getattr(value, name)))
+            self._arg1[node] = self._children_start(nodes)
+
+        self._memo[id(value)] = node
+        return node
+
+    def write(self, path):
+        strings = sorted(self._strings, key=self._strings.get)
+        string_offsets = array('Q', [0])
+        data = []
+        for s in strings:
+            encoded = s.encode('utf-8', 'surrogatepass')
+            data.append(encoded)
+            string_offsets.append(string_offsets[-1] + len(encoded))
+
+        sections = {
+            'strings': b''.join(data),
+            'string_offsets': _to_le(string_offsets),
+            'type_modules': _to_le(self._type_modules),
+            'type_names': _to_le(self._type_names),
+            'type_field_offsets': _to_le(self._type_field_offsets),
+            'type_fields': _to_le(self._type_fields),
+            'kinds': self._kinds.tobytes(),
+            'arg0': _to_le(self._arg0),
+            'arg1': _to_le(self._arg1),
+            'children': _to_le(self._children),
+            'ints': _to_le(self._ints),
+            'floats': _to_le(self._floats),
+            'unit_names': _to_le(self._unit_names),
+            'unit_roots': _to_le(self._unit_roots),
+            'body_roots': _to_le(self._body_roots),
+        }
+
+        offsets = []
+        with open(path, 'wb') as fp:
+            fp.write(b'\0' * _HEADER.size)
+            for name in _SECTIONS:
+                fp.write(b'\0' * (-fp.tell() % 8))
+                offsets.append(fp.tell())
+                fp.write(sections[name])
+
+            fp.seek(0)
+            fp.write(_HEADER.pack(MAGIC, len(strings), len(self._types), len(self._kinds),
+                                  len(self._unit_names), len(self._body_roots), *offsets))
+
+
+def write_ir_store(classes, path):
+    """
+        Store the classes (name -> class) in a new store at path
+    """
+    writer = IRStoreWriter()
+    for name in sorted(classes):
+        writer.add_class(classes[name])
+    writer.write(path)
+
+
+class IRStore:
+    """
+        Read-only, memory-mapped store
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fp = open(path, 'rb')
+        if os.fstat(self._fp.fileno()).st_size < _HEADER.size:
+            raise IRStoreError('Not an IR store')
+        self._mmap = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        header = _HEADER.unpack_from(self._mmap, 0)
+        if header[0] != MAGIC:
+            raise IRStoreError('Not an IR store')
+
+        n_strings, n_types, n_nodes, n_units, n_bodies = header[1:6]
+        self._offsets = dict(zip(_SECTIONS, header[6:]))
+
+        self._string_offsets = self._array('string_offsets', 'Q', n_strings + 1)
+        self._type_modules = self._array('type_modules', 'I', n_types)
+        self._type_names = self._array('type_names', 'I', n_types)
+        self._type_field_offsets = self._array('type_field_offsets', 'I', n_types + 1)
+        self._type_fields = self._array('type_fields', 'I', self._type_field_offsets[n_types])
+        self._kinds = self._array('kinds', 'B', n_nodes)
+        self._arg0 = self._array('arg0', 'I', n_nodes)
+        self._arg1 = self._array('arg1', 'I', n_nodes)
+        self._children = self._array('children', 'I', self._section_length('children', 'I'))
+        self._ints = self._array('ints', 'q', self._section_length('ints', 'q'))
+        self._floats = self._array('floats', 'd', self._section_length('floats', 'd'))
+        unit_names = self._array('unit_names', 'I', n_units)
+        self._unit_roots = self._array('unit_roots', 'I', n_units)
+        self._body_roots = self._array('body_roots', 'I', n_bodies)
+
+        self._strings = {}
+        self._types = {}
+        self._units = dict((self.string(s), i) for i, s in enumerate(unit_names))
+
+    def _section_length(self, section, typecode):
+        i = _SECTIONS.index(section)
+        end = self._offsets[_SECTIONS[i + 1]] if i + 1 < len(_SECTIONS) else len(self._mmap)
+        # sections are padded to 8 bytes, the padding is never read
+        return (end - self._offsets[section]) // array(typecode).itemsize
+
+    def _array(self, section, typecode, length):
+        start = self._offsets[section]
+        size = array(typecode).itemsize * length
+        if sys.byteorder == 'little':
+            return self._view[start:start + size].cast(typecode)
+
+        arr = array(typecode)
+        arr.frombytes(self._view[start:start + size])
+        arr.byteswap()
+        return arr
+
+    def string(self, string_id):
+        try:
+            return self._strings[string_id]
+        except KeyError:
+            pass
+
+        start = self._offsets['strings'] + self._string_offsets[string_id]
+        end = self._offsets['strings'] + self._string_offsets[string_id + 1]
+        s = bytes(self._view[start:end]).decode('utf-8', 'surrogatepass')
+        self._strings[string_id] = s
+        return s
+
+    def _import(self, module_id, name_id):
+        module_name = self.string(module_id)
+        name = self.string(name_id)
+        if not _is_allowed(module_name, name):
+            raise IRStoreError('Type {}.{} is not allowed in an IR store'.format(module_name, name))
+
+        if module_name == 'builtins':
+            return _BUILTIN_TYPES[name]
+
+        obj = importlib.import_module(module_name)
+        for part in name.split('.'):
+            obj = getattr(obj, part, None)
+
+        # only classes defined in the module, not whatever it imports
+        if not isinstance(obj, type) or obj.__module__ != module_name:
+            raise IRStoreError('Type {}.{} not found'.format(module_name, name))
+        return obj
+
+    def _type(self, type_id):
+        try:
+            return self._types[type_id]
+        except KeyError:
+            pass
+
+        klass = self._import(self._type_modules[type_id], self._type_names[type_id])
+        start = self._type_field_offsets[type_id]
+        end = self._type_field_offsets[type_id + 1]
+        fields = [self.string(self._type_fields[i]) for i in range(start, end)]
+        self._types[type_id] = klass, fields
+        return klass, fields
+
+    def class_names(self):
+        return self._units.keys()
+
+    def __contains__(self, class_name):
+        return class_name in self._units
+
+    def __len__(self):
+        return len(self._units)
+
+    def load_class(self, class_name, on_body=None):
+        """
+            Decode a class. The bodies of its methods are decoded on first access.
+
+            :param on_body: called with each method whose body has been decoded
+        """
+        unit = self._units[class_name]
+        return self._decode(self._unit_roots[unit], {}, on_body)
+
+    def _load_body(self, body_id):
+        return self._decode(self._body_roots[body_id], {})
+
+    def _decode(self, node, memo, on_body=None):
+        if node in memo:
+            return memo[node]
+
+        kind = self._kinds[node]
+        arg0 = self._arg0[node]
+        arg1 = self._arg1[node]
+
+        if kind == NONE:
+            return None
+        if kind == TRUE:
+            return True
+        if kind == FALSE:
+            return False
+        if kind == INT:
+            return self._ints[arg0]
+        if kind == BIGINT:
+            return int(self.string(arg0))
+        if kind == FLOAT:
+            return self._floats[arg0]
+        if kind == STR:
+            return self.string(arg0)
+        if kind == TYPE:
+            return self._import(arg0, arg1)
+
+        if kind == LIST:
+            value = []
+            memo[node] = value
+            value.extend(self._decode(self._children[i], memo, on_body) for i in range(arg0, arg0 + arg1))
+        elif kind in (TUPLE, SET, FROZENSET):
+            items = [self._decode(self._children[i], memo, on_body) for i in range(arg0, arg0 + arg1)]
+            value = {TUPLE: tuple, SET: set, FROZENSET: frozenset}[kind](items)
+        elif kind in (DICT, DEFAULTDICT):
+            start = arg0
+            if kind == DICT:
+                value = {}
+            else:
+                value = defaultdict(self._decode(self._children[start], memo, on_body))
+                start += 1
+            memo[node] = value
+            for i in range(start, start + 2 * arg1, 2):
+                key = self._decode(self._children[i], memo, on_body)
+                value[key] = self._decode(self._children[i + 1], memo, on_body)
+        elif kind == OBJECT:
+            klass, fields = self._type(arg0)
+            value = klass.__new__(klass)
+            memo[node] = value
+            body = None
+            for i, name in enumerate(fields):
+                child = self._children[arg1 + i]
+                if self._kinds[child] == BODY:
+                    if body is None:
+                        body = _MethodBody(self, self._arg0[child], value, on_body)
+                    field = body.proxy(self._arg1[child], name)
+                else:
+                    field = self._decode(child, memo, on_body)
+                object.__setattr__(value, name, field)
+        else:
+            raise IRStoreError('Unknown node kind {}'.format(kind))
+
+        memo[node] = value
+        return value
+
+    def close(self):
+        for name in ('_string_offsets', '_type_modules', '_type_names', '_type_field_offsets',
+                     '_type_fields', '_kinds', '_arg0', '_arg1', '_children', '_ints',
+                     '_floats', '_unit_roots', '_body_roots'):
+            arr = getattr(self, name)
+            if isinstance(arr, memoryview):
+                arr.release()
+        self._view.release()
+        self._mmap.close()
+        self._fp.close()
+
+
+def _resolved(value):
+    return value
+
+
+class _MethodBody:
+    """
+        Body of a stored method, decoded the first time one of its proxies is used
+    """
+
+    def __init__(self, store, body_id, method, on_load=None):
+        self.store = store
+        self.body_id = body_id
+        self.method = method
+        self.on_load = on_load
+        self.proxies = {}
+        self.values = None
+
+    def proxy(self, index, name):
+        self.proxies[index] = name, _LazyBody(self, index)
+        return self.proxies[index][1]
+
+    def load(self):
+        if self.values is None:
+            self.values = self.store._load_body(self.body_id)
+            # later accesses get the decoded values, unless a field has been reassigned
+            for index, (name, proxy) in self.proxies.items():
+                if getattr(self.method, name, None) is proxy:
+                    object.__setattr__(self.method, name, self.values[index])
+            if self.on_load is not None:
+                self.on_load(self.method)
+        return self.values
+
+
+class _LazyBody:
+    """
+        Stand-in for a body field of a stored method (a list or a dict over its blocks)
+    """
+
+    __slots__ = ('_body', '_index')
+    __hash__ = None
+
+    def __init__(self, body, index):
+        self._body = body
+        self._index = index
+
+    def _value(self):
+        return self._body.load()[self._index]
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._value(), name)
+
+    def __len__(self):
+        return len(self._value())
+
+    def __bool__(self):
+        return bool(self._value())
+
+    def __iter__(self):
+        return iter(self._value())
+
+    def __reversed__(self):
+        return reversed(self._value())
+
+    def __contains__(self, item):
+        return item in self._value()
+
+    def __getitem__(self, key):
+        return self._value()[key]
+
+    def __setitem__(self, key, value):
+        self._value()[key] = value
+
+    def __delitem__(self, key):
+        del self._value()[key]
+
+    def __eq__(self, other):
+        if isinstance(other, _LazyBody):
+            other = other._value()
+        return self._value() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self._value())
+
+    def __reduce_ex__(self, protocol):
+        # pickled (and copied) as the decoded value
+        return _resolved, (self._value(),)
+
+
+def is_body_loaded(method):
+    """
+        False if the body of a stored method has not been decoded yet
+    """
+    return not isinstance(getattr(method, 'blocks', None), _LazyBody)
+
+
+class StoredClasses(MutableMapping):
+    """
+        Classes of a project, decoded from the store the first time they are accessed.
+        Classes can be added or replaced, as with a plain dict.
+        Iterating the names decodes nothing, iterating the classes decodes
+        them without the bodies of their methods.
+    """
+
+    def __init__(self, store, on_load=None, on_body=None):
+        self.store = store
+        self.on_load = on_load
+        # called with (class, method) when the body of a method is decoded
+        self.on_body = on_body
+        self._loaded = {}
+        self._removed = set()
+
+    def is_loaded(self, class_name):
+        return class_name in self._loaded or class_name not in self
+
+    def __getitem__(self, class_name):
+        try:
+            return self._loaded[class_name]
+        except KeyError:
+            pass
+
+        if class_name in self._removed or class_name not in self.store:
+            raise KeyError(class_name)
+
+        cls = self.store.load_class(class_name, on_body=lambda method: self._body_loaded(cls, method))
+        self._loaded[class_name] = cls
+        if self.on_load is not None:
+            self.on_load(cls)
+        return cls
+
+    def _body_loaded(self, cls, method):
+        # bodies of classes removed or replaced since are not indexed
+        if self.on_body is not None and self._loaded.get(cls.name) is cls:
+            self.on_body(cls, method)
+
+    def __setitem__(self, class_name, cls):
+        self._removed.discard(class_name)
+        self._loaded[class_name] = cls
+
+    def __delitem__(self, class_name):
+        if class_name not in self:
+            raise KeyError(class_name)
+        self._loaded.pop(class_name, None)
+        if class_name in self.store:
+            self._removed.add(class_name)
+
+    def __contains__(self, class_name):
+        if class_name in self._loaded:
+            return True
+        return class_name in self.store and class_name not in self._removed
+
+    def __iter__(self):
+        for class_name in self.store.class_names():
+            if class_name not in self._removed:
+                yield class_name
+        for class_name in list(self._loaded):
+            if class_name not in self.store:
+                yield class_name
+
+    def __len__(self):
+        # names are enumerated, nothing is decoded
+        added = sum(1 for class_name in self._loaded if class_name not in self.store)
+        return len(self.store) - len(self._removed) + added
+
+
+class LazyMethodIndex(dict):
+    """
+        Method key -> method, loading the class of a method the first time it is looked up
+    """
+
+    def __init__(self, classes):
+        super().__init__()
+        self._classes = classes
+
+    def _load(self, key):
+        class_name = key[0]
+        if self._classes.is_loaded(class_name):
+            return False
+        # loading the class indexes its methods
+        self._classes[class_name]
+        return True
+
+    def __missing__(self, key):
+        if self._load(key):
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+        return self._load(key) and dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
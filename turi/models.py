@@ -0,0 +1,167 @@
+"""
+    Taint transfer models for external (library) methods
+"""
+
+import os
+import json
+import logging
+
+from .utils import BASE, RET
+
+log = logging.getLogger('turi.Models')
+
+
+DEFAULT_MODELS = os.path.join(os.path.dirname(__file__), 'data', 'external_models.json')
+
+
+class ModelsError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+class ExternalModel:
+    """
+        Summary of an external method: the list of (src, dst) flows,
+        where src and dst are BASE, RET or the index of an argument
+    """
+
+    def __init__(self, flows):
+        self.flows = tuple(flows)
+        self._forward = {}
+        self._backward = {}
+        for src, dst in self.flows:
+            self._forward.setdefault(src, set()).add(dst)
+            self._backward.setdefault(dst, set()).add(src)
+
+    def __repr__(self):
+        return '<ExternalModel {}>'.format(self.flows)
+
+    def forward(self, locations):
+        """
+            Locations tainted after the call, given the tainted locations before it
+        """
+        res = set()
+        for loc in locations:
+            res |= self._forward.get(loc, set())
+        return res
+
+    def backward(self, locations):
+        """
+            Locations the given (tainted) locations depend on
+        """
+        res = set()
+        for loc in locations:
+            res |= self._backward.get(loc, set())
+        return res
+
+
+def invoke_locations(stmt):
+    """
+        Map the locations (BASE, RET, arg index) of an invoke statement to variable names
+    """
+    if hasattr(stmt, 'invoke_expr'):
+        invoke_expr = stmt.invoke_expr
+        left_op = None
+    else:
+        invoke_expr = stmt.right_op
+        left_op = stmt.left_op
+
+    locations = {}
+
+    if hasattr(invoke_expr, 'base') and hasattr(invoke_expr.base, 'name'):
+        locations[BASE] = invoke_expr.base.name
+
+    for index, arg in enumerate(invoke_expr.args):
+        if hasattr(arg, 'name'):
+            locations[index] = arg.name
+
+    if left_op is not None and hasattr(left_op, 'name'):
+        locations[RET] = left_op.name
+
+    return locations
+
+
+def _parse_location(loc):
+    loc = loc.strip()
+    if loc in (BASE, RET):
+        return loc
+    return int(loc)
+
+
+def _parse_signature(sig):
+    name, params = sig[:-1].split('(', 1)
+    if params == '*':
+        return name, None
+    return name, tuple(p for p in params.split(',') if p)
+
+
+class ExternalModels:
+    """
+        Registry of external method models, indexed by method key
+    """
+
+    def __init__(self, path=None):
+        self._models = {}
+        self.load(path or DEFAULT_MODELS)
+
+    def load(self, path):
+        """
+            Load models from a JSON file (see data/external_models.json for the format).
+            Models already registered for the same method are overwritten.
+        """
+        with open(path) as fp:
+            data = json.load(fp)
+
+        aliases = {}
+        for cls_name, methods in data.items():
+            if cls_name.startswith('_'):
+                continue
+
+            if isinstance(methods, str):
+                aliases[cls_name] = methods
+                continue
+
+            for sig, flows in methods.items():
+                self._add(cls_name, sig, flows)
+
+        for cls_name, aliased in aliases.items():
+            if aliased not in data or isinstance(data[aliased], str):
+                raise ModelsError('Bad alias {} -> {}'.format(cls_name, aliased))
+            for sig, flows in data[aliased].items():
+                self._add(cls_name, sig, flows)
+
+    def _add(self, cls_name, sig, flows):
+        name, params = _parse_signature(sig)
+        parsed = []
+        for flow in flows:
+            src, dst = flow.split('->')
+            parsed.append((_parse_location(src), _parse_location(dst)))
+        self.register(cls_name, name, params, parsed)
+
+    def register(self, cls_name, method_name, method_params, flows):
+        """
+            Register a model. method_params=None matches any parameters
+        """
+        key = (cls_name, method_name, tuple(method_params) if method_params is not None else None)
+        self._models[key] = ExternalModel(flows)
+
+    def get(self, cls_name, method_name, method_params):
+        """
+            The model of a method, None if the method is not modeled
+        """
+        model = self._models.get((cls_name, method_name, tuple(method_params)))
+        if model is None:
+            model = self._models.get((cls_name, method_name, None))
+        return model
+
+    def get_invoke_model(self, invoke_expr):
+        return self.get(invoke_expr.class_name, invoke_expr.method_name, invoke_expr.method_params)
+
+    def __contains__(self, key):
+        return self.get(*key) is not None
+
+    def __len__(self):
+        return len(self._models)
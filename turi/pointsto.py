@@ -0,0 +1,499 @@
+"""
+    Andersen-style (inclusion based) points-to analysis
+
+    - objects are abstracted by allocation site, fields are distinguished per object
+    - points-to sets are integer bitsets over the object IDs and only the
+      difference (the bits a node has not propagated yet) flows along the edges
+    - cycles of copy edges are detected lazily and collapsed (union-find)
+    - virtual calls are resolved on the fly from the types of the receiver objects
+
+    Values the analysis cannot see (results of external calls, parameters of the
+    methods without callers in the project, caught exceptions, ...) point to the
+    UNKNOWN object, and the calls on them fall back to class hierarchy dispatch.
+"""
+
+import logging
+
+from collections import namedtuple
+
+from .statements import is_invoke, is_assign, is_identity, is_ret, is_local_var, is_param_ref, is_this_ref, \
+    is_cast_expr, is_phi_expr, is_instance_field_ref, is_static_field_ref, is_array_ref, is_new_expr, is_null_constant, \
+    get_invoke_expr
+from .hierarchy import HierarchyError, INTERFACE
+from .models import BASE
+from .utils import iter_bits, get_param_locals
+
+log = logging.getLogger('turi.PointsTo')
+
+
+# type is the allocated class name (None for the unknown object), site is (block, stmt index)
+AllocSite = namedtuple('AllocSite', ['id', 'type', 'method', 'site'])
+
+UNKNOWN = 0
+UNKNOWN_SITE = AllocSite(UNKNOWN, None, None, None)
+
+PRIMITIVE_TYPES = frozenset(['boolean', 'byte', 'char', 'short', 'int', 'long', 'float', 'double', 'void'])
+
+ARRAY_FIELD = '[]'
+RET_NODE = '@ret'
+
+
+def _is_reference(value):
+    return getattr(value, 'type', None) not in PRIMITIVE_TYPES
+
+
+class _CallSite:
+    __slots__ = ('container', 'invoke_expr', 'method', 'base', 'args', 'left', 'targets', 'unknown')
+
+    def __init__(self, container, invoke_expr, method, base, args, left):
+        self.container = container
+        self.invoke_expr = invoke_expr
+        # declared method
+        self.method = method
+        # nodes of the base, of the arguments (None for non-reference values) and of the result
+        self.base = base
+        self.args = args
+        self.left = left
+        self.targets = set()
+        # True if the receiver may be the unknown object
+        self.unknown = False
+
+
+class PointsTo:
+    """
+        Whole-program points-to analysis of the project
+    """
+
+    def __init__(self, project):
+        self.project = project
+        self.hierarchy = project.hierarchy()
+
+        self.objects = [UNKNOWN_SITE]
+        self._node_ids = {}
+        # per node: union-find parent, points-to bitset, bits not propagated yet, copy successors
+        self._parent = []
+        self._pts = []
+        self._delta = []
+        self._succs = []
+        # per node: (field, dst node) loads, (field, src node) stores, call sites with the node as base
+        self._loads = []
+        self._stores = []
+        self._calls = []
+
+        self._call_sites = {}
+        self._params = {}
+        self._worklist = []
+        self._checked = set()
+        self.collapsed = 0
+
+        self._solve()
+
+    # nodes
+
+    def _node(self, key):
+        node = self._node_ids.get(key)
+        if node is None:
+            node = len(self._parent)
+            self._node_ids[key] = node
+            self._parent.append(node)
+            self._pts.append(0)
+            self._delta.append(0)
+            self._succs.append(set())
+            self._loads.append([])
+            self._stores.append([])
+            self._calls.append([])
+            if key[0] == 'field' and key[1] == UNKNOWN:
+                # the fields of the unknown object are unknown
+                self._add_objects(node, 1 << UNKNOWN)
+        return node
+
+    def _local(self, method, value):
+        if is_local_var(value) and _is_reference(value):
+            return self._node((method, value.name))
+        return None
+
+    def _field_node(self, obj, field):
+        return self._node(('field', obj, field))
+
+    def _find(self, node):
+        root = node
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while self._parent[node] != root:
+            self._parent[node], node = root, self._parent[node]
+        return root
+
+    # constraints
+
+    def _add_objects(self, node, mask):
+        node = self._find(node)
+        new = mask & ~self._pts[node]
+        if new:
+            self._pts[node] |= new
+            self._delta[node] |= new
+            self._worklist.append(node)
+
+    def _add_edge(self, src, dst):
+        src = self._find(src)
+        dst = self._find(dst)
+        if src == dst or dst in self._succs[src]:
+            return
+        self._succs[src].add(dst)
+        if self._pts[src]:
+            self._add_objects(dst, self._pts[src])
+
+    def _new_object(self, type_name, method, site):
+        self.objects.append(AllocSite(len(self.objects), type_name, method, site))
+        return len(self.objects) - 1
+
+    def _collect(self):
+        """
+            Generate the constraints of every statement of the project
+        """
+        called = set()
+        for cls in self.project.classes.values():
+            for method in cls.methods:
+                for block in method.blocks:
+                    for i, stmt in enumerate(block.statements):
+                        if is_invoke(stmt):
+                            called |= self._collect_invoke(method, stmt)
+                        elif is_identity(stmt):
+                            self._collect_identity(method, stmt)
+                        elif is_assign(stmt):
+                            self._collect_assign(method, block, i, stmt)
+                        elif is_ret(stmt) and getattr(stmt, 'value', None) is not None:
+                            src = self._local(method, stmt.value)
+                            if src is not None:
+                                self._add_edge(src, self._node((method, RET_NODE)))
+
+        # entry points: their parameters come from outside the project
+        for cls in self.project.classes.values():
+            for method in cls.methods:
+                if method not in called:
+                    for node in self._method_params(method).values():
+                        self._add_objects(node, 1 << UNKNOWN)
+
+    def _collect_identity(self, method, stmt):
+        left = self._local(method, stmt.left_op)
+        if left is None:
+            return
+        if not is_param_ref(stmt.right_op) and not is_this_ref(stmt.right_op):
+            # caught exceptions
+            self._add_objects(left, 1 << UNKNOWN)
+
+    def _method_params(self, method):
+        """
+            Parameter index (or BASE for this) -> node, from the identity statements
+        """
+        if method not in self._params:
+            params = {}
+            for loc, local in get_param_locals(method).items():
+                node = self._local(method, local)
+                if node is not None:
+                    params[loc] = node
+            self._params[method] = params
+        return self._params[method]
+
+    def _collect_assign(self, method, block, index, stmt):
+        left_op = stmt.left_op
+        right_op = stmt.right_op
+
+        if is_local_var(left_op):
+            left = self._local(method, left_op)
+            if left is None:
+                return
+
+            if is_local_var(right_op):
+                self._add_edge(self._local(method, right_op), left)
+            elif is_cast_expr(right_op):
+                src = self._local(method, right_op.value)
+                if src is not None:
+                    self._add_edge(src, left)
+            elif is_phi_expr(right_op):
+                for value in right_op.values:
+                    value = value[0] if isinstance(value, tuple) else value
+                    src = self._local(method, value)
+                    if src is not None:
+                        self._add_edge(src, left)
+            elif is_new_expr(right_op):
+                type_name = getattr(right_op, 'base_type', None) or getattr(right_op, 'type', None)
+                self._add_objects(left, 1 << self._new_object(type_name, method, (block, index)))
+            elif is_instance_field_ref(right_op):
+                base = self._local(method, right_op.base)
+                if base is not None:
+                    self._loads[base].append((right_op.field[0], left))
+            elif is_array_ref(right_op):
+                base = self._local(method, right_op.base)
+                if base is not None:
+                    self._loads[base].append((ARRAY_FIELD, left))
+            elif is_static_field_ref(right_op):
+                self._add_edge(self._node(('static',) + tuple(right_op.field)), left)
+            elif not is_null_constant(right_op):
+                # string and class constants, values the analysis does not model
+                self._add_objects(left, 1 << UNKNOWN)
+
+        else:
+            src = self._local(method, right_op)
+            if src is None:
+                return
+            if is_instance_field_ref(left_op):
+                base = self._local(method, left_op.base)
+                if base is not None:
+                    self._stores[base].append((left_op.field[0], src))
+            elif is_array_ref(left_op):
+                base = self._local(method, left_op.base)
+                if base is not None:
+                    self._stores[base].append((ARRAY_FIELD, src))
+            elif is_static_field_ref(left_op):
+                self._add_edge(src, self._node(('static',) + tuple(left_op.field)))
+
+    def _collect_invoke(self, container, stmt):
+        """
+            Returns the methods the call may target without looking at the receiver
+        """
+        invoke_expr = get_invoke_expr(stmt)
+        left = self._local(container, stmt.left_op) if is_assign(stmt) else None
+        key = (invoke_expr.class_name, invoke_expr.method_name, invoke_expr.method_params)
+
+        if invoke_expr.class_name not in self.project.classes or key not in self.project.methods:
+            # external method
+            if left is not None:
+                self._add_objects(left, 1 << UNKNOWN)
+            return set()
+
+        method = self.project.methods[key]
+        base = self._local(container, getattr(invoke_expr, 'base', None))
+        args = [self._local(container, arg) for arg in invoke_expr.args]
+        call_site = _CallSite(container, invoke_expr, method, base, args, left)
+        self._call_sites[(container, invoke_expr)] = call_site
+
+        try:
+            targets = set(self.hierarchy.resolve_invoke(invoke_expr, method, container))
+        except HierarchyError:
+            targets = set()
+
+        invoke_type = str(type(invoke_expr))
+        if base is not None and ('VirtualInvokeExpr' in invoke_type or 'InterfaceInvokeExpr' in invoke_type):
+            self._calls[base].append(call_site)
+        else:
+            for target in targets:
+                self._bind(call_site, target)
+                this = self._method_params(target).get(BASE)
+                if base is not None and this is not None:
+                    self._add_edge(base, this)
+
+        # the targets allowed by the hierarchy, to find the entry points
+        return targets
+
+    def _bind(self, call_site, target):
+        if target in call_site.targets:
+            return
+        call_site.targets.add(target)
+
+        params = self._method_params(target)
+        for i, arg in enumerate(call_site.args):
+            if arg is not None and i in params:
+                self._add_edge(arg, params[i])
+        if call_site.left is not None:
+            self._add_edge(self._node((target, RET_NODE)), call_site.left)
+
+    def _dispatch(self, call_site, obj):
+        if obj == UNKNOWN:
+            call_site.unknown = True
+            try:
+                targets = self.hierarchy.resolve_abstract_dispatch(
+                    self.project.classes[call_site.method.class_name], call_site.method)
+            except HierarchyError:
+                targets = []
+        else:
+            cls = self.project.classes.get(self.objects[obj].type)
+            if cls is None or not self._is_subtype(cls, call_site.method.class_name):
+                return
+            try:
+                targets = [self.hierarchy.resolve_concrete_dispatch(cls, call_site.method)]
+            except HierarchyError:
+                return
+
+        for target in targets:
+            if target.class_name not in self.project.classes:
+                continue
+            self._bind(call_site, target)
+            this = self._method_params(target).get(BASE)
+            if this is not None:
+                self._add_objects(this, 1 << obj)
+
+    def _is_subtype(self, cls, class_name):
+        declared = self.project.classes[class_name]
+        if self.hierarchy.flags(declared) & INTERFACE:
+            return cls in self.hierarchy.get_implementers(declared)
+        return self.hierarchy.is_subclass_including(cls, declared)
+
+    # solver
+
+    def _solve(self):
+        instr = self.project.instrumentation
+        with instr.phase('pointsto.solve'):
+            self._collect()
+
+            while self._worklist:
+                node = self._find(self._worklist.pop())
+                delta = self._delta[node]
+                if not delta:
+                    continue
+                self._delta[node] = 0
+                if instr.enabled:
+                    instr.count('pointsto.propagations')
+
+                for obj in iter_bits(delta):
+                    for field, dst in self._loads[node]:
+                        self._add_edge(self._field_node(obj, field), dst)
+                    for field, src in self._stores[node]:
+                        self._add_edge(src, self._field_node(obj, field))
+                    for call_site in self._calls[node]:
+                        self._dispatch(call_site, obj)
+
+                self._propagate(node, delta)
+
+        log.info('Points-to: {} nodes, {} objects, {} nodes collapsed'.format(
+            len(self._parent), len(self.objects), self.collapsed))
+
+    def _propagate(self, node, delta):
+        for succ in list(self._succs[node]):
+            succ = self._find(succ)
+            if succ == node:
+                continue
+            self._add_objects(succ, delta)
+            # same sets on both ends of an edge hint at a cycle
+            if self._pts[succ] == self._pts[node] and (node, succ) not in self._checked:
+                self._checked.add((node, succ))
+                self._collapse_cycles(succ)
+                if self._find(node) != node:
+                    return
+
+    def _collapse_cycles(self, start):
+        """
+            Collapse the strongly connected components of copy edges reachable from start (Tarjan)
+        """
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        counter = 0
+
+        work = [(start, None)]
+        while work:
+            node, succs = work.pop()
+            if succs is None:
+                index[node] = low[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack.add(node)
+                succs = iter(set(self._find(s) for s in self._succs[node]) - {node})
+
+            for succ in succs:
+                if succ not in index:
+                    work.append((node, succs))
+                    work.append((succ, None))
+                    break
+                elif succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1:
+                        self._merge(component)
+
+    def _merge(self, nodes):
+        root = nodes[0]
+        for node in nodes[1:]:
+            self._parent[node] = root
+            self._pts[root] |= self._pts[node]
+            self._succs[root] |= self._succs[node]
+            self._loads[root].extend(self._loads[node])
+            self._stores[root].extend(self._stores[node])
+            self._calls[root].extend(self._calls[node])
+            self._pts[node] = self._delta[node] = 0
+            self._succs[node] = set()
+            self._loads[node] = []
+            self._stores[node] = []
+            self._calls[node] = []
+            self.collapsed += 1
+
+        self._succs[root] = set(self._find(s) for s in self._succs[root]) - {root}
+        # the merged node propagates everything again to the union of the successors
+        self._delta[root] = self._pts[root]
+        self._worklist.append(root)
+        self.project.instrumentation.count('pointsto.collapsed', len(nodes) - 1)
+
+    # queries
+
+    def _mask(self, method, name):
+        node = self._node_ids.get((method, name))
+        return self._pts[self._find(node)] if node is not None else 0
+
+    def points_to(self, method, name):
+        """
+            Allocation sites the local name of method may point to
+        """
+        return set(self.objects[obj] for obj in iter_bits(self._mask(method, name)))
+
+    def static_points_to(self, field):
+        node = self._node_ids.get(('static',) + tuple(field))
+        mask = self._pts[self._find(node)] if node is not None else 0
+        return set(self.objects[obj] for obj in iter_bits(mask))
+
+    def may_alias(self, method1, name1, method2, name2):
+        """
+            True if the two locals may point to the same object (or to unknown objects)
+        """
+        mask1 = self._mask(method1, name1)
+        mask2 = self._mask(method2, name2)
+        return bool(mask1 & mask2) or bool((mask1 | mask2) & (1 << UNKNOWN) and mask1 and mask2)
+
+    def field_may_alias(self, method1, base1, method2, base2, field):
+        """
+            True if base1.field and base2.field may be the same memory location:
+            the bases share an object (any of their objects, if one may be unknown)
+            whose field is accessed in the project.
+            field is a field name, or a (name, class name) field of the IR.
+        """
+        if isinstance(field, tuple):
+            field = field[0]
+
+        mask1 = self._mask(method1, base1)
+        mask2 = self._mask(method2, base2)
+        if not mask1 or not mask2:
+            return False
+
+        shared = mask1 | mask2 if (mask1 | mask2) & (1 << UNKNOWN) else mask1 & mask2
+        return any(('field', obj, field) in self._node_ids for obj in iter_bits(shared))
+
+    def call_targets(self, container, invoke_expr):
+        """
+            Project methods the call may target, None if the receiver may be unknown
+            (or the call is not in the project)
+        """
+        call_site = self._call_sites.get((container, invoke_expr))
+        if call_site is None or call_site.unknown:
+            return None
+        return list(call_site.targets)
+
+    def filter_targets(self, container, invoke_expr, targets):
+        """
+            Restrict the targets found by the hierarchy to the ones allowed by the receiver objects
+        """
+        call_site = self._call_sites.get((container, invoke_expr))
+        if call_site is None or call_site.unknown or call_site.base is None \
+                or not self._pts[self._find(call_site.base)]:
+            # unknown receiver, or no object reaches it: keep the hierarchy targets, to be safe
+            return targets
+        return [t for t in targets if t in call_site.targets]
@@ -1,20 +1,23 @@
 import os
 import pickle
 import logging
-from pysoot.lifter import Lifter
 
-from .cfg import CFGFull, get_method_CFGs
 from .hierarchy import Hierarchy
 from .backward_slicer import BackwardSlicer
 from .forward_slicer import ForwardSlicer
-from .callgraph import CallGraph
 from .utils import get_method_key
 from .common import x_ref
+from .models import ExternalModels
+from .stub import StubRegistry
+from .index import StatementIndex
+from .ir_store import IRStore, StoredClasses, LazyMethodIndex, write_ir_store, is_body_loaded
+from .instrumentation import NULL_INSTRUMENTATION
+from .chop import Chopper
+from .taint import TaintAnalysis
+from .ifds import IFDSTaintAnalysis
 
 
-logging.basicConfig()
-log = logging.getLogger("turi-project")
-log.setLevel(logging.DEBUG)
+log = logging.getLogger("turi.project")
 
 
 class Project:
@@ -22,12 +25,16 @@ class Project:
         Project
         Contains global data
     """
-    def __init__(self, app_path, input_format=None, android_sdk=None, lifter=None, pickled=None):
+    def __init__(self, app_path, input_format=None, android_sdk=None, lifter=None, pickled=None,
+                 models_path=None, ir_store=None, instrumentation=None):
         self.app_path = app_path
         self.input_format = input_format
         self.android_sdk = android_sdk
         self.pickle = pickle
         self.pickled = pickled
+        self.models_path = models_path
+        self.ir_store = ir_store
+        self.instrumentation = instrumentation if instrumentation is not None else NULL_INSTRUMENTATION
 
         # initialize empty data structure
         self._lifter = lifter
@@ -38,8 +45,14 @@ class Project:
         self._hierarchy = None
         self._cfg_full = None
         self._cfg_full_ret_edges = None
+        self._supergraph = None
         self._cfg_methods = None
+        self._cfg_method = {}
         self._callgraph = None
+        self._models = None
+        self._stubs = None
+        self._index = None
+        self._pointsto = None
 
         self.setup()
 
@@ -68,6 +81,15 @@ class Project:
         return self._stmts_to_classes
 
     def setup(self):
+        if self.ir_store is not None and os.path.exists(os.path.abspath(self.ir_store)):
+            # classes and method bodies (blocks and statements) are decoded and indexed on demand
+            log.info('Loading classes from the IR store')
+            with self.instrumentation.phase('project.load_store'):
+                store = IRStore(os.path.abspath(self.ir_store))
+                self._classes = StoredClasses(store, on_load=self._index_methods, on_body=self._index_body)
+                self._methods = LazyMethodIndex(self._classes)
+            return
+
         should_pickle = False
         should_unpickle = False
         if self.pickled is not None:
@@ -77,41 +99,153 @@ class Project:
             else:
                 should_pickle = True
 
+        instr = self.instrumentation
+
         if should_unpickle:
-            with open(pickled_path, 'rb') as fp:
+            with instr.phase('project.unpickle'), open(pickled_path, 'rb') as fp:
                 self._classes = pickle.load(fp)
         else:
             if not self._lifter:
                 log.info('Lifting app')
-                if self.android_sdk is not None and self.input_format is not None:
-                    self._lifter = Lifter(self.app_path,
-                                          input_format=self.input_format,
-                                          android_sdk=self.android_sdk)
-                else:
-                    self._lifter = Lifter(self.app_path)
+                # pysoot (and the JVM bridge) are only loaded when lifting is needed
+                from pysoot.lifter import Lifter
+                with instr.phase('project.lift'):
+                    if self.android_sdk is not None and self.input_format is not None:
+                        self._lifter = Lifter(self.app_path,
+                                              input_format=self.input_format,
+                                              android_sdk=self.android_sdk)
+                    else:
+                        self._lifter = Lifter(self.app_path)
 
             self._classes = self._lifter.classes
-            
 
             if should_pickle:
-                with open(pickled_path, 'wb') as fp:
+                with instr.phase('project.pickle'), open(pickled_path, 'wb') as fp:
                     pickle.dump(self._classes, fp, protocol=2)
 
-        for _, cls in self._classes.items():
-            for method in cls.methods:
-                method_key = get_method_key(method)
-                self._methods[method_key] = method
+        if self.ir_store is not None:
+            with instr.phase('project.write_store'):
+                write_ir_store(self._classes, os.path.abspath(self.ir_store))
+
+        with instr.phase('project.index'):
+            for _, cls in self._classes.items():
+                self._index_class(cls)
+
+    def _index_class(self, cls):
+        self._index_methods(cls)
+        for method in cls.methods:
+            self._index_body(cls, method)
+
+    def _index_methods(self, cls):
+        for method in cls.methods:
+            method_key = get_method_key(method)
+            self._methods[method_key] = method
+
+    def _index_body(self, cls, method):
+        for block in method.blocks:
+            self._blocks_to_methods[block] = method
+
+            for stmt in block.statements:
+                self._stmts_to_blocks[stmt] = block
+                self._stmts_to_classes[stmt] = cls
+
+    def _unindex_class(self, cls):
+        for method in cls.methods:
+            method_key = get_method_key(method)
+            if self._methods.get(method_key) is method:
+                del self._methods[method_key]
+
+            # a body never decoded has not been indexed
+            if not is_body_loaded(method):
+                continue
+
+            for block in method.blocks:
+                self._blocks_to_methods.pop(block, None)
+
+                for stmt in block.statements:
+                    self._stmts_to_blocks.pop(stmt, None)
+                    self._stmts_to_classes.pop(stmt, None)
+
+            self._cfg_method.pop(method, None)
+
+    def add_classes(self, classes):
+        """
+            Add new classes to the project (existing classes with the same name are replaced)
+        """
+        self.update_classes(added=classes)
+
+    def replace_classes(self, classes):
+        """
+            Replace existing classes with new versions
+        """
+        for cls in classes:
+            if cls.name not in self._classes:
+                log.warning('Replacing class {} which is not in the project'.format(cls.name))
+
+        self.update_classes(added=classes)
+
+    def remove_classes(self, class_names):
+        """
+            Remove classes (by name) from the project
+        """
+        self.update_classes(removed=class_names)
+
+    def update_classes(self, added=None, removed=None):
+        """
+            Incrementally update the project, patching the hierarchy, the CFGs
+            and the call graph that have already been built instead of rebuilding them.
+
+            :param added: class objects to add, replacing classes with the same name
+            :param removed: names of the classes to remove
+        """
+        added = list(added or [])
+        removed_names = set(removed or []) | set(cls.name for cls in added)
+        old_classes = [self._classes[name] for name in removed_names if name in self._classes]
+
+        # classes whose dispatch can change: the updated ones, their ancestors and descendants
+        affected = set(removed_names)
+        if self._hierarchy is not None:
+            for cls in old_classes:
+                affected |= self._hierarchy.ancestor_names(cls)
+                affected |= self._hierarchy.descendant_names(cls)
+
+        for cls in old_classes:
+            self._unindex_class(cls)
+            del self._classes[cls.name]
+
+        for cls in added:
+            self._classes[cls.name] = cls
+            self._index_class(cls)
+
+        if self._hierarchy is not None:
+            for cls in added:
+                affected |= self._hierarchy.ancestor_names(cls)
+                affected |= self._hierarchy.descendant_names(cls)
+            self._hierarchy.update(old_classes, added, affected)
+
+        removed_methods = [m for cls in old_classes for m in cls.methods]
+        added_methods = [m for cls in added for m in cls.methods]
+
+        for graph in (self._cfg_full, self._cfg_full_ret_edges, self._supergraph, self._callgraph):
+            if graph is not None:
+                graph.update(removed_methods, added_methods, affected)
+
+        self._cfg_methods = None
+        self._index = None
 
-                for block in method.blocks:
-                    self._blocks_to_methods[block] = method
+        if self._pointsto is not None:
+            # stale: go back to hierarchy dispatch
+            self._pointsto = None
+            if self._hierarchy is not None:
+                self._hierarchy.pointsto = None
 
-                    for stmt in block.statements:
-                        self._stmts_to_blocks[stmt] = block
-                        self._stmts_to_classes[stmt] = cls
+        if self._stubs is not None:
+            self._stubs.invalidate()
 
     def cfgfull(self, instantiate=False):
         if self._cfg_full is None or instantiate:
             log.info('Instantiating CFGFull')
+            from .cfg import CFGFull
             self._cfg_full = CFGFull(self)
 
         return self._cfg_full
@@ -119,17 +253,37 @@ class Project:
     def cfgfull_retedges(self, instantiate=False):
         if self._cfg_full_ret_edges is None or instantiate:
             log.info('Instantiating CFGFull (with return edges)')
+            from .cfg import CFGFull
             self._cfg_full_ret_edges = CFGFull(self, ret_edges=True)
 
         return self._cfg_full_ret_edges
 
+    def supergraph(self, instantiate=False):
+        if self._supergraph is None or instantiate:
+            log.info('Instantiating SuperGraph')
+            from .cfg import SuperGraph
+            self._supergraph = SuperGraph(self)
+
+        return self._supergraph
+
     def cfgmethods(self, instantiate=False):
         if self._cfg_methods is None or instantiate:
             log.info('Instantiating CFG Methods')
+            from .cfg import get_method_CFGs
             self._cfg_methods = get_method_CFGs(self.classes)
 
         return self._cfg_methods
 
+    def cfgmethod(self, method, instantiate=False):
+        """
+            Cached CFG of a single method
+        """
+        if method not in self._cfg_method or instantiate:
+            from .cfg import CFGMethod
+            self._cfg_method[method] = CFGMethod(method)
+
+        return self._cfg_method[method]
+
     def hierarchy(self, instantiate=False):
         if self._hierarchy is None or instantiate:
             log.info('Instantiating Hierarchy')
@@ -137,18 +291,79 @@ class Project:
 
         return self._hierarchy
 
-    def backwardslicer(self):
-        return BackwardSlicer(self)
+    def pointsto(self, instantiate=False, dispatch=True):
+        """
+            Points-to analysis of the project.
+            With dispatch, virtual calls are resolved with the points-to sets from now on
+            (the call graph and the full CFG are built again when requested).
+        """
+        if self._pointsto is None or instantiate:
+            log.info('Running points-to analysis')
+            from .pointsto import PointsTo
+            self.hierarchy().pointsto = None
+            self._pointsto = PointsTo(self)
+
+        if dispatch and self.hierarchy().pointsto is not self._pointsto:
+            self.hierarchy().pointsto = self._pointsto
+            self._callgraph = None
+            self._cfg_full = None
+            self._cfg_full_ret_edges = None
+            self._supergraph = None
+
+        return self._pointsto
+
+    def backwardslicer(self, context_k=None):
+        return BackwardSlicer(self, context_k=context_k)
 
-    def forwardslicer(self):
-        return ForwardSlicer(self)
+    def forwardslicer(self, context_k=None):
+        return ForwardSlicer(self, context_k=context_k)
+
+    def chopper(self):
+        return Chopper(self)
+
+    def taint(self, sources, sinks, max_iter=None):
+        return TaintAnalysis(self, sources, sinks, max_iter=max_iter)
+
+    def ifds_taint(self, sources, sinks, max_iter=None):
+        return IFDSTaintAnalysis(self, sources, sinks, max_iter=max_iter)
 
     def callgraph(self, instantiate=False):
         if self._callgraph is None or instantiate:
             log.info('Instantiating CallGraph')
+            from .callgraph import CallGraph
             self._callgraph = CallGraph(self)
 
         return self._callgraph
 
+    def models(self, instantiate=False):
+        if self._models is None or instantiate:
+            log.info('Loading external method models')
+            self._models = ExternalModels(self.models_path)
+
+        return self._models
+
+    def index(self, instantiate=False):
+        if self._index is None or instantiate:
+            log.info('Indexing statements')
+            self._index = StatementIndex(self)
+
+        return self._index
+
+    def stubs(self, instantiate=False):
+        if self._stubs is None or instantiate:
+            self._stubs = StubRegistry(self)
+
+        return self._stubs
+
+    def external_model(self, invoke_expr):
+        """
+            The model of the method called by invoke_expr, if it is external to the project
+        """
+        key = (invoke_expr.class_name, invoke_expr.method_name, invoke_expr.method_params)
+        if key in self._methods:
+            return None
+
+        return self.models().get(*key)
+
     def x_ref(self, thing, thing_type):
         return x_ref(thing, thing_type, self)
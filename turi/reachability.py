@@ -0,0 +1,216 @@
+"""
+    Reachability index over the call graph
+
+    Queries are answered on the condensation of the call graph (its strongly
+    connected components), numbered in reverse topological order: a component
+    can only reach components with a smaller number.
+    - small graphs: the transitive closure of every component, as an integer bitset
+    - large graphs: GRAIL labels (random post-order intervals), which answer most
+      negative queries in constant time, with a pruned DFS for the others
+"""
+
+import random
+import logging
+
+from .utils import iter_bits
+
+log = logging.getLogger('turi.Reachability')
+
+
+class ReachabilityIndex:
+    """
+        "Can method A (transitively) call method B" queries.
+        Every method reaches itself.
+    """
+    # max number of components for the exact closure
+    EXACT_LIMIT = 10000
+
+    def __init__(self, callgraph, exact=None, labelings=3, seed=0):
+        """
+            :param exact: force (or forbid) the transitive closure, by default it is
+                          used if the condensation has at most EXACT_LIMIT components
+            :param labelings: number of GRAIL labelings
+            :param seed: seed of the random traversals of GRAIL
+        """
+        self.callgraph = callgraph
+        self._sccs = callgraph.sccs()
+        self._index = dict((m, i) for i, scc in enumerate(self._sccs) for m in scc)
+        self.exact = exact if exact is not None else len(self._sccs) <= self.EXACT_LIMIT
+
+        with callgraph.project.instrumentation.phase('reachability.build'):
+            self._succs = [set() for _ in self._sccs]
+            self._preds = [set() for _ in self._sccs]
+            for src, dst in callgraph.graph.edges:
+                i, j = self._index[src], self._index[dst]
+                if i != j:
+                    self._succs[i].add(j)
+                    self._preds[j].add(i)
+
+            self._closure = None
+            self._reverse_closure = None
+            self._labels = None
+            self._reaching = {}
+
+            if self.exact:
+                self._build_closure()
+            else:
+                self._build_labels(labelings, random.Random(seed))
+
+    def _build_closure(self):
+        # successors have smaller numbers, so they are done first
+        self._closure = []
+        for i, succs in enumerate(self._succs):
+            bits = 1 << i
+            for j in succs:
+                bits |= self._closure[j]
+            self._closure.append(bits)
+
+    def _build_reverse_closure(self):
+        n = len(self._sccs)
+        self._reverse_closure = [0] * n
+        for i in range(n - 1, -1, -1):
+            bits = 1 << i
+            for j in self._preds[i]:
+                bits |= self._reverse_closure[j]
+            self._reverse_closure[i] = bits
+
+    def _build_labels(self, labelings, rng):
+        """
+            Each labeling is a random post-order traversal: the interval (low, rank)
+            of a component contains the intervals of all the components it reaches
+        """
+        self._labels = []
+        roots = [i for i, preds in enumerate(self._preds) if not preds]
+
+        for _ in range(labelings):
+            low = [0] * len(self._sccs)
+            rank = [0] * len(self._sccs)
+            visited = [False] * len(self._sccs)
+            counter = 0
+
+            rng.shuffle(roots)
+            for root in roots:
+                visited[root] = True
+                stack = [(root, self._shuffled(root, rng))]
+                while stack:
+                    node, succs = stack[-1]
+                    for succ in succs:
+                        if not visited[succ]:
+                            visited[succ] = True
+                            stack.append((succ, self._shuffled(succ, rng)))
+                            break
+                    else:
+                        stack.pop()
+                        rank[node] = counter
+                        counter += 1
+                        low[node] = min([rank[node]] + [low[s] for s in self._succs[node]])
+
+            self._labels.append((low, rank))
+
+    def _shuffled(self, node, rng):
+        succs = list(self._succs[node])
+        rng.shuffle(succs)
+        return iter(succs)
+
+    def _may_reach(self, i, j):
+        # necessary condition: the interval of j is contained in the one of i in every labeling
+        if j > i:
+            return False
+        for low, rank in self._labels:
+            if low[j] < low[i] or rank[j] > rank[i]:
+                return False
+        return True
+
+    def _reach(self, i, j):
+        if i == j:
+            return True
+        if self.exact:
+            return bool(self._closure[i] >> j & 1)
+        if not self._may_reach(i, j):
+            return False
+
+        seen = {i}
+        stack = [i]
+        while stack:
+            node = stack.pop()
+            for succ in self._succs[node]:
+                if succ == j:
+                    return True
+                if succ not in seen and self._may_reach(succ, j):
+                    seen.add(succ)
+                    stack.append(succ)
+        return False
+
+    def can_reach(self, src, dst):
+        """
+            True if src may (transitively) call dst
+        """
+        if src not in self._index or dst not in self._index:
+            return src == dst
+        return self._reach(self._index[src], self._index[dst])
+
+    def can_reach_any(self, src, targets):
+        """
+            True if src may (transitively) call one of the targets
+        """
+        if src not in self._index:
+            return src in targets
+
+        i = self._index[src]
+        ids = set(self._index[t] for t in targets if t in self._index)
+        if self.exact:
+            mask = 0
+            for j in ids:
+                mask |= 1 << j
+            return bool(self._closure[i] & mask)
+        return any(self._reach(i, j) for j in ids)
+
+    def _members(self, bits):
+        res = set()
+        for i in iter_bits(bits):
+            res |= self._sccs[i]
+        return res
+
+    def reachable(self, method):
+        """
+            Methods method may (transitively) call, method included
+        """
+        if method not in self._index:
+            return {method}
+
+        i = self._index[method]
+        if self.exact:
+            return self._members(self._closure[i])
+
+        seen = {i}
+        stack = [i]
+        while stack:
+            for succ in self._succs[stack.pop()]:
+                if succ not in seen:
+                    seen.add(succ)
+                    stack.append(succ)
+        return set(m for j in seen for m in self._sccs[j])
+
+    def reaching(self, method):
+        """
+            Methods that may (transitively) call method, method included
+        """
+        if method not in self._index:
+            return {method}
+
+        j = self._index[method]
+        if self.exact:
+            if self._reverse_closure is None:
+                self._build_reverse_closure()
+            return self._members(self._reverse_closure[j])
+
+        if j not in self._reaching:
+            seen = {j}
+            stack = [j]
+            while stack:
+                for pred in self._preds[stack.pop()]:
+                    if pred not in seen:
+                        seen.add(pred)
+                        stack.append(pred)
+            self._reaching[j] = frozenset(m for i in seen for m in self._sccs[i])
+        return set(self._reaching[j])
@@ -94,6 +94,7 @@ def is_instance_field_ref(stmt):
 
     return False
 
+
 def is_static_field_ref(stmt):
     if 'StaticFieldRef' in str(type(stmt)):
         return True
@@ -101,6 +102,13 @@ def is_static_field_ref(stmt):
     return False
 
 
+def is_this_ref(stmt):
+    if 'ThisRef' in str(type(stmt)):
+        return True
+
+    return False
+
+
 def is_phi_expr(stmt):
     if 'SootPhiExpr' in str(type(stmt)):
         return True
@@ -122,8 +130,60 @@ def is_len_expr(stmt):
     return False
 
 
+def is_new_expr(stmt):
+    # objects, arrays and multi-dimensional arrays
+    if 'NewExpr' in str(type(stmt)) or 'NewArrayExpr' in str(type(stmt)) or 'NewMultiArrayExpr' in str(type(stmt)):
+        return True
+
+    return False
+
+
+def is_null_constant(stmt):
+    if 'NullConstant' in str(type(stmt)):
+        return True
+
+    return False
+
+
 def is_identity(stmt):
     if 'IdentityStmt' in str(type(stmt)):
         return True
 
     return False
+
+
+def get_invoke_expr(stmt):
+    """
+        Invoke expression of an invoke statement, or of an assignment of a call result
+    """
+    if hasattr(stmt, 'invoke_expr'):
+        return stmt.invoke_expr
+
+    return stmt.right_op
+
+
+def get_used_locals(value):
+    """
+        Names of the locals an expression reads
+    """
+    if value is None:
+        return set()
+
+    if is_local_var(value):
+        return {value.name}
+
+    res = set()
+    for attr in ('value', 'value1', 'value2', 'base'):
+        if hasattr(value, attr):
+            res |= get_used_locals(getattr(value, attr))
+    return res
+
+
+def get_field_key(ref):
+    """
+        (field name, class name) of a field reference
+    """
+    if hasattr(ref, 'field'):
+        return tuple(ref.field)
+
+    return None
@@ -1,17 +1,119 @@
 import logging
 
-logging.basicConfig()
-log = logging.getLogger("Stub")
-log.setLevel(logging.DEBUG)
+from bisect import bisect_left
+
+log = logging.getLogger("turi.Stub")
+
+# declaring class of the app's package scanner
+PACKAGE_SCANNER = 'com.ainfosec.Util'
+
+
+class ClassNameIndex:
+    """
+        Sorted class names, for prefix (package) lookups in O(log n + k)
+    """
+
+    def __init__(self, names):
+        self._names = sorted(names)
+
+    def with_prefix(self, prefix):
+        res = []
+        i = bisect_left(self._names, prefix)
+        while i < len(self._names) and self._names[i].startswith(prefix):
+            res.append(self._names[i])
+            i += 1
+        return res
+
+    def in_package(self, package_name):
+        """
+            Names of the classes in a package (and its sub-packages)
+        """
+        return self.with_prefix(package_name.rstrip('.') + '.')
+
+
+class StubRegistry:
+    """
+        Stubs for methods that cannot (or should not) be analyzed,
+        keyed by (class name, method name, params).
+        None params match any params of the method.
+    """
+
+    def __init__(self, project, classes=None):
+        self.project = project
+        self._classes = classes
+        self._stubs = {}
+        self._index = None
+
+        self.register(PACKAGE_SCANNER, 'getClassesForPackage', None, getClassesForPackage)
+
+    @property
+    def classes(self):
+        if self._classes is not None:
+            return self._classes
+        return self.project.classes
+
+    def class_index(self):
+        if self._index is None:
+            self._index = ClassNameIndex(self.classes.keys())
+        return self._index
+
+    def invalidate(self):
+        """
+            Drop the class name index, e.g., after classes have been added to the project
+        """
+        self._index = None
+
+    def register(self, class_name, method_name, method_params, stub):
+        """
+            Register a stub: a function taking the registry and the invoke arguments
+        """
+        if class_name is None:
+            raise ValueError('Stubs are registered on their declaring class')
+        if method_params is not None:
+            method_params = tuple(method_params)
+        self._stubs[(class_name, method_name, method_params)] = stub
+
+    def get(self, class_name, method_name, method_params=None):
+        if method_params is not None:
+            stub = self._stubs.get((class_name, method_name, tuple(method_params)))
+            if stub is not None:
+                return stub
+
+        return self._stubs.get((class_name, method_name, None))
+
+    def __contains__(self, key):
+        return self.get(*key) is not None
+
+    def call(self, class_name, method_name, method_params, args):
+        """
+            Call the stub of a method, None if there is no stub for it
+        """
+        stub = self.get(class_name, method_name, method_params)
+        if stub is None:
+            log.debug('No stub for {}.{}'.format(class_name, method_name))
+            return None
+
+        return stub(self, args)
+
+    def declaring_classes(self, method_name):
+        """
+            Names of the classes with a stub for a method name
+        """
+        return sorted(set(c for c, m, _ in self._stubs if m == method_name))
+
 
 def call_stub(method_name, classes, args):
-    if method_name in 'getClassesForPackage':
-        arg = args[0].value
-        return getClassesForPackage(classes, arg)
-
-def getClassesForPackage(classes, package_name):
-    clss = set()
-    for key, value in classes.items():
-        if package_name[1:-1] in key:
-            clss.add(value)
-    return clss
+    """
+        Call the stub of a method by name over a dict of classes,
+        kept for compatibility: use StubRegistry.call
+    """
+    registry = StubRegistry(None, classes)
+    for class_name in registry.declaring_classes(method_name):
+        return registry.call(class_name, method_name, None, args)
+    return None
+
+
+def getClassesForPackage(registry, args):
+    # the argument is a string constant, quotes included
+    package_name = args[0].value[1:-1]
+    return set(registry.classes[name] for name in registry.class_index().in_package(package_name))
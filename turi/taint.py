@@ -0,0 +1,347 @@
+"""
+    Source-sink taint analysis
+"""
+
+import logging
+
+from collections import namedtuple, deque
+
+from .statements import is_invoke, is_assign, is_ret, is_local_var, is_instance_field_ref, \
+    is_static_field_ref, get_invoke_expr, get_used_locals, get_field_key
+from .models import RET, invoke_locations
+from .hierarchy import NoConcreteDispatch
+from .utils import match_signature, get_param_locals
+
+log = logging.getLogger('turi.TaintAnalysis')
+
+
+# source and sink are (block, statement index), path is the list of blocks from the source to the sink
+Flow = namedtuple('Flow', ['source', 'sink', 'path'])
+
+
+class SinkIndex:
+    """
+        Call sites of the sources and sinks (and the field loads), found in a single pass
+    """
+
+    def __init__(self, project, sources, sinks):
+        self.sources = set(tuple(s) for s in sources)
+        self.sinks = set(tuple(s) for s in sinks)
+        # (block, stmt index) of the source calls whose result is assigned
+        self.source_sites = []
+        # block -> [stmt index] of the sink calls
+        self.sink_sites = {}
+        # field -> set of blocks loading it
+        self.field_loads = {}
+
+        for cls in project.classes.values():
+            for method in cls.methods:
+                for block in method.blocks:
+                    self._index_block(block)
+
+    def _index_block(self, block):
+        for i, stmt in enumerate(block.statements):
+            if is_invoke(stmt):
+                invoke_expr = get_invoke_expr(stmt)
+                if match_signature(self.sinks, invoke_expr):
+                    self.sink_sites.setdefault(block, []).append(i)
+                if is_assign(stmt) and match_signature(self.sources, invoke_expr):
+                    self.source_sites.append((block, i))
+
+            elif is_assign(stmt) and (is_instance_field_ref(stmt.right_op) or is_static_field_ref(stmt.right_op)):
+                key = get_field_key(stmt.right_op)
+                if key is not None:
+                    self.field_loads.setdefault(key, set()).add(block)
+
+    def is_sink(self, block, index):
+        return index in self.sink_sites.get(block, ())
+
+
+class TaintAnalysis:
+    """
+        Forward taint analysis from the results of the calls to the sources
+        to the arguments of the calls to the sinks.
+
+        Locals are tracked flow sensitively, fields by name (loading a field
+        that has been assigned a tainted value taints the result).
+        Calls to project methods are followed (context insensitively),
+        external calls go through the external models.
+        Each source call site is tracked separately, so that every flow is
+        reported with its own path.
+    """
+    MAX_ITER = 100000
+
+    def __init__(self, project, sources, sinks, max_iter=None):
+        """
+            :param sources: signatures of the source methods, as (class name, method name)
+                            or (class name, method name, params)
+            :param sinks: signatures of the sink methods, same format
+        """
+        self.project = project
+        if max_iter:
+            self.MAX_ITER = max_iter
+        self.index = SinkIndex(project, sources, sinks)
+        self.flows = []
+        # True if the analysis stopped before the fixed point
+        self.truncated = False
+
+    def _reset(self):
+        self.flows = []
+        self.truncated = False
+        self._found = set()
+        # (source ID, block) -> tainted locals at the block entry
+        self._tainted = {}
+        # (source ID, block) -> block it was first reached from
+        self._parents = {}
+        # source ID -> tainted fields
+        self._fields = {}
+        # (source ID, block) -> stmt indexes whose result is tainted by a callee
+        self._ret_taints = {}
+        # (source ID, method) -> set of (block, stmt index) calling it
+        self._callers = {}
+        # (source ID, method) -> return block, if the method returns a tainted value
+        self._tainted_returns = {}
+        # (source ID, method) that can return to any of their callers: the method of
+        # the source call, and the callers it returned to (unbalanced returns)
+        self._unbalanced = set()
+        self._targets = {}
+        self._param_locals = {}
+        self._queue = deque()
+        self._queued = set()
+
+    def run(self, max_flows=None):
+        """
+            Run the analysis, stopping after max_flows flows if given.
+            Returns the list of flows.
+        """
+        self._reset()
+        instr = self.project.instrumentation
+
+        with instr.phase('taint.run'):
+            for sid, (block, index) in enumerate(self.index.source_sites):
+                self._unbalanced.add((sid, self.project.blocks_to_methods[block]))
+                self._enqueue(sid, block, None, set(), force=True)
+
+            iterations = 0
+            while self._queue:
+                if iterations >= self.MAX_ITER:
+                    self.truncated = True
+                    break
+                iterations += 1
+
+                sid, block = self._queue.popleft()
+                self._queued.discard((sid, block))
+                if instr.enabled:
+                    instr.count('taint.block_visits')
+
+                if self._visit(sid, block, max_flows):
+                    # enough flows
+                    self.truncated = bool(self._queue)
+                    break
+
+        return self.flows
+
+    def has_flow(self):
+        """
+            True if some source flows to some sink (stops at the first flow)
+        """
+        return bool(self.run(max_flows=1))
+
+    def _enqueue(self, sid, block, parent, tainted, force=False):
+        key = (sid, block)
+        if key not in self._parents:
+            self._parents[key] = parent
+
+        current = self._tainted.get(key)
+        if current is None:
+            self._tainted[key] = set(tainted)
+            changed = True
+        else:
+            changed = bool(tainted - current)
+            current |= tainted
+
+        if (changed or force) and key not in self._queued:
+            self._queued.add(key)
+            self._queue.append(key)
+
+    def _path(self, sid, block):
+        path = []
+        seen = set()
+        while block is not None and block not in seen:
+            seen.add(block)
+            path.append(block)
+            block = self._parents.get((sid, block))
+        path.reverse()
+        return path
+
+    def _visit(self, sid, block, max_flows):
+        """
+            Transfer the taint through the block, returns True when max_flows flows were found
+        """
+        method = self.project.blocks_to_methods[block]
+        tainted = set(self._tainted[(sid, block)])
+        fields = self._fields.setdefault(sid, set())
+        ret_taints = self._ret_taints.get((sid, block), ())
+        source_block, source_index = self.index.source_sites[sid]
+
+        for i, stmt in enumerate(block.statements):
+            if block is source_block and i == source_index:
+                tainted.add(stmt.left_op.name)
+                continue
+
+            if is_invoke(stmt):
+                if self.index.is_sink(block, i):
+                    used = set(name for loc, name in invoke_locations(stmt).items() if loc != RET)
+                    if used & tainted and (sid, block, i) not in self._found:
+                        self._found.add((sid, block, i))
+                        self.flows.append(Flow(self.index.source_sites[sid], (block, i), self._path(sid, block)))
+                        if max_flows is not None and len(self.flows) >= max_flows:
+                            return True
+
+                self._call(sid, method, block, i, stmt, tainted, i in ret_taints)
+
+            elif is_assign(stmt):
+                self._assign(sid, stmt, tainted, fields)
+
+            elif is_ret(stmt) and hasattr(stmt, 'value') and stmt.value is not None:
+                if get_used_locals(stmt.value) & tainted:
+                    self._tainted_return(sid, method, block)
+
+        for succ in self.project.cfgmethod(method).get_next_blocks(block):
+            self._enqueue(sid, succ, block, tainted)
+
+        return False
+
+    def _assign(self, sid, stmt, tainted, fields):
+        left_op = stmt.left_op
+        right_op = stmt.right_op
+
+        if is_instance_field_ref(right_op) or is_static_field_ref(right_op):
+            is_tainted = get_field_key(right_op) in fields
+        else:
+            is_tainted = bool(get_used_locals(right_op) & tainted)
+
+        if is_local_var(left_op):
+            if is_tainted:
+                tainted.add(left_op.name)
+            else:
+                tainted.discard(left_op.name)
+
+        elif is_tainted and (is_instance_field_ref(left_op) or is_static_field_ref(left_op)):
+            key = get_field_key(left_op)
+            if key is not None and key not in fields:
+                fields.add(key)
+                # the blocks loading the field have to be analyzed again
+                for load_block in self.index.field_loads.get(key, ()):
+                    if (sid, load_block) in self._tainted:
+                        self._enqueue(sid, load_block, None, set(), force=True)
+
+        elif is_local_var(getattr(left_op, 'base', None)) and is_tainted:
+            # array element: the whole array is tainted
+            tainted.add(left_op.base.name)
+
+    def _call(self, sid, method, block, index, stmt, tainted, ret_tainted):
+        invoke_expr = get_invoke_expr(stmt)
+        locations = invoke_locations(stmt)
+        tainted_locs = set(loc for loc, name in locations.items() if loc != RET and name in tainted)
+        targets = self._resolve(method, invoke_expr)
+
+        if targets is None:
+            # external method
+            model = self.project.external_model(invoke_expr)
+            if model is not None:
+                out = model.forward(tainted_locs)
+            else:
+                # no model: the result depends on the arguments and the base
+                out = {RET} if tainted_locs else set()
+
+            for loc in out:
+                if loc in locations:
+                    tainted.add(locations[loc])
+            if RET in locations and RET not in out:
+                tainted.discard(locations[RET])
+            return
+
+        for target in targets:
+            if not target.blocks:
+                continue
+
+            self._callers.setdefault((sid, target), set()).add((block, index))
+            if (sid, target) in self._tainted_returns:
+                self._taint_result(sid, block, index, self._tainted_returns[(sid, target)])
+
+            params = self._params(target)
+            callee_tainted = set(params[loc] for loc in tainted_locs if loc in params)
+            if callee_tainted:
+                self._enqueue(sid, target.blocks[0], block, callee_tainted)
+
+        if RET in locations:
+            if ret_tainted:
+                tainted.add(locations[RET])
+            else:
+                tainted.discard(locations[RET])
+
+    def _taint_result(self, sid, block, index, ret_block):
+        taints = self._ret_taints.setdefault((sid, block), set())
+        if index not in taints:
+            taints.add(index)
+            self._enqueue(sid, block, ret_block, set(), force=True)
+
+    def _tainted_return(self, sid, method, block):
+        if (sid, method) in self._tainted_returns:
+            return
+        self._tainted_returns[(sid, method)] = block
+        for caller_block, index in self._callers.get((sid, method), ()):
+            self._taint_result(sid, caller_block, index, block)
+
+        if (sid, method) in self._unbalanced:
+            self._return_to_callers(sid, method, block)
+
+    def _return_to_callers(self, sid, method, ret_block):
+        """
+            The taint did not enter method through a call: return it to every call site of method
+        """
+        callgraph = self.project.callgraph()
+        if method not in callgraph.graph:
+            return
+
+        for caller in list(callgraph.prev(method)):
+            for block in caller.blocks:
+                for index, stmt in enumerate(block.statements):
+                    if is_invoke(stmt) and method in (self._resolve(caller, get_invoke_expr(stmt)) or ()):
+                        self._callers.setdefault((sid, method), set()).add((block, index))
+                        self._taint_result(sid, block, index, ret_block)
+
+            if (sid, caller) not in self._unbalanced:
+                self._unbalanced.add((sid, caller))
+                if (sid, caller) in self._tainted_returns:
+                    # it already returned a tainted value, to the callers seen so far
+                    self._return_to_callers(sid, caller, self._tainted_returns[(sid, caller)])
+
+    def _resolve(self, container, invoke_expr):
+        """
+            Project methods called by invoke_expr, None if the method is external
+        """
+        if invoke_expr in self._targets:
+            return self._targets[invoke_expr]
+
+        key = (invoke_expr.class_name, invoke_expr.method_name, invoke_expr.method_params)
+        targets = None
+        if invoke_expr.class_name in self.project.classes and key in self.project.methods:
+            try:
+                targets = self.project.hierarchy().resolve_invoke(invoke_expr, self.project.methods[key], container)
+            except NoConcreteDispatch:
+                targets = []
+            targets = [t for t in targets if t.class_name in self.project.classes]
+
+        self._targets[invoke_expr] = targets
+        return targets
+
+    def _params(self, method):
+        """
+            Locations (BASE, param index) -> local names, from the identity statements
+        """
+        if method not in self._param_locals:
+            self._param_locals[method] = dict((loc, local.name) for loc, local in get_param_locals(method).items())
+
+        return self._param_locals[method]
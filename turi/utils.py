@@ -2,6 +2,13 @@
     Utils functions
 """
 
+from .statements import is_identity, is_local_var, is_param_ref, is_this_ref
+
+
+# locations of a call: the receiver, the return value (arguments are indexes)
+BASE = 'base'
+RET = 'ret'
+
 
 def get_method_key(method):
     return (method.class_name, method.name, method.params)
@@ -11,6 +18,32 @@ def same_method_signature(method1, method2):
     return method1.name == method2.name and method1.params == method2.params
 
 
+def match_signature(signatures, invoke_expr):
+    """
+        True if invoke_expr calls one of the signatures, which are
+        (class name, method name) or (class name, method name, params)
+    """
+    key = (invoke_expr.class_name, invoke_expr.method_name)
+    return key in signatures or key + (tuple(invoke_expr.method_params),) in signatures
+
+
+def get_param_locals(method):
+    """
+        Locations (BASE for this, param index) -> locals, from the identity statements
+    """
+    params = {}
+    if not method.blocks:
+        return params
+
+    for stmt in method.blocks[0].statements:
+        if is_identity(stmt) and is_local_var(stmt.left_op):
+            if is_param_ref(stmt.right_op):
+                params[stmt.right_op.index] = stmt.left_op
+            elif is_this_ref(stmt.right_op):
+                params[BASE] = stmt.left_op
+    return params
+
+
 def walk_all_statements(classes, methods=None):
     for class_name, cls in classes.items():
         for method in cls.methods:
@@ -29,3 +62,13 @@ def walk_all_blocks(classes, methods=None):
                 continue
             for block in method.blocks:
                 yield block
+
+
+def iter_bits(mask):
+    """
+        Indexes of the bits set in an integer bitset
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low